@@ -0,0 +1,290 @@
+"""
+End-to-end latency and throughput benchmark over loopback.
+
+For every player count, starts server/app.py and a bot swarm (client/swarm.py) on this host,
+lets them play for a fixed duration and records:
+    - question sent to verdict, round duration and game over to next welcome (measured by the bots)
+    - reconnect to playing of resumed sessions, with --drop-rate
+    - games per minute
+    - server CPU and RSS per connected player (read from /proc, Linux only)
+    - socket writes of the server and TCP segments per round (from the server's metrics and /proc/net/snmp,
+      single server only), compare with --no-coalescing
+
+The timing constants of the server are overridden (see constants.OVERRIDABLE_CONSTANTS) so the
+benchmark measures the engine and not the sleeps. Results are written as JSON to compare commits.
+
+Example:
+    python benchmarks/loopback.py --players 10 100 1000 --duration 30 --output bench.json
+"""
+import argparse
+import json
+import os
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVER_APP = os.path.join(REPO_DIR, 'server', 'app.py')
+SUPERVISOR_APP = os.path.join(REPO_DIR, 'server', 'supervisor.py')
+SWARM_APP = os.path.join(REPO_DIR, 'client', 'swarm.py')
+
+BENCHMARK_CONSTANTS = {
+    'ROUND_PAUSE_SEC': '0',
+    'SERVER_POST_GAME_OVER_DISCONNECT_TIMEOUT_SEC': '0',
+    'CLIENT_NO_JOIN_TIMEOUT_SEC': '0.2',
+    'SERVER_BROADCAST_PERIOD_SEC': '1',
+}
+SERVER_STARTED_PATTERN = re.compile(r'listening on IP address (\S+) port (\d+)')
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def process_tree(pid: int) -> list[int]:
+    """
+    Returns:
+        list[int]: The process and its children (the workers of a supervisor), recursively.
+    """
+    pids = [pid]
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children') as file:
+            children = [int(child) for child in file.read().split()]
+    except OSError:
+        children = []
+    for child in children:
+        pids.extend(process_tree(child))
+    return pids
+
+
+def process_cpu_seconds(pid: int) -> float:
+    """
+    Returns:
+        float: The user + system CPU time of the process and its children, in seconds.
+    """
+    total = 0
+    for tree_pid in process_tree(pid):
+        try:
+            with open(f'/proc/{tree_pid}/stat') as file:
+                fields = file.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        # utime and stime are the 14th and 15th fields of the whole line
+        total += (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+    return total
+
+
+def process_rss_bytes(pid: int) -> int:
+    """
+    Returns:
+        int: The resident set size of the process and its children, in bytes.
+    """
+    total = 0
+    for tree_pid in process_tree(pid):
+        try:
+            with open(f'/proc/{tree_pid}/statm') as file:
+                total += int(file.read().split()[1]) * PAGE_SIZE
+        except OSError:
+            continue
+    return total
+
+
+def tcp_segments_sent() -> int:
+    """
+    Returns:
+        int: The TCP segments sent by this host so far (loopback included), or None if unknown.
+    """
+    try:
+        with open('/proc/net/snmp') as file:
+            header, values = [line.split() for line in file if line.startswith('Tcp:')]
+    except (OSError, ValueError):
+        return None
+    return int(values[header.index('OutSegs')])
+
+
+def scrape_metrics(path: str) -> dict:
+    """
+    Reads the metrics endpoint of a server listening on a UNIX socket (SERVER_METRICS_UNIX_SOCKET).
+
+    Returns:
+        dict: The value of every metric without labels, empty if the server did not answer.
+    """
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(2)
+            sock.connect(path)
+            sock.sendall(b'GET /metrics HTTP/1.0\r\n\r\n')
+            response = b''
+            while data := sock.recv(65536):
+                response += data
+    except OSError:
+        return {}
+    values = {}
+    for line in response.decode(errors='replace').split('\n'):
+        fields = line.split()
+        if len(fields) == 2 and not line.startswith('#') and '{' not in fields[0]:
+            values[fields[0]] = float(fields[1])
+    return values
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=REPO_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def start_server(work_dir: str, env: dict, workers: int = 0) -> tuple:
+    """
+    Starts the game server, or a supervisor with the given number of workers, and waits until it listens.
+
+    Returns:
+        tuple: The server process and its (ip, port).
+    """
+    log = open(os.path.join(work_dir, 'server.log'), 'w')
+    # the stats file of the server is written to its working directory, keep it out of the repo
+    command = [sys.executable, SERVER_APP]
+    if workers:
+        command = [sys.executable, SUPERVISOR_APP, '--workers', str(workers)]
+    server = subprocess.Popen(command, cwd=work_dir, env=env, stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        with open(log.name) as file:
+            match = SERVER_STARTED_PATTERN.search(file.read())
+        if match:
+            return server, (match.group(1), int(match.group(2)))
+        if server.poll() is not None:
+            break
+        time.sleep(0.05)
+    server.kill()
+    raise RuntimeError(f'Server did not start, see {log.name}')
+
+
+def run_benchmark(players: int, args, env: dict) -> dict:
+    """
+    Runs the server and a swarm of the given number of players for the configured duration.
+
+    Returns:
+        dict: The measurements of this player count.
+    """
+    with tempfile.TemporaryDirectory() as work_dir:
+        metrics_path = os.path.join(work_dir, 'metrics.sock')
+        if not args.workers:
+            # the workers of a supervisor would share the socket
+            env = dict(env, TRIVIAKING_SERVER_METRICS_UNIX_SOCKET=metrics_path)
+        server, (ip, port) = start_server(work_dir, env, args.workers)
+        try:
+            time.sleep(0.5 + 0.5 * args.workers)
+            idle_rss = process_rss_bytes(server.pid)
+            cpu_start = process_cpu_seconds(server.pid)
+            metrics_start = scrape_metrics(metrics_path)
+            segments_start = tcp_segments_sent()
+            swarm_json = os.path.join(work_dir, 'swarm.json')
+            swarm = subprocess.Popen([sys.executable, SWARM_APP, '--bots', str(players), '--server', f'{ip}:{port}',
+                                      '--duration', str(args.duration), '--think', args.think,
+                                      '--processes', str(args.swarm_processes), '--seed', '0', '--json', swarm_json,
+                                      '--drop-rate', str(args.drop_rate)],
+                                     cwd=os.path.dirname(SWARM_APP), env=env,
+                                     stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            peak_rss = idle_rss
+            while swarm.poll() is None:
+                peak_rss = max(peak_rss, process_rss_bytes(server.pid))
+                time.sleep(0.2)
+            cpu_seconds = process_cpu_seconds(server.pid) - cpu_start
+            metrics_end = scrape_metrics(metrics_path)
+            segments_end = tcp_segments_sent()
+        finally:
+            if args.workers:
+                # let the supervisor stop its workers
+                server.terminate()
+            else:
+                server.kill()
+            server.wait()
+        with open(swarm_json) as file:
+            swarm_result = json.load(file)
+
+    rounds = metrics_end.get('triviaking_rounds_total', 0) - metrics_start.get('triviaking_rounds_total', 0)
+    writes_per_round = segments_per_round = None
+    if rounds > 0:
+        writes_per_round = (metrics_end['triviaking_socket_writes_total']
+                            - metrics_start['triviaking_socket_writes_total']) / rounds
+        if segments_start is not None:
+            # both directions: the server's messages, the answers and heartbeats of the bots and the ACKs
+            segments_per_round = (segments_end - segments_start) / rounds
+    return {
+        'players': players,
+        'workers': args.workers,
+        'duration_sec': swarm_result['elapsed_sec'],
+        'games_per_min': swarm_result['games_per_min'],
+        'timings_sec': swarm_result['timings'],
+        'swarm': swarm_result['totals'],
+        'server_cpu_percent': 100 * cpu_seconds / swarm_result['elapsed_sec'],
+        'server_cpu_percent_per_player': 100 * cpu_seconds / swarm_result['elapsed_sec'] / players,
+        'server_idle_rss_bytes': idle_rss,
+        'server_peak_rss_bytes': peak_rss,
+        'server_rss_bytes_per_player': (peak_rss - idle_rss) / players,
+        'rounds': rounds,
+        'server_writes_per_round': writes_per_round,
+        'tcp_segments_per_round': segments_per_round,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Loopback benchmark of the game server.')
+    parser.add_argument('--players', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--duration', type=float, default=20, help='seconds per player count')
+    parser.add_argument('--think', type=str, default='const:0', help='think time distribution of the bots')
+    parser.add_argument('--swarm-processes', type=int, default=1)
+    parser.add_argument('--max-teams', type=int, default=None, help='override MAX_TEAMS of the server')
+    parser.add_argument('--max-rooms', type=int, default=None, help='override SERVER_MAX_ROOMS of the server')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='run a supervisor with this many server processes instead of a single server')
+    parser.add_argument('--persistent-sessions', action='store_true',
+                        help='keep the bots connected between games (SERVER_PERSISTENT_SESSIONS)')
+    parser.add_argument('--drop-rate', type=float, default=0,
+                        help='probability of the bots to drop their connection before an answer and resume the session')
+    parser.add_argument('--no-coalescing', action='store_true',
+                        help='write every message to the socket on its own (SERVER_COALESCE_WRITES off)')
+    parser.add_argument('--output', type=str, default='bench.json')
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [REPO_DIR, env.get('PYTHONPATH')]))
+    for name, value in BENCHMARK_CONSTANTS.items():
+        env[f'TRIVIAKING_{name}'] = value
+    if args.max_teams is not None:
+        env['TRIVIAKING_MAX_TEAMS'] = str(args.max_teams)
+    if args.max_rooms is not None:
+        env['TRIVIAKING_SERVER_MAX_ROOMS'] = str(args.max_rooms)
+    if args.persistent_sessions:
+        env['TRIVIAKING_SERVER_PERSISTENT_SESSIONS'] = '1'
+    if args.no_coalescing:
+        env['TRIVIAKING_SERVER_COALESCE_WRITES'] = '0'
+
+    results = []
+    for players in args.players:
+        result = run_benchmark(players, args, env)
+        results.append(result)
+        question = result['timings_sec']['question_to_verdict']
+        print(f"{players} players: {result['games_per_min']:.0f} games/min, "
+              f"question to verdict p50={question.get('p50', 0) * 1000:.1f}ms p99={question.get('p99', 0) * 1000:.1f}ms, "
+              f"server CPU {result['server_cpu_percent']:.0f}%, "
+              f"{result['server_rss_bytes_per_player'] / 1024:.1f} KiB/player")
+        if result['server_writes_per_round'] is not None:
+            segments = result['tcp_segments_per_round']
+            print(f"    {result['rounds']:.0f} rounds, {result['server_writes_per_round']:.1f} server socket writes "
+                  f"and {'?' if segments is None else f'{segments:.1f}'} TCP segments per round")
+        resume = result['timings_sec']['reconnect_to_playing']
+        if resume.get('count'):
+            print(f"    {resume['count']} sessions resumed, reconnect to playing "
+                  f"p50={resume['p50'] * 1000:.1f}ms p99={resume['p99'] * 1000:.1f}ms")
+
+    with open(args.output, 'w') as file:
+        json.dump({'revision': git_revision(), 'timestamp': time.time(),
+                   'constants': BENCHMARK_CONSTANTS, 'results': results}, file, indent=4)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""
+Compares loading a large question bank as a Python module (like questions.py) against
+memory-mapping a question pack (question_pack.py).
+
+Generates a synthetic bank of the given size, then measures in fresh processes:
+    - load time: importing the module and building QUESTIONS_DICT, or opening the pack
+    - RSS after loading
+    - time of random lookups by id and by question text
+
+Example:
+    python benchmarks/question_pack.py --questions 100000 200000 --output pack_bench.json
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from question_pack import build_pack  # noqa: E402
+
+MEASURE_MODULE = """
+import random, resource, sys, time
+start = time.perf_counter()
+from bench_questions import QUESTIONS
+QUESTIONS_DICT = {question: is_true for question, is_true in QUESTIONS}
+load = time.perf_counter() - start
+rng = random.Random(0)
+start = time.perf_counter()
+for _ in range(10000):
+    question, answer = QUESTIONS[rng.randrange(len(QUESTIONS))]
+    QUESTIONS_DICT[question]
+lookup = time.perf_counter() - start
+print(load, lookup, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+MEASURE_PACK = """
+import random, resource, sys, time
+start = time.perf_counter()
+from question_pack import PackQuestionBank
+bank = PackQuestionBank(sys.argv[1])
+load = time.perf_counter() - start
+rng = random.Random(0)
+start = time.perf_counter()
+for _ in range(10000):
+    question, answer = bank.get(rng.randrange(len(bank)))
+    bank.find_answer(question)
+lookup = time.perf_counter() - start
+print(load, lookup, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+MEASURE_BASELINE = """
+import resource
+print(0, 0, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+
+def generate_questions(count: int):
+    rng = random.Random(count)
+    words = ['planet', 'river', 'ancient', 'largest', 'invented', 'capital', 'animal', 'ocean', 'famous', 'first']
+    for i in range(count):
+        text = f"Question {i}: the {' '.join(rng.choice(words) for _ in range(8))} is true."
+        yield text, rng.random() < 0.5
+
+
+def measure(script: str, work_dir: str, *args) -> dict:
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([work_dir, REPO_DIR])
+    output = subprocess.check_output([sys.executable, '-c', script, *args], cwd=work_dir, env=env, text=True)
+    load, lookup, max_rss_kib = output.split()
+    return {'load_sec': float(load), 'lookup_10k_sec': float(lookup), 'max_rss_kib': int(max_rss_kib)}
+
+
+def run_benchmark(count: int, work_dir: str) -> dict:
+    questions = list(generate_questions(count))
+    with open(os.path.join(work_dir, 'bench_questions.py'), 'w') as file:
+        file.write('QUESTIONS = [\n')
+        for question, answer in questions:
+            file.write(f'    ({question!r}, {answer}),\n')
+        file.write(']\n')
+    pack_path = os.path.join(work_dir, 'bench.pack')
+    build_pack(questions, pack_path)
+
+    # compile the module once, so its import is measured from a warm .pyc like in production
+    measure(MEASURE_MODULE, work_dir)
+    baseline = measure(MEASURE_BASELINE, work_dir)
+    module = measure(MEASURE_MODULE, work_dir)
+    pack = measure(MEASURE_PACK, work_dir, pack_path)
+    for result in (module, pack):
+        result['rss_over_baseline_kib'] = result['max_rss_kib'] - baseline['max_rss_kib']
+    return {'questions': count, 'pack_bytes': os.path.getsize(pack_path), 'module': module, 'pack': pack}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Question pack vs Python module benchmark.')
+    parser.add_argument('--questions', type=int, nargs='+', default=[10000, 100000, 500000])
+    parser.add_argument('--output', type=str, default='pack_bench.json')
+    args = parser.parse_args()
+
+    results = []
+    for count in args.questions:
+        with tempfile.TemporaryDirectory() as work_dir:
+            result = run_benchmark(count, work_dir)
+        results.append(result)
+        module, pack = result['module'], result['pack']
+        print(f"{count} questions: module load {module['load_sec'] * 1000:.0f}ms "
+              f"+{module['rss_over_baseline_kib'] / 1024:.1f}MiB RSS, "
+              f"pack load {pack['load_sec'] * 1000:.1f}ms +{pack['rss_over_baseline_kib'] / 1024:.1f}MiB RSS, "
+              f"10k lookups module {module['lookup_10k_sec'] * 1000:.0f}ms / pack {pack['lookup_10k_sec'] * 1000:.0f}ms")
+
+    with open(args.output, 'w') as file:
+        json.dump(results, file, indent=4)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
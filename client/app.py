@@ -1,19 +1,18 @@
 import constants as c
-from questions import QUESTIONS_DICT
+import protocol
+import question_bank
+from discovery import ServerCache, parse_broadcast_packet
+from console import open_console_input
+import json
 import socket
 import random
-import struct
 import threading
 import select
-import sys
-try:
-    import msvcrt
-except ImportError:
-    # on MAC
-    pass
+import time
 
 PRINT_LOCK = threading.Lock()
 RECONNECT_LOCK = threading.Lock()
+QUESTION_BANK = question_bank.load_question_bank(c.QUESTION_BANK_PATH)
 BOT_USED_NUMBERS = set()  # Keep track of used bot numbers
 TEAM_USED_NAMES = set()  # Hard-coded list of team names, randomlly picked by Client app
 
@@ -35,15 +34,24 @@ class Client:
         self.tcp_socket = None
         self.server_ip = None
         self.server_name = None
+        self.servers = ServerCache()  # Servers heard of, to pick the best one from
         self.connected = False
         self.bot = bot
         self.bot_level = bot_level
-        self.server_messages = []
+        self.binary_protocol = c.CLIENT_BINARY_PROTOCOL
+        self.decoder = None  # Incremental decoder of the current connection
+        self.server_messages = []  # (frame type, message) pairs
         self.server_messages_pending_condition = threading.Condition()
-        self.received_new_message = threading.Event()
+        self.console = None if bot else open_console_input()  # Woken up by new server messages while waiting for an answer
         self.state = c.CLIENT_STATE_LOOKING_FOR_SERVER  # States: looking_for_server, connecting_to_server, game_mode
         self.answer = None # Input recieved by manual player
         self.curr_question = None  # Current question in game
+        self.curr_question_id = None  # Its id in the server's bank, if the server sent it by id
+        self.question_cache = protocol.QuestionCache(c.CLIENT_QUESTION_CACHE_SIZE)  # Questions received by id
+        self.server_question_bank = None  # Fingerprint of the server's question bank, from the session message
+        self.persistent_session = False  # The server keeps the connection open between games
+        self.resume_token = None  # Gets us back into the game if the connection drops
+        self.send_lock = threading.Lock()  # Answers and heartbeats are sent from different threads
 
 
     @classmethod
@@ -83,7 +91,7 @@ class Client:
         For Bots:
         Depending on the bot level, as a probability of choosing the right answer,
         return an answer to the current question, saved as a class variable. Answer is returned
-        directly from questions.py file.
+        directly from the question bank.
         For human clients:
         Activate input thread while waiting for the client to enter an answer in 
         wait_for_input()
@@ -91,10 +99,17 @@ class Client:
         Return client / bot answer or None, if no valid answer was given.
         '''
         if self.bot:
-            # Get the correct answer for the current question from the dictionary
-            correct_ans = QUESTIONS_DICT[self.curr_question]
+            # Get the correct answer for the current question from the question bank,
+            # by id if the server numbers the questions like us
+            if self.curr_question_id is not None and self.server_question_bank == QUESTION_BANK.fingerprint():
+                correct_ans = QUESTION_BANK.get(self.curr_question_id)[1]
+            else:
+                correct_ans = QUESTION_BANK.find_answer(self.curr_question)
             # Decide whether to answer correctly based on the bot's level
-            if random.random() < self.bot_level:
+            if correct_ans is None:
+                # Unknown question, guess
+                ans = random.random() < 0.5
+            elif random.random() < self.bot_level:
                 ans = correct_ans
             else:
                 ans = not correct_ans
@@ -122,30 +137,21 @@ class Client:
         Parse the message received from the server, while verifying it's structure.
         Extract server name and port from message
         '''
-        # Expected format of the received packet
-        # Big-endian unsigned int, unsigned byte, 32-byte string, unsigned short
-        format_specifier = '>IB32sH'
-
-        unpacked_data = struct.unpack(format_specifier, data)
-        magic_cookie = unpacked_data[0]
-        message_type = unpacked_data[1]
-        server_name = unpacked_data[2].decode(
-            'utf-16le').rstrip('\x00')  # Remove padding
-        server_port = unpacked_data[3]
-
-        # Verify the magic cookie and message type
-        if magic_cookie != c.BROADCAST_MAGIC_COOKIE or message_type != c.BROADCAST_MESSAGE_TYPE:
+        try:
+            return parse_broadcast_packet(data)
+        except ValueError:
             raise ValueError(f"Invalid packet received by {self.team_name}")
 
-        return server_name, server_port
-
 
     def find_server(self):
         '''
         Look for an available game server using a UDP connection.
+        Offers are collected for CLIENT_DISCOVERY_WINDOW_SEC after the first one, every server heard of
+        is probed for its round trip time and free seats, and the best one is picked.
         Function can handle connections both on Windows and Mac computers.
         '''
-        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as udp_socket:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as udp_socket, \
+                socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as probe_socket:
             try:
                 # Different commands between MAC and Windows
                 udp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
@@ -154,19 +160,31 @@ class Client:
             
             # Bind to the broadcast port
             udp_socket.bind(('', c.BROADCAST_PORT))
-            try:
-                safe_print(f"{self.team_name} is listening for server broadcasts...")
-                data, addr = udp_socket.recvfrom(self.BUFFER_SIZE)
-                self.server_ip = addr[0]
-                
-                self.server_name,  self.server_port = self.parse_broadcast_message(data)
-
-                safe_print(f"{self.team_name} Received broadcast from {addr},"
-                      f" server name {self.server_name}")
-                self.transition_state(c.CLIENT_STATE_CONNECTING_TO_SERVER)
-
-            except socket.timeout:
-                safe_print(f"{c.COLOR_RED}[{self.team_name}]: No server broadcasts received.{c.COLOR_RESET}")
+            # the answers to probes come back to this socket only
+            probe_socket.bind(('', 0))
+            safe_print(f"{self.team_name} is listening for server broadcasts...")
+            deadline = None
+            while deadline is None or time.monotonic() < deadline:
+                timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+                readable, _, _ = select.select([udp_socket, probe_socket], [], [], timeout)
+                for sock in readable:
+                    data, addr = sock.recvfrom(self.BUFFER_SIZE)
+                    server = self.servers.add_offer(data, addr, probe_answer=sock is probe_socket)
+                    if server is None:
+                        safe_print(f"{c.COLOR_RED}Invalid packet received by {self.team_name}{c.COLOR_RESET}")
+                        continue
+                    if deadline is None:
+                        deadline = time.monotonic() + c.CLIENT_DISCOVERY_WINDOW_SEC
+                    self.servers.send_probes(probe_socket)
+
+        server = self.servers.best()
+        if server is None:
+            safe_print(f"{c.COLOR_RED}[{self.team_name}]: No server broadcasts received.{c.COLOR_RESET}")
+            return
+        self.server_ip, self.server_port = server.address
+        self.server_name = server.name
+        safe_print(f"{self.team_name} picked {server} out of {len(self.servers.servers)} servers")
+        self.transition_state(c.CLIENT_STATE_CONNECTING_TO_SERVER)
 
     def connect_to_server(self):
         '''
@@ -175,8 +193,15 @@ class Client:
         self.tcp_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         try:
             self.tcp_socket.connect((self.server_ip, self.server_port))
-            self.tcp_socket.send((self.team_name + c.CLIENT_NAME_TERMINATION).encode())
+            self.decoder = protocol.FrameDecoder() if self.binary_protocol else protocol.TextDecoder()
+            self.tcp_socket.sendall(protocol.encode_name(self.team_name, self.binary_protocol))
+            if self.binary_protocol:
+                # Questions we have are then sent by id only
+                self.tcp_socket.sendall(protocol.encode_question_cache(QUESTION_BANK.fingerprint(), self.question_cache))
             self.connected = True
+            self.persistent_session = False
+            self.resume_token = None
+            self.server_question_bank = None
             safe_print(f"{self.team_name} connected to the server and sent player name.")
             self.transition_state(c.CLIENT_STATE_GAME_MODE)
         except Exception as e:
@@ -189,6 +214,8 @@ class Client:
     def listen_to_server(self):
         '''
         Receive messages via TCP connection from server to client.
+        Received bytes are fed to the connection's decoder, so messages split
+        between two reads are only handled once they are complete.
         '''
         while True:
             try:
@@ -199,16 +226,15 @@ class Client:
                 
                 data = self.tcp_socket.recv(self.BUFFER_SIZE)
                 if not data:
+                    if self.resume_session():
+                        continue
                     safe_print(f'{c.COLOR_RED}server disconnected. reconnecting...{c.COLOR_RESET}')
                     self.reconnect()
                     break # Stop listening to server (disconnected), look for another connection and restart
-                self.received_new_message.set()
-                new_server_messages = data.decode().split(c.SERVER_MSG_TERMINATION)
-                new_server_messages = [msg for msg in new_server_messages if len(msg) > 0]
-                with self.server_messages_pending_condition:
-                    self.server_messages += new_server_messages
-                    self.server_messages_pending_condition.notify()
-            except (ConnectionAbortedError, OSError) as e:
+                self.add_server_messages(self.decoder.feed(data))
+            except (ConnectionAbortedError, OSError, protocol.ProtocolError) as e:
+                if self.connected and self.resume_session():
+                    continue
                 self.reconnect()
                 break
             
@@ -216,29 +242,127 @@ class Client:
         # Notify main thread that server disconnected - Free it
         with self.server_messages_pending_condition:
             self.server_messages_pending_condition.notify()
+        if self.console is not None:
+            self.console.wake()
             
     
+    def add_server_messages(self, new_server_messages):
+        '''
+        Hand messages received from the server to the game thread.
+        '''
+        if not new_server_messages:
+            return
+        with self.server_messages_pending_condition:
+            self.server_messages += new_server_messages
+            self.server_messages_pending_condition.notify()
+        if self.console is not None:
+            # Stop waiting for an answer, the game thread handles the message
+            self.console.wake()
+
+
+    def resume_session(self):
+        '''
+        Get back into the game after the connection dropped, by sending the resumption token of the session
+        on a new connection to the same server. The server keeps our seat for a while, and sends the messages
+        we missed after confirming with a session message.
+        Return True if the session was resumed, False if we have to look for a server again.
+        '''
+        if self.resume_token is None or not self.binary_protocol:
+            return False
+        safe_print(f"{c.COLOR_YELLOW}Connection to the server dropped, resuming the session...{c.COLOR_RESET}")
+        for attempt in range(c.CLIENT_RESUME_ATTEMPTS):
+            if attempt > 0:
+                time.sleep(c.CLIENT_RESUME_RETRY_SEC)
+            tcp_socket = None
+            try:
+                tcp_socket = socket.create_connection((self.server_ip, self.server_port), timeout=c.CLIENT_RESUME_RETRY_SEC)
+                tcp_socket.sendall(protocol.encode_resume(self.resume_token))
+                decoder = protocol.FrameDecoder()
+                messages = []
+                while not messages:
+                    data = tcp_socket.recv(self.BUFFER_SIZE)
+                    if not data:
+                        break
+                    messages = decoder.feed(data)
+                tcp_socket.settimeout(None)
+            except (OSError, protocol.ProtocolError):
+                if tcp_socket is not None:
+                    tcp_socket.close()
+                continue
+            if not messages or messages[0][0] != c.SESSION_FRAME:
+                # the server does not know the session (anymore)
+                tcp_socket.close()
+                break
+            old_socket, self.tcp_socket, self.decoder = self.tcp_socket, tcp_socket, decoder
+            old_socket.close()
+            safe_print(f"{c.COLOR_GREEN}{self.team_name} resumed the session.{c.COLOR_RESET}")
+            self.add_server_messages(messages)
+            return True
+        self.resume_token = None
+        return False
+
+
+    def resolve_question(self, payload):
+        '''
+        Get the text of a question the server sent by id: from our question bank if the server numbers
+        the questions like us, otherwise from the message itself or the question cache.
+        If we don't have the question, ask the server for its text and return None, the question comes again.
+        '''
+        try:
+            question_id, question = protocol.parse_question_id(payload)
+        except protocol.ProtocolError as e:
+            safe_print(f"{c.COLOR_RED}{e}{c.COLOR_RESET}")
+            return None
+        self.curr_question_id = question_id
+        if self.server_question_bank == QUESTION_BANK.fingerprint():
+            # The server does not mirror our cache, it knows we have every question
+            if question is None:
+                question = QUESTION_BANK.get(question_id)[0]
+        elif question is not None:
+            self.question_cache.put(question_id, question)
+        else:
+            question = self.question_cache.get(question_id)
+            if question is None:
+                self.send(protocol.encode_question_request(question_id))
+        return question
+
+
+    def send(self, data):
+        '''
+        Send data to the server, without mixing it with a heartbeat sent by the heartbeat thread.
+        '''
+        with self.send_lock:
+            self.tcp_socket.sendall(data)
+
+
+    def send_heartbeats(self):
+        '''
+        Tell the server we are alive every CLIENT_HEARTBEAT_INTERVAL_SEC, so it can tell a dead connection
+        from a player who is just thinking. Runs in its own thread for the whole life of the client.
+        Only the binary protocol has heartbeats.
+        '''
+        heartbeat = protocol.encode_heartbeat()
+        while True:
+            time.sleep(c.CLIENT_HEARTBEAT_INTERVAL_SEC)
+            if not self.connected or not self.binary_protocol:
+                continue
+            try:
+                self.send(heartbeat)
+            except (OSError, AttributeError):
+                # No connection right now, the listener thread handles it
+                pass
+
+
     def wait_for_input(self):
         '''
-        Recieve user input in thread while not blocking incoming server messages
+        Recieve user input in thread while not blocking incoming server messages:
+        wait until the player typed an answer or the server sent a new message (see console.py),
+        whichever comes first, without polling.
+        Return the answer, or None if a server message came first.
         '''
-        self.received_new_message.clear()
-        ans = None
+        self.console.reset()
         safe_print("Answer: ", end='', flush=True)
-        while not self.received_new_message.is_set():
-            try:
-                # Use select to check if there is input available without blocking
-                input_ready, _, _ = select.select([sys.stdin], [], [], c.CLIENT_INPUT_REFRESH_SEC)
-                if input_ready:
-                    # Read user input
-                    ans = sys.stdin.readline().rstrip()
-                    break
-            except OSError:
-                # Handle the case for Windows when select is used with stdin
-                if msvcrt.kbhit():
-                    ans = sys.stdin.readline().rstrip()
-                    break
-        return ans
+        return self.console.read_line()
 
 
     def game_mode(self):
@@ -262,31 +386,49 @@ class Client:
                     if not self.connected:
                         break
 
-                    server_message = self.server_messages.pop(0)
+                    message_type, server_message = self.server_messages.pop(0)
+                if message_type == c.QUESTION_ID_FRAME:
+                    server_message = self.resolve_question(server_message)
+                    if server_message is None:
+                        continue
+                    message_type = c.QUESTION_FRAME
+                elif message_type == c.QUESTION_FRAME:
+                    self.curr_question_id = None
             else:
-                server_message = c.QUESTION_MESSAGE + self.curr_question
+                message_type, server_message = c.QUESTION_FRAME, self.curr_question
                 was_error = False
 
-            if server_message.startswith(c.WELCOME_MESSAGE):
-                server_message = server_message.replace(c.WELCOME_MESSAGE, "")
+            if message_type == c.SESSION_FRAME:
+                try:
+                    session = json.loads(server_message)
+                    self.persistent_session = bool(session.get('persistent'))
+                    self.resume_token = session.get('token')
+                    self.server_question_bank = session.get('questions')
+                    if self.server_question_bank and self.server_question_bank != self.question_cache.bank:
+                        # The ids we cached belong to another bank, the server ignored them too
+                        self.question_cache.reset(self.server_question_bank)
+                except (ValueError, AttributeError):
+                    safe_print(f"{c.COLOR_RED}Invalid session message: {server_message}{c.COLOR_RESET}")
+            elif message_type == c.WELCOME_FRAME:
                 safe_print(f"{c.COLOR_GREEN}{server_message}{c.COLOR_RESET}")
-            elif server_message.startswith(c.ERROR_MESSAGE):
-                server_message = server_message.replace(c.ERROR_MESSAGE, "")
+            elif message_type == c.ERROR_FRAME:
                 safe_print(f"{c.COLOR_RED}Error: {server_message}{c.COLOR_RESET}")
                 was_error = True
-            elif server_message.startswith(c.QUESTION_MESSAGE):
-                server_message = server_message.replace(c.QUESTION_MESSAGE, "")
+            elif message_type == c.QUESTION_FRAME:
                 self.curr_question = server_message
                 safe_print(f"{c.COLOR_BLUE}Question: {server_message}{c.COLOR_RESET}")
                 ans = self.answer_the_bloody_question()
                 if ans is not None:
-                    self.tcp_socket.sendall(ans.encode())
-            elif server_message.startswith(c.GAME_OVER_MESSAGE):
-                server_message = server_message.replace(c.GAME_OVER_MESSAGE, "")
+                    self.send(protocol.encode_answer(ans, self.binary_protocol))
+            elif message_type == c.GAME_OVER_FRAME:
                 safe_print(f"{c.COLOR_GREEN}{server_message}{c.COLOR_RESET}")
-                self.reconnect()  # Will change state => exit loop
-            elif server_message.startswith(c.GENERAL_MESSAGE):
-                server_message = server_message.replace(c.GENERAL_MESSAGE, "")
+                if self.persistent_session:
+                    # Same connection, the server moves us to the next lobby
+                    safe_print(f"{c.COLOR_YELLOW}{self.team_name} is waiting for the next game...{c.COLOR_RESET}")
+                    self.curr_question = None
+                else:
+                    self.reconnect()  # Will change state => exit loop
+            elif message_type == c.GENERAL_FRAME:
                 safe_print(f"{c.COLOR_YELLOW}{server_message}{c.COLOR_RESET}")
                 
 
@@ -322,6 +464,7 @@ class Client:
         2. Found server, connect
         3. Game
         '''
+        threading.Thread(target=self.send_heartbeats, daemon=True).start()
         while True:            
             if self.state == c.CLIENT_STATE_LOOKING_FOR_SERVER:
                 self.find_server()
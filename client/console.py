@@ -0,0 +1,87 @@
+'''
+Console input of a human player: wait for a typed answer or a new message of the server, whichever comes first.
+
+The game thread waits for the answer while the listener thread receives the server's messages, and wakes the
+game thread up with wake() whenever a message arrives. Where stdin can be select()ed (Linux, MAC), stdin and a
+self-pipe written by wake() are waited on together, so nothing is polled. On Windows, where select() only takes
+sockets, the keyboard is checked with msvcrt every CLIENT_INPUT_REFRESH_SEC, and wake() still ends the wait at once.
+'''
+import os
+import select
+import sys
+import threading
+
+import constants as c
+try:
+    import msvcrt
+except ImportError:
+    # on MAC / Linux
+    msvcrt = None
+
+
+class SelectConsoleInput:
+    '''
+    Waits on stdin and a self-pipe together.
+    '''
+    def __init__(self):
+        self.wakeup_read, self.wakeup_write = os.pipe()
+        os.set_blocking(self.wakeup_read, False)
+        os.set_blocking(self.wakeup_write, False)
+
+    def wake(self):
+        '''
+        End a pending read_line, from any thread.
+        '''
+        try:
+            os.write(self.wakeup_write, b'\0')
+        except BlockingIOError:
+            # The pipe is full of wakeups already
+            pass
+
+    def reset(self):
+        '''
+        Forget the wakeups so far, before waiting for a new answer.
+        '''
+        try:
+            while os.read(self.wakeup_read, 4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def read_line(self):
+        '''
+        Return the line typed by the player, or None if woken up first.
+        '''
+        readable, _, _ = select.select([sys.stdin, self.wakeup_read], [], [])
+        if sys.stdin in readable:
+            return sys.stdin.readline().rstrip()
+        return None
+
+
+class MsvcrtConsoleInput:
+    '''
+    Windows fallback with the same interface: the wakeup is an event, and the keyboard is checked in between.
+    '''
+    def __init__(self):
+        self.woken = threading.Event()
+
+    def wake(self):
+        self.woken.set()
+
+    def reset(self):
+        self.woken.clear()
+
+    def read_line(self):
+        while not self.woken.wait(c.CLIENT_INPUT_REFRESH_SEC):
+            if msvcrt.kbhit():
+                return sys.stdin.readline().rstrip()
+        return None
+
+
+def open_console_input():
+    '''
+    Return the console input of this platform.
+    '''
+    if msvcrt is not None:
+        return MsvcrtConsoleInput()
+    return SelectConsoleInput()
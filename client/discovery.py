@@ -0,0 +1,158 @@
+'''
+Server discovery: a cache of the servers that sent offers, ranked by distance and free seats.
+
+Servers broadcast a fixed '>IB32sH' offer. A client probes every server it heard of with a unicast
+datagram, and the server answers with the same offer followed by an extension advertising its lobby
+(see OFFER_EXTENSION_FORMAT). The time to the answer is the round trip time to that server.
+Servers that do not answer probes are still used, ranked after the ones that do.
+'''
+import math
+import socket
+import struct
+import time
+
+import constants as c
+
+OFFER_SIZE = struct.calcsize(c.OFFER_FORMAT)
+EXTENSION_SIZE = struct.calcsize(c.OFFER_EXTENSION_FORMAT)
+
+
+def parse_broadcast_packet(data: bytes):
+    '''
+    Parse an offer packet broadcast by a server, while verifying it's structure.
+    Return the server name and port, raise ValueError for invalid packets.
+    '''
+    server_name, server_port, _ = parse_offer(data)
+    return server_name, server_port
+
+
+def parse_offer(data: bytes):
+    '''
+    Parse an offer, with or without the extension.
+    Return the server name, port and status tuple (None without the extension), raise ValueError for invalid packets.
+    '''
+    # Big-endian unsigned int, unsigned byte, 32-byte string, unsigned short
+    try:
+        magic_cookie, message_type, server_name, server_port = struct.unpack_from(c.OFFER_FORMAT, data)
+    except struct.error:
+        raise ValueError("Invalid packet size")
+    # Verify the magic cookie and message type
+    if magic_cookie != c.BROADCAST_MAGIC_COOKIE or message_type != c.BROADCAST_MESSAGE_TYPE:
+        raise ValueError("Invalid packet received")
+    server_name = server_name.decode('utf-16le', errors='replace').rstrip('\x00')  # Remove padding
+
+    status = None
+    if len(data) >= OFFER_SIZE + EXTENSION_SIZE:
+        version, *status = struct.unpack_from(c.OFFER_EXTENSION_FORMAT, data, OFFER_SIZE)
+        # a newer extension starts with the same fields
+        status = tuple(status) if version >= c.OFFER_EXTENSION_VERSION else None
+    return server_name, server_port, status
+
+
+def create_probe_packet() -> bytes:
+    return struct.pack('>IB', c.BROADCAST_MAGIC_COOKIE, c.BROADCAST_PROBE_TYPE)
+
+
+class ServerOffer:
+    '''
+    What a client knows about one server.
+    '''
+    def __init__(self, name, address):
+        self.name = name
+        self.address = address  # (ip, TCP port)
+        self.udp_address = None  # where the offers come from and the probes go to
+        self.last_seen = 0
+        self.rtt = None
+        self.status = None  # (lobby state, lobby players, lobby capacity, games, max games)
+
+    def accepts_players(self):
+        return self.status is None or self.status[0] == c.OFFER_STATE_LOBBY_OPEN
+
+    def free_seats(self):
+        '''
+        Seats left in the open lobby, 0 if the server is full and None if unknown.
+        '''
+        if self.status is None:
+            return None
+        state, lobby_players, lobby_capacity, _, _ = self.status
+        if state != c.OFFER_STATE_LOBBY_OPEN:
+            return 0
+        return max(lobby_capacity - lobby_players, 0)
+
+    def rank(self):
+        '''
+        Sort key of the server, lower is better: servers accepting players first, then the closest ones,
+        and among servers at about the same distance the one with the most free seats.
+        '''
+        rtt_bucket = math.inf if self.rtt is None else int(self.rtt / c.CLIENT_RTT_RESOLUTION_SEC)
+        free_seats = self.free_seats()
+        return (not self.accepts_players(), rtt_bucket, -(free_seats or 0), self.rtt or math.inf)
+
+    def __repr__(self):
+        rtt = 'unknown' if self.rtt is None else f'{self.rtt * 1000:.1f}ms'
+        return f'{self.name} at {self.address[0]}:{self.address[1]} (rtt {rtt}, free seats {self.free_seats()})'
+
+
+class ServerCache:
+    '''
+    The servers a client heard of, keyed by their (ip, TCP port).
+    Probes are sent to the UDP address the offers of a server came from.
+    '''
+    def __init__(self):
+        self.servers = {}
+        self.probes_sent = {}  # UDP address of a server -> time the probe was sent
+
+    def add_offer(self, data: bytes, udp_address, probe_answer=False, now=None):
+        '''
+        Add or refresh a server from an offer, or from an answer to a probe (received on the probing socket).
+        Return the server, or None for an invalid packet.
+        '''
+        try:
+            server_name, server_port, status = parse_offer(data)
+        except ValueError:
+            return None
+        now = time.monotonic() if now is None else now
+        address = (udp_address[0], server_port)
+        server = self.servers.get(address)
+        if server is None:
+            server = self.servers[address] = ServerOffer(server_name, address)
+        server.name = server_name
+        server.last_seen = now
+        server.udp_address = udp_address
+        if status is not None:
+            server.status = status
+        if probe_answer:
+            sent_at = self.probes_sent.pop(udp_address, None)
+            if sent_at is not None:
+                server.rtt = now - sent_at
+        return server
+
+    def send_probes(self, probe_socket: socket.socket, now=None):
+        '''
+        Probe every known server that has no probe in flight, from a socket that receives the answers.
+        '''
+        now = time.monotonic() if now is None else now
+        for server in self.servers.values():
+            if now - self.probes_sent.get(server.udp_address, -math.inf) < c.CLIENT_DISCOVERY_WINDOW_SEC:
+                continue
+            try:
+                probe_socket.sendto(create_probe_packet(), server.udp_address)
+                self.probes_sent[server.udp_address] = now
+            except OSError:
+                pass
+
+    def expire(self, now=None):
+        now = time.monotonic() if now is None else now
+        for address, server in list(self.servers.items()):
+            if now - server.last_seen > c.CLIENT_OFFER_TTL_SEC:
+                del self.servers[address]
+                self.probes_sent.pop(server.udp_address, None)
+
+    def best(self):
+        '''
+        Return the best server to join, or None if no server is known.
+        '''
+        self.expire()
+        if not self.servers:
+            return None
+        return min(self.servers.values(), key=ServerOffer.rank)
@@ -0,0 +1,461 @@
+'''
+Headless bot swarm for load testing a game server.
+
+All bots of a worker process run as coroutines of a single asyncio event loop,
+share one UDP offer listener, and reconnect automatically between games.
+Several worker processes can be started to use more than one core.
+
+Example:
+    python swarm.py --bots 2000 --level mix --arrival-rate 200 --think exp:0.5 --processes 2
+'''
+import argparse
+import asyncio
+import collections
+import json
+import multiprocessing
+import random
+import socket
+import time
+
+import constants as c
+import protocol
+from app import QUESTION_BANK, safe_print
+from discovery import ServerCache
+
+
+def parse_think_time(spec: str):
+    '''
+    Parse a think time distribution, given as "<kind>:<params>", into a sampling function.
+    Supported kinds (all values in seconds):
+        const:<sec>
+        uniform:<low>:<high>
+        exp:<mean>
+        normal:<mean>:<stddev>  (negative samples are clipped to 0)
+    '''
+    kind, *params = spec.split(':')
+    try:
+        params = [float(p) for p in params]
+        if kind == 'const':
+            (value,) = params
+            return lambda rng: value
+        if kind == 'uniform':
+            low, high = params
+            return lambda rng: rng.uniform(low, high)
+        if kind == 'exp':
+            (mean,) = params
+            return lambda rng: rng.expovariate(1 / mean) if mean > 0 else 0
+        if kind == 'normal':
+            mean, stddev = params
+            return lambda rng: max(0.0, rng.gauss(mean, stddev))
+    except ValueError:
+        pass
+    raise argparse.ArgumentTypeError(f"Invalid think time distribution: {spec}")
+
+
+def summarize(samples):
+    '''
+    Summarize timing samples (in seconds) into count, mean and percentiles.
+    '''
+    if not samples:
+        return {'count': 0}
+    samples = sorted(samples)
+
+    def percentile(p):
+        return samples[min(len(samples) - 1, int(p / 100 * len(samples)))]
+
+    return {'count': len(samples), 'mean': sum(samples) / len(samples),
+            'p50': percentile(50), 'p95': percentile(95), 'p99': percentile(99), 'max': samples[-1]}
+
+
+class SwarmStats:
+    '''
+    Counters and timing samples of a single worker, merged into the swarm summary at the end.
+    Timings are measured by the bots:
+        question_to_verdict - question received until the round's verdict received
+        round_duration - between two consecutive round start messages
+        game_over_to_welcome - game over received until the welcome of the next game
+        reconnect_to_playing - connection dropped (see --drop-rate) until the server confirmed the resumed session
+    '''
+    FIELDS = ('connects', 'connect_failures', 'disconnects', 'resumes', 'games', 'wins', 'answers', 'errors')
+    TIMINGS = ('question_to_verdict', 'round_duration', 'game_over_to_welcome', 'reconnect_to_playing')
+
+    def __init__(self):
+        for field in self.FIELDS:
+            setattr(self, field, 0)
+        self.timings = {timing: [] for timing in self.TIMINGS}
+        self.active_bots = 0
+
+    def as_dict(self):
+        stats = {field: getattr(self, field) for field in self.FIELDS}
+        stats['timings'] = self.timings
+        return stats
+
+
+class OfferListener(asyncio.DatagramProtocol):
+    '''
+    A single UDP listener shared by all bots of a worker, keeping the servers that sent offers.
+    '''
+    def __init__(self):
+        self.servers = ServerCache()
+        self.first_offer_at = None
+        self.server_found = asyncio.Event()
+
+    def datagram_received(self, data, addr):
+        known_servers = len(self.servers.servers)
+        server = self.servers.add_offer(data, addr)
+        if server is None:
+            return
+        if len(self.servers.servers) != known_servers:
+            safe_print(f"{c.COLOR_BLUE}Swarm received offer from {server.name} at {addr[0]}:{server.address[1]}{c.COLOR_RESET}")
+        if self.first_offer_at is None:
+            self.first_offer_at = time.monotonic()
+        self.server_found.set()
+
+    async def best_server(self):
+        '''
+        Wait for offers for CLIENT_DISCOVERY_WINDOW_SEC after the first one, and return the best server heard of.
+        '''
+        await self.server_found.wait()
+        await asyncio.sleep(self.first_offer_at + c.CLIENT_DISCOVERY_WINDOW_SEC - time.monotonic())
+        server = self.servers.best()
+        if server is None:
+            # every offer expired, wait for a new one
+            self.first_offer_at = None
+            self.server_found.clear()
+            return await self.best_server()
+        return server.address
+
+
+class Swarm:
+    '''
+    Runs many bots against a server inside one event loop.
+    '''
+    def __init__(self, args, worker_id=0):
+        self.args = args
+        self.worker_id = worker_id
+        self.rng = random.Random(None if args.seed is None else args.seed + worker_id)
+        self.think_time = parse_think_time(args.think)
+        self.stats = SwarmStats()
+        self.offers = None
+        self.stopping = False
+
+    def bot_level(self):
+        if self.args.level == 'mix':
+            return c.BOT_LEVELS[self.rng.choice(list(c.BOT_LEVELS.keys()))]
+        return c.BOT_LEVELS[self.args.level]
+
+    async def get_server(self):
+        '''
+        Return the address of the server to connect to, either the one given
+        on the command line or the best discovered server.
+        '''
+        if self.args.server:
+            host, port = self.args.server.rsplit(':', 1)
+            return host, int(port)
+        return await self.offers.best_server()
+
+    def choose_answer(self, question, level, question_id=None):
+        '''
+        Answer correctly with the probability of the bot's level, like Client.answer_the_bloody_question.
+        The answer is looked up by id if the server numbers the questions like our bank (question_id is given),
+        by text otherwise. Unknown questions are answered randomly.
+        '''
+        if question_id is not None:
+            correct_ans = QUESTION_BANK.get(question_id)[1]
+        else:
+            correct_ans = QUESTION_BANK.find_answer(question)
+        if correct_ans is None:
+            ans = self.rng.random() < 0.5
+        elif self.rng.random() < level:
+            ans = correct_ans
+        else:
+            ans = not correct_ans
+        return c.TRUE_ANSWERS[1] if ans else c.FALSE_ANSWERS[1]
+
+    async def play_games(self, name, level, question_cache, last_game_over=None):
+        '''
+        Connect to a server and play a single game, or every game of the connection if the server keeps
+        the session open between games. The bot's question cache is kept between connections,
+        like Client.question_cache.
+        Return the time the last game over message was received, or None if the game did not end normally.
+        '''
+        host, port = await self.get_server()
+        try:
+            reader, writer = await asyncio.open_connection(host, port)
+        except OSError:
+            self.stats.connect_failures += 1
+            return None
+        self.stats.connects += 1
+        binary = not self.args.text_protocol
+        decoder = protocol.FrameDecoder() if binary else protocol.TextDecoder()
+        writer.write(protocol.encode_name(name, binary))
+        if binary:
+            writer.write(protocol.encode_question_cache(QUESTION_BANK.fingerprint(), question_cache))
+        same_bank = False  # the server numbers the questions like our bank
+        last_answer = None
+        question_received = None
+        round_started = None
+        persistent_session = False
+        resume_token = None
+        messages = collections.deque()
+        timings = self.stats.timings
+
+        async def send_heartbeats():
+            # the writer changes when a session is resumed
+            heartbeat = protocol.encode_heartbeat()
+            while True:
+                await asyncio.sleep(c.CLIENT_HEARTBEAT_INTERVAL_SEC)
+                if not writer.is_closing():
+                    writer.write(heartbeat)
+
+        heartbeat_task = asyncio.create_task(send_heartbeats()) if binary else None
+        try:
+            while True:
+                if not messages:
+                    data = await reader.read(c.CLIENT_NAME_PACKET_SIZE)
+                    if not data:
+                        self.stats.disconnects += 1
+                        return None
+                    messages.extend(decoder.feed(data))
+                    continue
+                message_type, message = messages.popleft()
+                now = time.monotonic()
+                question_id = None
+                if message_type == c.QUESTION_ID_FRAME:
+                    # like Client.resolve_question
+                    question_id, message = protocol.parse_question_id(message)
+                    if same_bank:
+                        if message is None:
+                            message = QUESTION_BANK.get(question_id)[0]
+                    else:
+                        if message is not None:
+                            question_cache.put(question_id, message)
+                        else:
+                            message = question_cache.get(question_id)
+                            if message is None:
+                                writer.write(protocol.encode_question_request(question_id))
+                                continue
+                        # the answer is looked up by text in our own bank
+                        question_id = None
+                    message_type = c.QUESTION_FRAME
+                if message_type == c.SESSION_FRAME:
+                    session = json.loads(message)
+                    persistent_session = session.get('persistent', False)
+                    resume_token = session.get('token')
+                    server_bank = session.get('questions')
+                    same_bank = server_bank == QUESTION_BANK.fingerprint()
+                    if server_bank and server_bank != question_cache.bank:
+                        question_cache.reset(server_bank)
+                elif message_type == c.WELCOME_FRAME and last_game_over is not None:
+                    timings['game_over_to_welcome'].append(now - last_game_over)
+                elif message_type == c.GENERAL_FRAME and message.startswith('Round '):
+                    if round_started is not None:
+                        timings['round_duration'].append(now - round_started)
+                    round_started = now
+                elif message_type == c.GENERAL_FRAME and question_received is not None:
+                    # the first message after a question is the round's verdict
+                    timings['question_to_verdict'].append(now - question_received)
+                    question_received = None
+                if message_type == c.QUESTION_FRAME:
+                    question_received = now
+                    if resume_token is not None and self.rng.random() < self.args.drop_rate:
+                        # a transient drop before answering, the answer goes to the resumed session
+                        writer.transport.abort()
+                        resumed = await self.resume_session(host, port, resume_token)
+                        if resumed is None:
+                            self.stats.disconnects += 1
+                            return None
+                        reader, writer, decoder, missed_messages = resumed
+                        messages.extend(missed_messages)
+                        timings['reconnect_to_playing'].append(time.monotonic() - now)
+                        self.stats.resumes += 1
+                    await asyncio.sleep(self.think_time(self.rng))
+                    last_answer = self.choose_answer(message, level, question_id)
+                    writer.write(protocol.encode_answer(last_answer, binary))
+                    self.stats.answers += 1
+                elif message_type == c.ERROR_FRAME:
+                    self.stats.errors += 1
+                    if last_answer is not None:
+                        writer.write(protocol.encode_answer(last_answer, binary))
+                elif message_type == c.GAME_OVER_FRAME:
+                    self.stats.games += 1
+                    if 'You are the winner' in message:
+                        self.stats.wins += 1
+                    last_game_over = now
+                    if not persistent_session or not self.args.reconnect or self.stopping:
+                        return now
+                    round_started = None
+        except (ConnectionError, OSError, protocol.ProtocolError, ValueError):
+            self.stats.disconnects += 1
+            return None
+        finally:
+            if heartbeat_task is not None:
+                heartbeat_task.cancel()
+            writer.close()
+
+    async def resume_session(self, host, port, resume_token):
+        '''
+        Open a new connection after a dropped one, and resume the session with its token.
+        Return the new reader, writer and decoder with the messages received after the server's confirmation,
+        or None if the session could not be resumed.
+        '''
+        for attempt in range(c.CLIENT_RESUME_ATTEMPTS):
+            if attempt > 0:
+                await asyncio.sleep(c.CLIENT_RESUME_RETRY_SEC)
+            try:
+                reader, writer = await asyncio.open_connection(host, port)
+            except OSError:
+                continue
+            writer.write(protocol.encode_resume(resume_token))
+            decoder = protocol.FrameDecoder()
+            messages = []
+            try:
+                while not messages:
+                    data = await reader.read(c.CLIENT_NAME_PACKET_SIZE)
+                    if not data:
+                        break
+                    messages = decoder.feed(data)
+            except (ConnectionError, OSError, protocol.ProtocolError):
+                messages = []
+            if messages and messages[0][0] == c.SESSION_FRAME:
+                return reader, writer, decoder, messages[1:]
+            writer.close()
+            if messages:
+                # the server does not know the session (anymore)
+                break
+        return None
+
+    async def run_bot(self, bot_id):
+        '''
+        Play games until the swarm stops, reconnecting between games unless the server keeps the session open.
+        '''
+        name = c.BOT_NAME_FORMAT.format(id=f'{self.worker_id}_{bot_id}')
+        level = self.bot_level()
+        question_cache = protocol.QuestionCache(c.CLIENT_QUESTION_CACHE_SIZE)
+        self.stats.active_bots += 1
+        last_game_over = None
+        try:
+            while not self.stopping:
+                last_game_over = await self.play_games(name, level, question_cache, last_game_over)
+                if not self.args.reconnect:
+                    break
+                await asyncio.sleep(c.SWARM_RECONNECT_DELAY_SEC)
+        finally:
+            self.stats.active_bots -= 1
+
+    async def report_loop(self):
+        start = time.monotonic()
+        while True:
+            await asyncio.sleep(c.SWARM_REPORT_PERIOD_SEC)
+            elapsed = time.monotonic() - start
+            safe_print(f"{c.COLOR_YELLOW}[worker {self.worker_id}] {elapsed:.0f}s active={self.stats.active_bots} "
+                       f"games={self.stats.games} wins={self.stats.wins} answers={self.stats.answers} "
+                       f"connects={self.stats.connects} failures={self.stats.connect_failures} "
+                       f"disconnects={self.stats.disconnects}{c.COLOR_RESET}")
+
+    async def run(self, num_bots):
+        '''
+        Start num_bots bots with Poisson arrivals at the configured rate, and run them
+        for the configured duration (or until all of them finished, if not reconnecting).
+        '''
+        loop = asyncio.get_running_loop()
+        transport = None
+        if not self.args.server:
+            transport, self.offers = await loop.create_datagram_endpoint(
+                OfferListener, local_addr=('', c.BROADCAST_PORT), reuse_port=hasattr(socket, 'SO_REUSEPORT'))
+        reporter = asyncio.create_task(self.report_loop())
+
+        async def spawn_bots():
+            bots = []
+            for bot_id in range(num_bots):
+                bots.append(asyncio.create_task(self.run_bot(bot_id)))
+                if self.args.arrival_rate > 0:
+                    await asyncio.sleep(self.rng.expovariate(self.args.arrival_rate))
+            await asyncio.gather(*bots)
+
+        try:
+            await asyncio.wait_for(spawn_bots(), timeout=self.args.duration)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self.stopping = True
+            reporter.cancel()
+            if transport is not None:
+                transport.close()
+        return self.stats.as_dict()
+
+
+def run_worker(args, worker_id, num_bots, results):
+    '''
+    Entry point of a worker process.
+    '''
+    stats = asyncio.run(Swarm(args, worker_id).run(num_bots))
+    results.put(stats)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a swarm of trivia bots against a server.')
+    parser.add_argument('--bots', type=int, default=100, help='total number of bots')
+    parser.add_argument('--level', default='mix', choices=list(c.BOT_LEVELS.keys()) + ['mix'],
+                        help='bot level, or "mix" for a random level per bot')
+    parser.add_argument('--arrival-rate', type=float, default=0,
+                        help='bots started per second per process (0 starts all of them at once)')
+    parser.add_argument('--think', type=str, default=c.SWARM_DEFAULT_THINK_TIME,
+                        help='think time distribution: const:S, uniform:LOW:HIGH, exp:MEAN or normal:MEAN:STD')
+    parser.add_argument('--processes', type=int, default=1, help='number of worker processes')
+    parser.add_argument('--server', type=str, default=None,
+                        help='connect to HOST:PORT instead of waiting for offers')
+    parser.add_argument('--duration', type=float, default=None, help='stop after this many seconds')
+    parser.add_argument('--no-reconnect', dest='reconnect', action='store_false',
+                        help='play a single game per bot')
+    parser.add_argument('--text-protocol', action='store_true', help='use the legacy text protocol')
+    parser.add_argument('--drop-rate', type=float, default=0,
+                        help='probability to drop the connection before answering a question and resume the session')
+    parser.add_argument('--seed', type=int, default=None, help='random seed')
+    parser.add_argument('--json', type=str, default=None, help='write the summary and timings to this JSON file')
+    args = parser.parse_args()
+    try:
+        parse_think_time(args.think)
+    except argparse.ArgumentTypeError as e:
+        parser.error(str(e))
+
+    start = time.monotonic()
+    if args.processes <= 1:
+        totals = asyncio.run(Swarm(args).run(args.bots))
+    else:
+        results = multiprocessing.Queue()
+        workers = []
+        for worker_id in range(args.processes):
+            # spread the bots as evenly as possible over the workers
+            num_bots = args.bots // args.processes + (worker_id < args.bots % args.processes)
+            worker = multiprocessing.Process(target=run_worker, args=(args, worker_id, num_bots, results))
+            worker.start()
+            workers.append(worker)
+        totals = dict.fromkeys(SwarmStats.FIELDS, 0)
+        totals['timings'] = {timing: [] for timing in SwarmStats.TIMINGS}
+        for _ in workers:
+            stats = results.get()
+            for field in SwarmStats.FIELDS:
+                totals[field] += stats[field]
+            for timing in SwarmStats.TIMINGS:
+                totals['timings'][timing] += stats['timings'][timing]
+        for worker in workers:
+            worker.join()
+
+    elapsed = time.monotonic() - start
+    timings = {timing: summarize(samples) for timing, samples in totals.pop('timings').items()}
+    safe_print(f"{c.COLOR_GREEN}Swarm finished after {elapsed:.1f}s: " +
+               ', '.join(f'{field}={value}' for field, value in totals.items()) +
+               f", games/min={totals['wins'] * 60 / elapsed:.1f}{c.COLOR_RESET}")
+    for timing, summary in timings.items():
+        if summary['count']:
+            safe_print(f"{timing}: p50={summary['p50'] * 1000:.1f}ms p95={summary['p95'] * 1000:.1f}ms "
+                       f"p99={summary['p99'] * 1000:.1f}ms ({summary['count']} samples)")
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump({'elapsed_sec': elapsed, 'games_per_min': totals['wins'] * 60 / elapsed,
+                       'totals': totals, 'timings': timings}, file, indent=4)
+
+
+if __name__ == '__main__':
+    main()
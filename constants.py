@@ -1,3 +1,5 @@
+import os
+
 # Packet Sizes
 CLIENT_NAME_PACKET_SIZE = 1024
 CLIENT_ANSWER_PACKET_SIZE = 1
@@ -7,6 +9,14 @@ BROADCAST_ADDRESS = '<broadcast>'
 BROADCAST_PORT = 13117
 BROADCAST_MAGIC_COOKIE = 0xabcddcba
 BROADCAST_MESSAGE_TYPE = 0x2
+# Optional offer extension, appended after the '>IB32sH' offer in answers to probes
+# (and in broadcasts if SERVER_EXTENDED_OFFERS): version, lobby state, lobby players, lobby capacity, games, max games
+BROADCAST_PROBE_TYPE = 0x3  # a client asks a server for a fresh offer, to measure the round trip time
+OFFER_FORMAT = '>IB32sH'
+OFFER_EXTENSION_FORMAT = '>BBHHHH'
+OFFER_EXTENSION_VERSION = 1
+OFFER_STATE_LOBBY_OPEN = 0
+OFFER_STATE_FULL = 1  # no room accepts players right now
 
 # Termination Signals
 CLIENT_NAME_TERMINATION = '\n'
@@ -16,14 +26,40 @@ SERVER_MSG_TERMINATION = '\0'
 CLIENT_NO_JOIN_TIMEOUT_SEC = 10
 SERVER_POST_GAME_OVER_DISCONNECT_TIMEOUT_SEC = 3
 MIN_TEAMS = 2
+MAX_TEAMS = 16
+SERVER_MAX_ROOMS = 32
 SERVER_NAME = 'NovaBeach'
 SERVER_NO_ANSWER_TIMEOUT_SEC = 20
-SERVER_BROADCAST_PERIOD_SEC = 1
+SERVER_BROADCAST_PERIOD_SEC = 1  # the first period after the burst of a new lobby, it doubles after every offer
+SERVER_OFFER_BURST_COUNT = 3  # offers sent as soon as a lobby opens
+SERVER_OFFER_BURST_INTERVAL_SEC = 0.1
+SERVER_OFFER_MAX_PERIOD_SEC = 8
+SERVER_LISTEN_ADDRESS = '0.0.0.0'  # all the interfaces
 ROUND_PAUSE_SEC = 1
+SERVER_MAX_CLIENT_BACKLOG_BYTES = 64 * 1024
+SERVER_SLOW_CLIENT_POLICY = 'disconnect'  # 'disconnect' or 'disqualify'
+SERVER_METRICS_PORT = 0  # Prometheus metrics on localhost, 0 for any free port, negative to disable
+SERVER_METRICS_UNIX_SOCKET = None  # serve the metrics on this UNIX socket instead of a port
+SERVER_TRACE_PATH = None  # write a Chrome trace of the games to this file
+SERVER_PORT = 0  # 0 for any free port
+SERVER_REUSE_PORT = False  # share the port with other server processes (set for the workers of a supervisor)
+SERVER_BROADCAST_OFFERS = True  # a supervisor sends the offers itself, its workers do not
+SERVER_PERSISTENT_SESSIONS = False  # keep the players connected after a game and move them to the next lobby
+SERVER_RESUME_GRACE_SEC = 10  # the seat of a dropped player is kept this long for it to resume, 0 to disable
+SERVER_HEARTBEAT_TIMEOUT_SEC = 6  # clients that sent heartbeats are dropped after this long without any data
+SERVER_LIVENESS_TICK_SEC = 0.5
+SERVER_TCP_KEEPALIVE_IDLE_SEC = 10
+SERVER_TCP_KEEPALIVE_INTERVAL_SEC = 5
+SERVER_TCP_KEEPALIVE_COUNT = 3
+SERVER_EXTENDED_OFFERS = False  # clients before the offer extension only accept offers of exactly 39 bytes
+SERVER_COALESCE_WRITES = True  # write the messages of a round phase to a client at once, not one by one
+SERVER_QUESTION_IDS = True  # send questions by id to the clients that report a question cache
+SERVER_MAX_QUESTION_CACHE_SIZE = 65536  # larger client caches are mirrored up to this size
+SUPERVISOR_RESTART_DELAY_SEC = 1
+SUPERVISOR_STATS_PERIOD_SEC = 30
 TRUE_ANSWERS = ['Y', 'T', '1']
 FALSE_ANSWERS = ['N', 'F', '0']
 MIN_ROUNDS = 3
-GOOGLE_ADDRESS = ('8.8.8.8', 80)
 
 # Message Types
 WELCOME_MESSAGE = '[W]'
@@ -31,6 +67,24 @@ ERROR_MESSAGE = '[E]'
 QUESTION_MESSAGE = '[Q]'
 GENERAL_MESSAGE = '[G]'
 GAME_OVER_MESSAGE = '[GO]'
+SESSION_MESSAGE = '[S]'  # JSON with the session settings of the player, sent before the welcome message
+
+# Binary Protocol
+PROTOCOL_VERSION = 1
+FRAME_MAX_PAYLOAD_SIZE = 65536
+WELCOME_FRAME = 1
+ERROR_FRAME = 2
+QUESTION_FRAME = 3
+GENERAL_FRAME = 4
+GAME_OVER_FRAME = 5
+SESSION_FRAME = 6
+QUESTION_ID_FRAME = 7  # a question by id, followed by its text if the client may not have it
+NAME_FRAME = 16
+ANSWER_FRAME = 17
+RESUME_FRAME = 18  # sent instead of the name, with the resumption token of a dropped connection
+HEARTBEAT_FRAME = 19  # empty, sent by clients every CLIENT_HEARTBEAT_INTERVAL_SEC
+QUESTION_CACHE_FRAME = 20  # JSON with the question bank and the cached question ids of the client, after the name
+QUESTION_REQUEST_FRAME = 21  # the id of a question sent without its text that the client does not have
 
 # Client / Bot Consts
 CLIENT_STATE_LOOKING_FOR_SERVER = 'looking_for_server'
@@ -141,7 +195,18 @@ BOT_LEVELS = {'a':0.8, 'b': 0.65, 'c':0.4, 'd':0.15}
 MIN_BOT_ID = 1
 MAX_BOT_ID = 9999999999
 BOT_NAME_FORMAT = 'BOT_#{id}'
-CLIENT_INPUT_REFRESH_SEC = 0.1
+CLIENT_INPUT_REFRESH_SEC = 0.1  # how often the keyboard is checked on Windows, elsewhere input is not polled
+CLIENT_BINARY_PROTOCOL = True
+CLIENT_RESUME_ATTEMPTS = 3  # attempts to resume a dropped session before looking for a server again
+CLIENT_RESUME_RETRY_SEC = 0.5
+CLIENT_HEARTBEAT_INTERVAL_SEC = 2  # keep below SERVER_HEARTBEAT_TIMEOUT_SEC
+CLIENT_QUESTION_CACHE_SIZE = 1024  # texts of questions received by id, kept for later games on the same server
+CLIENT_DISCOVERY_WINDOW_SEC = 0.5  # offers are collected for this long after the first one
+CLIENT_OFFER_TTL_SEC = 10  # servers not heard from for this long are forgotten
+CLIENT_RTT_RESOLUTION_SEC = 0.005  # servers closer than this are ranked by their free seats
+SWARM_REPORT_PERIOD_SEC = 5
+SWARM_RECONNECT_DELAY_SEC = 0.5
+SWARM_DEFAULT_THINK_TIME = 'uniform:0.2:2'
 PLAYER_TYPE = 'p'
 BOT_TYPE = 'b'
 
@@ -154,8 +219,17 @@ COLOR_BLUE = "\033[94m"
 COLOR_MAGENTA = "\033[95m"
 COLOR_CYAN = "\033[96m"
 
+# Question Bank (None for the built-in questions, or a .json / .csv / .db / .pack file)
+QUESTION_BANK_PATH = None
+
 # STATS 
-FILE_PATH_WINS = 'NovaBeach_Champs.json'
+FILE_PATH_WINS = 'NovaBeach_Champs.json'  # snapshot of the wins of a server process
+FILE_PATH_WINS_JOURNAL = 'NovaBeach_Champs.journal'  # wins recorded since the last snapshot
+STATS_JOURNAL_FSYNC_INTERVAL_SEC = 0.5
+STATS_COMPACT_EVERY_WINS = 1000
+STATS_MERGE_INTERVAL_SEC = 1.0  # how often the wins of other server processes are merged
+STATS_PODIUM_PAGE_SIZE = 20  # players listed in the full rank after each game
+LATENCY_HISTOGRAM_MAX_SEC = 3600  # longer durations are recorded as this
 PODIUM_STR = '''
 NovaBeach Server All-Time Winners Podium:
 
@@ -172,7 +246,54 @@ May the odds be ever in your favor!
 
 
 
-Full players rank:
+Players rank:
 
 {}
 '''
+
+
+def parse_bool(value: str) -> bool:
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+# Overrides from the environment, e.g. TRIVIAKING_ROUND_PAUSE_SEC=0 (used by the benchmarks)
+OVERRIDABLE_CONSTANTS = {
+    'ROUND_PAUSE_SEC': float,
+    'SERVER_POST_GAME_OVER_DISCONNECT_TIMEOUT_SEC': float,
+    'CLIENT_NO_JOIN_TIMEOUT_SEC': float,
+    'SERVER_NO_ANSWER_TIMEOUT_SEC': float,
+    'SERVER_BROADCAST_PERIOD_SEC': float,
+    'SERVER_OFFER_BURST_COUNT': int,
+    'SERVER_OFFER_BURST_INTERVAL_SEC': float,
+    'SERVER_OFFER_MAX_PERIOD_SEC': float,
+    'SERVER_LISTEN_ADDRESS': str,
+    'MIN_TEAMS': int,
+    'MAX_TEAMS': int,
+    'SERVER_MAX_ROOMS': int,
+    'SERVER_MAX_CLIENT_BACKLOG_BYTES': int,
+    'SERVER_SLOW_CLIENT_POLICY': str,
+    'SERVER_METRICS_PORT': int,
+    'SERVER_METRICS_UNIX_SOCKET': str,
+    'SERVER_TRACE_PATH': str,
+    'SERVER_PORT': int,
+    'SERVER_REUSE_PORT': parse_bool,
+    'SERVER_BROADCAST_OFFERS': parse_bool,
+    'SERVER_PERSISTENT_SESSIONS': parse_bool,
+    'SERVER_RESUME_GRACE_SEC': float,
+    'SERVER_HEARTBEAT_TIMEOUT_SEC': float,
+    'SERVER_LIVENESS_TICK_SEC': float,
+    'CLIENT_HEARTBEAT_INTERVAL_SEC': float,
+    'SERVER_EXTENDED_OFFERS': parse_bool,
+    'SERVER_QUESTION_IDS': parse_bool,
+    'SERVER_COALESCE_WRITES': parse_bool,
+    'CLIENT_DISCOVERY_WINDOW_SEC': float,
+    'SUPERVISOR_RESTART_DELAY_SEC': float,
+    'SUPERVISOR_STATS_PERIOD_SEC': float,
+    'QUESTION_BANK_PATH': str,
+    'STATS_JOURNAL_FSYNC_INTERVAL_SEC': float,
+    'STATS_COMPACT_EVERY_WINS': int,
+    'STATS_MERGE_INTERVAL_SEC': float,
+}
+for _name, _type in OVERRIDABLE_CONSTANTS.items():
+    if f'TRIVIAKING_{_name}' in os.environ:
+        globals()[_name] = _type(os.environ[f'TRIVIAKING_{_name}'])
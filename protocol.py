@@ -0,0 +1,284 @@
+import collections
+import json
+import struct
+
+import constants as c
+
+# Frame header: protocol version, frame type, payload length (big-endian)
+FRAME_HEADER = struct.Struct('>BBI')
+
+TEXT_TAGS_TO_FRAMES = {
+    c.WELCOME_MESSAGE: c.WELCOME_FRAME,
+    c.ERROR_MESSAGE: c.ERROR_FRAME,
+    c.QUESTION_MESSAGE: c.QUESTION_FRAME,
+    c.GENERAL_MESSAGE: c.GENERAL_FRAME,
+    c.GAME_OVER_MESSAGE: c.GAME_OVER_FRAME,
+    c.SESSION_MESSAGE: c.SESSION_FRAME,
+}
+FRAMES_TO_TEXT_TAGS = {frame: tag for tag, frame in TEXT_TAGS_TO_FRAMES.items()}
+
+
+class ProtocolError(ValueError):
+    pass
+
+
+def encode_frame(frame_type: int, payload: str) -> bytes:
+    """
+    Encodes a single length-prefixed binary frame.
+
+    Args:
+        frame_type (int): The numeric type of the frame.
+        payload (str): The content of the frame.
+
+    Returns:
+        bytes: The header followed by the UTF-8 payload.
+    """
+    data = payload.encode()
+    return FRAME_HEADER.pack(c.PROTOCOL_VERSION, frame_type, len(data)) + data
+
+
+def encode_message(message_type: str, message: str, binary: bool) -> bytes:
+    """
+    Encodes a server message in the protocol spoken by the client.
+
+    Args:
+        message_type (str): The text tag of the message (e.g. c.QUESTION_MESSAGE).
+        message (str): The content of the message.
+        binary (bool): True for a binary frame, False for the '\\0' terminated text protocol.
+
+    Returns:
+        bytes: The encoded message.
+    """
+    if binary:
+        return encode_frame(TEXT_TAGS_TO_FRAMES[message_type], message)
+    return (message_type + message + c.SERVER_MSG_TERMINATION).encode()
+
+
+def encode_name(name: str, binary: bool) -> bytes:
+    """
+    Encodes the first message a client sends, its name.
+    A binary name frame starts with the protocol version byte, which lets the server tell both protocols apart.
+    """
+    if binary:
+        return encode_frame(c.NAME_FRAME, name)
+    return (name + c.CLIENT_NAME_TERMINATION).encode()
+
+
+def encode_resume(token: str) -> bytes:
+    """
+    Encodes the first message of a client resuming a dropped session, sent instead of its name.
+    Only the binary protocol can resume sessions.
+    """
+    return encode_frame(c.RESUME_FRAME, token)
+
+
+def encode_heartbeat() -> bytes:
+    """
+    Encodes a heartbeat of a client, which tells the server that the connection is alive. Binary protocol only.
+    """
+    return encode_frame(c.HEARTBEAT_FRAME, '')
+
+
+def encode_question_id(question_id: int, question: str = None) -> bytes:
+    """
+    Encodes a question sent by id, to a client that reported its question cache. Binary protocol only.
+
+    Args:
+        question_id (int): The id of the question in the server's bank.
+        question (str): The text of the question, None if the client has it.
+    """
+    if question is None:
+        return encode_frame(c.QUESTION_ID_FRAME, str(question_id))
+    return encode_frame(c.QUESTION_ID_FRAME, f'{question_id}\n{question}')
+
+
+def parse_question_id(payload: str) -> tuple[int, str]:
+    """
+    Parses the payload of a question sent by id.
+
+    Returns:
+        tuple[int, str]: The id of the question, and its text or None if it was sent without it.
+    """
+    question_id, separator, question = payload.partition('\n')
+    try:
+        return int(question_id), question if separator else None
+    except ValueError:
+        raise ProtocolError(f"Invalid question id: {question_id}")
+
+
+def encode_question_cache(bank: str, cache: 'QuestionCache') -> bytes:
+    """
+    Encodes the report a client sends after its name, so the server sends it questions by id.
+
+    Args:
+        bank (str): The fingerprint of the client's question bank.
+        cache (QuestionCache): The texts of questions the client received by id.
+    """
+    report = {'bank': bank, 'cache': cache.bank, 'capacity': cache.capacity, 'ids': cache.ids()}
+    return encode_frame(c.QUESTION_CACHE_FRAME, json.dumps(report, separators=(',', ':')))
+
+
+def encode_question_request(question_id: int) -> bytes:
+    """
+    Encodes the request of a client for the text of a question it received by id only.
+    """
+    return encode_frame(c.QUESTION_REQUEST_FRAME, str(question_id))
+
+
+def encode_answer(answer: str, binary: bool) -> bytes:
+    """
+    Encodes a client's answer.
+    """
+    if binary:
+        return encode_frame(c.ANSWER_FRAME, answer)
+    return answer.encode()
+
+
+def is_binary_hello(data: bytes) -> bool:
+    """
+    Checks if the first bytes received from a client start a binary frame.
+
+    Args:
+        data (bytes): The first bytes received on the connection.
+
+    Returns:
+        bool: True if the client speaks the binary protocol, False for the text protocol.
+    """
+    return len(data) > 0 and data[0] == c.PROTOCOL_VERSION
+
+
+class FrameDecoder:
+    """
+    Incremental decoder of binary frames.
+    Bytes are fed as they arrive, any number of complete frames is returned per call,
+    and an incomplete frame stays buffered until the rest of it arrives.
+    """
+    def __init__(self):
+        self.buffer: bytearray = bytearray()
+
+    def feed(self, data: bytes) -> list[tuple[int, str]]:
+        """
+        Feeds received bytes to the decoder.
+
+        Args:
+            data (bytes): The bytes received from the socket.
+
+        Returns:
+            list[tuple[int, str]]: The (frame type, payload) of every frame completed by the data.
+        """
+        buffer = self.buffer
+        buffer += data
+        frames = []
+        offset = 0
+        with memoryview(buffer) as view:
+            while len(buffer) - offset >= FRAME_HEADER.size:
+                version, frame_type, length = FRAME_HEADER.unpack_from(buffer, offset)
+                if version != c.PROTOCOL_VERSION:
+                    raise ProtocolError(f"Unsupported protocol version {version}")
+                if length > c.FRAME_MAX_PAYLOAD_SIZE:
+                    raise ProtocolError(f"Frame of {length} bytes exceeds the maximum payload size")
+                start = offset + FRAME_HEADER.size
+                end = start + length
+                if end > len(buffer):
+                    break
+                frames.append((frame_type, str(view[start:end], 'utf-8', 'replace')))
+                offset = end
+        if offset:
+            del buffer[:offset]
+        return frames
+
+
+class QuestionCache:
+    """
+    Bounded LRU of the questions a client received by id, for the questions of a single bank.
+
+    The client keeps the texts, and the server keeps a mirror of it for every client, with the same capacity and
+    without the texts. Both apply the same operations in the order the questions were sent, so the server knows
+    which questions the client has and sends them by id only.
+    """
+    def __init__(self, capacity: int, bank: str = None):
+        """
+        Args:
+            capacity (int): The maximum number of questions in the cache.
+            bank (str): The fingerprint of the bank the ids belong to.
+        """
+        self.capacity: int = capacity
+        self.bank: str = bank
+        self.entries: collections.OrderedDict = collections.OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def reset(self, bank: str) -> None:
+        """
+        Empties the cache for the questions of another bank.
+        """
+        self.bank = bank
+        self.entries.clear()
+
+    def get(self, question_id: int):
+        """
+        Returns:
+            The text of the question (True in the mirror of the server), or None if it is not in the cache.
+        """
+        entry = self.entries.get(question_id)
+        if entry is not None:
+            self.entries.move_to_end(question_id)
+        return entry
+
+    def put(self, question_id: int, entry) -> None:
+        """
+        Adds a question, evicting the least recently used one if the cache is full.
+        """
+        self.entries[question_id] = entry
+        self.entries.move_to_end(question_id)
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    def ids(self) -> list[int]:
+        """
+        Returns:
+            list[int]: The ids in the cache, from the least to the most recently used.
+        """
+        return list(self.entries)
+
+
+class TextDecoder:
+    """
+    Incremental decoder of the '\\0' terminated text protocol.
+    Messages (and multi-byte characters) split between two reads are kept until they are complete.
+    Returns the same (frame type, payload) pairs as FrameDecoder.
+    """
+    def __init__(self):
+        self.buffer: bytearray = bytearray()
+        self.terminator: bytes = c.SERVER_MSG_TERMINATION.encode()
+
+    def feed(self, data: bytes) -> list[tuple[int, str]]:
+        """
+        Feeds received bytes to the decoder.
+
+        Args:
+            data (bytes): The bytes received from the socket.
+
+        Returns:
+            list[tuple[int, str]]: The (frame type, payload) of every message completed by the data.
+                Messages with an unknown tag are dropped.
+        """
+        buffer = self.buffer
+        buffer += data
+        messages = []
+        start = 0
+        with memoryview(buffer) as view:
+            while True:
+                end = buffer.find(self.terminator, start)
+                if end == -1:
+                    break
+                message = str(view[start:end], 'utf-8', 'replace')
+                start = end + len(self.terminator)
+                tag_end = message.find(']') + 1
+                frame_type = TEXT_TAGS_TO_FRAMES.get(message[:tag_end])
+                if frame_type is not None:
+                    messages.append((frame_type, message[tag_end:]))
+        if start:
+            del buffer[:start]
+        return messages
@@ -0,0 +1,308 @@
+"""
+Question bank with stable integer question ids.
+
+Questions are loaded once from the built-in list (questions.py) or from an external
+JSON, CSV, SQLite or pack (see question_pack.py) file, de-duplicated by their text,
+and numbered 0..len-1 in the order they were first seen. A SQLite bank keeps the text on disk and reads single
+questions by id, so banks of millions of questions are not loaded into every process.
+
+Build a SQLite bank from a JSON or CSV file:
+    python question_bank.py questions.json questions.db
+"""
+import csv
+import json
+import os
+import random
+import sqlite3
+import sys
+import threading
+import zlib
+
+import constants as c
+
+
+def parse_answer(value) -> bool:
+    """
+    Parses an answer given as a bool, a number or a string like "true" / "F" / "1".
+    """
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)):
+        return bool(value)
+    value = str(value).strip().upper()
+    if value in ('TRUE', 'YES') or value in c.TRUE_ANSWERS:
+        return True
+    if value in ('FALSE', 'NO') or value in c.FALSE_ANSWERS:
+        return False
+    raise ValueError(f"Invalid answer: {value}")
+
+
+def deduplicate(questions):
+    """
+    Yields (question, answer) pairs, skipping questions whose text was already seen.
+    """
+    seen = set()
+    for question, answer in questions:
+        if question not in seen:
+            seen.add(question)
+            yield question, answer
+
+
+def fingerprint_crc(question: str, answer: bool, crc: int = 0) -> int:
+    """
+    Adds a question to the CRC-32 of a bank fingerprint, questions are added in id order.
+    """
+    return zlib.crc32(b'\0%s\0%d' % (question.encode(), answer), crc)
+
+
+def format_fingerprint(count: int, crc: int) -> str:
+    return f'{count}-{crc:08x}'
+
+
+def read_json_questions(path: str):
+    """
+    Reads questions from a JSON list of {"question": ..., "answer": ...} objects or [question, answer] pairs.
+    """
+    with open(path, encoding='utf-8') as file:
+        for item in json.load(file):
+            if isinstance(item, dict):
+                yield item['question'], parse_answer(item['answer'])
+            else:
+                yield item[0], parse_answer(item[1])
+
+
+def read_csv_questions(path: str):
+    """
+    Reads questions from a CSV file with "question" and "answer" columns.
+    """
+    with open(path, encoding='utf-8', newline='') as file:
+        for row in csv.DictReader(file):
+            yield row['question'], parse_answer(row['answer'])
+
+
+class QuestionSampler:
+    """
+    Draws question ids of a single game without repeats, in O(1) per draw.
+
+    This is a lazy Fisher-Yates shuffle: only the positions that were swapped are stored,
+    so a game over a bank of millions of questions needs memory for its drawn questions only.
+    Once every question was drawn, a new permutation is started.
+    """
+    def __init__(self, size: int, rng: random.Random = random):
+        if size <= 0:
+            raise ValueError("Cannot sample from an empty question bank")
+        self.size: int = size
+        self.rng = rng
+        self.remaining: int = size
+        self.swapped: dict = {}
+
+    def draw(self) -> int:
+        """
+        Returns:
+            int: The id of a question that was not drawn yet in this permutation.
+        """
+        if self.remaining == 0:
+            self.remaining = self.size
+            self.swapped = {}
+        index = self.rng.randrange(self.remaining)
+        self.remaining -= 1
+        last = self.remaining
+        question_id = self.swapped.get(index, index)
+        # move the last undrawn id into the drawn slot
+        self.swapped[index] = self.swapped.pop(last, last)
+        return question_id
+
+
+class QuestionBank:
+    """
+    Base class of the question banks.
+    """
+    cached_fingerprint: str = None
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def get(self, question_id: int) -> tuple[str, bool]:
+        """
+        Args:
+            question_id (int): The id of the question.
+
+        Returns:
+            tuple[str, bool]: The question and its answer.
+        """
+        raise NotImplementedError
+
+    def find_id(self, question: str):
+        """
+        Args:
+            question (str): The text of a question.
+
+        Returns:
+            int: The id of the question, or None if it is not in the bank.
+        """
+        raise NotImplementedError
+
+    def find_answer(self, question: str):
+        """
+        Returns:
+            bool: The answer of the question, or None if it is not in the bank.
+        """
+        question_id = self.find_id(question)
+        return None if question_id is None else self.get(question_id)[1]
+
+    def fingerprint(self) -> str:
+        """
+        Identifies the questions of the bank and their ids, whatever file they were loaded from, so a server
+        and a client can tell if they number the same questions the same way. SQLite banks and packs store it
+        when they are built, other banks compute it on the first call (reading every question).
+
+        Returns:
+            str: The number of questions and the CRC-32 of the questions and answers in id order.
+        """
+        if self.cached_fingerprint is None:
+            crc = 0
+            for question_id in range(len(self)):
+                crc = fingerprint_crc(*self.get(question_id), crc)
+            self.cached_fingerprint = format_fingerprint(len(self), crc)
+        return self.cached_fingerprint
+
+    def sampler(self, rng: random.Random = random) -> QuestionSampler:
+        """
+        Returns:
+            QuestionSampler: A sampler of question ids without repeats, for a single game.
+        """
+        return QuestionSampler(len(self), rng)
+
+
+class MemoryQuestionBank(QuestionBank):
+    """
+    A question bank held in memory, for the built-in list and small JSON / CSV files.
+    """
+    def __init__(self, questions):
+        self.questions: list[tuple[str, bool]] = list(deduplicate(questions))
+        self.ids: dict[str, int] = {question: i for i, (question, _) in enumerate(self.questions)}
+
+    def __len__(self) -> int:
+        return len(self.questions)
+
+    def get(self, question_id: int) -> tuple[str, bool]:
+        return self.questions[question_id]
+
+    def find_id(self, question: str):
+        return self.ids.get(question)
+
+
+class SQLiteQuestionBank(QuestionBank):
+    """
+    A question bank stored in a SQLite file, reading single questions by id on demand.
+    The file is expected to be built by build_sqlite_bank, with ids 0..len-1, and a metadata table holding
+    the fingerprint of the bank.
+    """
+    def __init__(self, path: str):
+        self.connection = sqlite3.connect(f'file:{path}?mode=ro', uri=True, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.size: int = self.connection.execute('SELECT COUNT(*) FROM questions').fetchone()[0]
+
+    def __len__(self) -> int:
+        return self.size
+
+    def get(self, question_id: int) -> tuple[str, bool]:
+        with self.lock:
+            row = self.connection.execute('SELECT question, answer FROM questions WHERE id = ?',
+                                          (question_id,)).fetchone()
+        if row is None:
+            raise IndexError(f"No question with id {question_id}")
+        return row[0], bool(row[1])
+
+    def find_id(self, question: str):
+        with self.lock:
+            row = self.connection.execute('SELECT id FROM questions WHERE question = ?', (question,)).fetchone()
+        return None if row is None else row[0]
+
+    def fingerprint(self) -> str:
+        if self.cached_fingerprint is None:
+            try:
+                with self.lock:
+                    row = self.connection.execute("SELECT value FROM metadata WHERE key = 'fingerprint'").fetchone()
+            except sqlite3.OperationalError:
+                # built before the metadata table existed
+                row = None
+            if row is None:
+                return super().fingerprint()
+            self.cached_fingerprint = row[0]
+        return self.cached_fingerprint
+
+
+def build_sqlite_bank(questions, path: str) -> int:
+    """
+    Writes de-duplicated questions to a new SQLite bank.
+
+    Args:
+        questions: An iterable of (question, answer) pairs.
+        path (str): The path of the SQLite file to create.
+
+    Returns:
+        int: The number of questions written.
+    """
+    if os.path.exists(path):
+        os.remove(path)
+    crc = 0
+
+    def rows():
+        nonlocal crc
+        for i, (question, answer) in enumerate(deduplicate(questions)):
+            crc = fingerprint_crc(question, answer, crc)
+            yield i, question, int(answer)
+
+    connection = sqlite3.connect(path)
+    with connection:
+        connection.execute('CREATE TABLE questions (id INTEGER PRIMARY KEY, question TEXT NOT NULL UNIQUE, '
+                           'answer INTEGER NOT NULL)')
+        connection.execute('CREATE TABLE metadata (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+        connection.executemany('INSERT INTO questions VALUES (?, ?, ?)', rows())
+        count = connection.execute('SELECT COUNT(*) FROM questions').fetchone()[0]
+        connection.execute("INSERT INTO metadata VALUES ('fingerprint', ?)", (format_fingerprint(count, crc),))
+    connection.close()
+    return count
+
+
+def read_questions(path: str):
+    """
+    Reads (question, answer) pairs from a JSON or CSV file.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.json':
+        return read_json_questions(path)
+    if extension == '.csv':
+        return read_csv_questions(path)
+    raise ValueError(f"Unsupported question file: {path}")
+
+
+def load_question_bank(path: str = None) -> QuestionBank:
+    """
+    Loads a question bank.
+
+    Args:
+        path (str): A .json, .csv, .db, .sqlite or .pack file. Defaults to the built-in questions.
+
+    Returns:
+        QuestionBank: The loaded bank.
+    """
+    if not path:
+        from questions import QUESTIONS
+        return MemoryQuestionBank(QUESTIONS)
+    extension = os.path.splitext(path)[1].lower()
+    if extension in ('.db', '.sqlite'):
+        return SQLiteQuestionBank(path)
+    if extension == '.pack':
+        from question_pack import PackQuestionBank
+        return PackQuestionBank(path)
+    return MemoryQuestionBank(read_questions(path))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print("Usage: python question_bank.py <questions.json|questions.csv> <bank.db>")
+        sys.exit(1)
+    count = build_sqlite_bank(read_questions(sys.argv[1]), sys.argv[2])
+    print(f"Wrote {count} questions to {sys.argv[2]}")
@@ -0,0 +1,157 @@
+"""
+Compact, memory-mapped question pack.
+
+A pack is a single read-only file that the server and the clients map into memory.
+Single questions are read by id without parsing the whole file, and the pages of the
+mapping are shared by all processes that use the same pack.
+
+Layout (all integers little-endian):
+    header          magic b'TKQP', version (u16), reserved (u16), question count (u32), hash table size (u32),
+                    CRC-32 of the bank fingerprint (u32, since version 2)
+    offsets         count + 1 u32 offsets of the questions in the text blob
+    hash table      table size u32 slots of question id + 1 (0 for empty), keyed by crc32 of the question text
+    answers         bitset of ceil(count / 8) bytes, bit i is the answer of question i
+    text blob       the UTF-8 questions, back to back
+
+Build a pack from the built-in questions, or from a JSON / CSV file:
+    python question_pack.py questions.pack
+    python question_pack.py --input questions.json questions.pack
+"""
+import argparse
+import mmap
+import struct
+import zlib
+
+from question_bank import QuestionBank, deduplicate, fingerprint_crc, format_fingerprint, read_questions
+
+PACK_MAGIC = b'TKQP'
+PACK_VERSION = 2
+PACK_HEADER = struct.Struct('<4sHHIII')
+# version 1 packs have no fingerprint, it is computed from their questions when needed
+PACK_HEADER_V1 = struct.Struct('<4sHHII')
+UINT32 = struct.Struct('<I')
+
+
+def hash_table_size(count: int) -> int:
+    """
+    Returns:
+        int: The smallest power of two that keeps the hash table at most half full.
+    """
+    size = 1
+    while size < 2 * count:
+        size *= 2
+    return size
+
+
+def build_pack(questions, path: str) -> int:
+    """
+    Writes de-duplicated questions to a new pack file.
+
+    Args:
+        questions: An iterable of (question, answer) pairs.
+        path (str): The path of the pack to create.
+
+    Returns:
+        int: The number of questions written.
+    """
+    texts = []
+    answers = bytearray()
+    offsets = [0]
+    crc = 0
+    for i, (question, answer) in enumerate(deduplicate(questions)):
+        crc = fingerprint_crc(question, answer, crc)
+        text = question.encode()
+        texts.append(text)
+        offsets.append(offsets[-1] + len(text))
+        if i % 8 == 0:
+            answers.append(0)
+        if answer:
+            answers[i // 8] |= 1 << (i % 8)
+    count = len(texts)
+    if offsets[-1] > 0xFFFFFFFF:
+        raise ValueError("Question texts exceed the 4 GiB a pack can hold")
+
+    table_size = hash_table_size(count)
+    table = [0] * table_size
+    for question_id, text in enumerate(texts):
+        slot = zlib.crc32(text) & (table_size - 1)
+        while table[slot]:
+            slot = (slot + 1) & (table_size - 1)
+        table[slot] = question_id + 1
+
+    with open(path, 'wb') as file:
+        file.write(PACK_HEADER.pack(PACK_MAGIC, PACK_VERSION, 0, count, table_size, crc))
+        file.write(struct.pack(f'<{count + 1}I', *offsets))
+        file.write(struct.pack(f'<{table_size}I', *table))
+        file.write(answers)
+        for text in texts:
+            file.write(text)
+    return count
+
+
+class PackQuestionBank(QuestionBank):
+    """
+    A question bank reading questions straight from a memory-mapped pack.
+    """
+    def __init__(self, path: str):
+        with open(path, 'rb') as file:
+            self.pack = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, self.count, self.table_size = PACK_HEADER_V1.unpack_from(self.pack, 0)
+        if magic != PACK_MAGIC or version not in (1, PACK_VERSION):
+            raise ValueError(f"{path} is not a version 1 or {PACK_VERSION} question pack")
+        if version == 1:
+            self.offsets_start = PACK_HEADER_V1.size
+        else:
+            crc = PACK_HEADER.unpack_from(self.pack, 0)[-1]
+            self.cached_fingerprint = format_fingerprint(self.count, crc)
+            self.offsets_start = PACK_HEADER.size
+        self.table_start = self.offsets_start + UINT32.size * (self.count + 1)
+        self.answers_start = self.table_start + UINT32.size * self.table_size
+        self.blob_start = self.answers_start + (self.count + 7) // 8
+
+    def __len__(self) -> int:
+        return self.count
+
+    def text_bytes(self, question_id: int) -> bytes:
+        if not 0 <= question_id < self.count:
+            raise IndexError(f"No question with id {question_id}")
+        start, = UINT32.unpack_from(self.pack, self.offsets_start + UINT32.size * question_id)
+        end, = UINT32.unpack_from(self.pack, self.offsets_start + UINT32.size * (question_id + 1))
+        return self.pack[self.blob_start + start:self.blob_start + end]
+
+    def answer(self, question_id: int) -> bool:
+        return bool(self.pack[self.answers_start + question_id // 8] >> (question_id % 8) & 1)
+
+    def get(self, question_id: int) -> tuple[str, bool]:
+        return self.text_bytes(question_id).decode(), self.answer(question_id)
+
+    def find_id(self, question: str):
+        text = question.encode()
+        mask = self.table_size - 1
+        slot = zlib.crc32(text) & mask
+        while True:
+            entry, = UINT32.unpack_from(self.pack, self.table_start + UINT32.size * slot)
+            if entry == 0:
+                return None
+            if self.text_bytes(entry - 1) == text:
+                return entry - 1
+            slot = (slot + 1) & mask
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build a question pack.')
+    parser.add_argument('output', help='path of the pack to write')
+    parser.add_argument('--input', default=None,
+                        help='a .json or .csv question file, defaults to the built-in questions')
+    args = parser.parse_args()
+    if args.input:
+        questions = read_questions(args.input)
+    else:
+        from questions import QUESTIONS
+        questions = QUESTIONS
+    count = build_pack(questions, args.output)
+    print(f"Wrote {count} questions to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,544 +1,1021 @@
-import socket
-import threading
-import struct
+import asyncio
+import collections
+import itertools
+import json
+import secrets
 import time
-import random
-import select
 
-from questions import QUESTIONS
 import constants as c
+import engine
+import fanout
+import liveness
+import metrics
+import offers
+import protocol
+import question_bank
 import statistic as stats
+import tracing
 
 
-GAME_RUNNING = False
-SENT_QUESTION_CONDITION: threading.Condition = threading.Condition()
-SENT_QUESTION: bool = False
-WAIT_FOR_ANSWERS_CONDITION: threading.Condition = threading.Condition()
-ANSWERS_CHECKED_CONDITION: threading.Condition = threading.Condition()
-ANSWERS_CHECKED: bool = False
-
 # init the class stats
 server_stats = stats.Statistic()
+# questions are loaded once, every game samples its own order
+QUESTION_BANK = question_bank.load_question_bank(c.QUESTION_BANK_PATH)
+# counters exported by the metrics endpoint
+server_metrics = metrics.Metrics()
+# players whose session can be resumed on a new connection, by resumption token
+resumable_sessions: dict[str, 'ClientHandler'] = {}
+# deadlines of the clients that send heartbeats, a client silent for SERVER_HEARTBEAT_TIMEOUT_SEC is dropped
+heartbeat_wheel = liveness.TimerWheel(c.SERVER_HEARTBEAT_TIMEOUT_SEC, c.SERVER_LIVENESS_TICK_SEC,
+                                      lambda handler: handler.on_heartbeat_timeout())
 
 class ClientHandler:
-    def __init__(self, client_socket: socket.socket):
-        self.socket: socket.socket = client_socket
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader: asyncio.StreamReader = reader
+        self.writer: asyncio.StreamWriter = writer
         self.name: str = None
+        self.room: 'GameRoom' = None
+        # protocol spoken by the client, detected from its first message
+        self.binary: bool = False
+        self.decoder: protocol.FrameDecoder = protocol.FrameDecoder()
+        self.pending_frames: collections.deque = collections.deque()
+        self.outbound: fanout.OutboundQueue = fanout.OutboundQueue(writer)
+        self.answer_task: asyncio.Task = None
+        self.trace_lane: int = 0
+        self.resume_token: str = None
+        self.connection_id: int = 0  # incremented whenever the session moves to a new connection
+        self.resumed: asyncio.Event = asyncio.Event()
+        self.expire_handle: asyncio.TimerHandle = None  # set while the connection dropped and the seat is kept
+        self.answers: asyncio.Queue = asyncio.Queue()  # answers read by read_loop, '' when the connection ended
+        self.sends_heartbeats: bool = False
+        self.read_task: asyncio.Task = None
+        # mirror of the client's question cache, None while the client takes questions by text
+        self.question_cache: protocol.QuestionCache = None
+        self.has_question_bank: bool = False  # the client numbers the questions like the server
         self.reset_state()
+        server_metrics.handlers.add(self)
+
+    async def receive_hello(self) -> str:
+        """
+        Receives the first message of the client: its name, or the resumption token of a session whose connection dropped.
+        A first message sent as a binary frame switches the client to the binary protocol, otherwise the text protocol is used.
 
-    def receive_name(self):
+        Returns:
+            str: The resumption token if the client resumes a session, otherwise None and the name is set.
+        """
+        message = await self.reader.read(c.CLIENT_NAME_PACKET_SIZE)
+        if protocol.is_binary_hello(message):
+            self.binary = True
+            try:
+                self.pending_frames.extend(self.decoder.feed(message))
+                while not self.pending_frames:
+                    data = await self.reader.read(c.CLIENT_NAME_PACKET_SIZE)
+                    if not data:
+                        break
+                    self.pending_frames.extend(self.decoder.feed(data))
+            except protocol.ProtocolError as e:
+                print(f"{c.COLOR_RED}Invalid first frame: {e}{c.COLOR_RESET}")
+                self.writer.close()
+                return None
+            if self.pending_frames and self.pending_frames[0][0] == c.RESUME_FRAME:
+                return self.pending_frames.popleft()[1]
+        await self.receive_name(message)
+        return None
+
+    async def receive_name(self, message: bytes):
         """
         Receives the client's name from the socket connection.
 
         This method receives the client's name from the socket connection and sets it as the name attribute of the class instance.
 
+        Args:
+            message (bytes): The first message of the client.
+
         Returns:
             None
         """
         # get client name
-        message = self.socket.recv(c.CLIENT_NAME_PACKET_SIZE).decode()
-        self.name = message.split(c.CLIENT_NAME_TERMINATION)[0]
+        if self.binary:
+            try:
+                self.name = await self.receive_frame(c.NAME_FRAME)
+            except protocol.ProtocolError as e:
+                print(f"{c.COLOR_RED}Invalid name frame: {e}{c.COLOR_RESET}")
+                self.writer.close()
+                self.name = None
+        else:
+            self.name = message.decode(errors='replace').split(c.CLIENT_NAME_TERMINATION)[0]
         print(f"{c.COLOR_GREEN}{self.name} connected!{c.COLOR_RESET}")
+        self.trace_lane = tracing.new_lane(f'Player {self.name}')
+        tracing.instant('connected', self.trace_lane, binary=self.binary)
+
+    async def receive_frame(self, frame_type: int) -> str:
+        """
+        Receives the next binary frame of the given type, skipping frames of other types.
+
+        Args:
+            frame_type (int): The type of the expected frame.
+
+        Returns:
+            str: The payload of the frame, or an empty string if the client disconnected.
+        """
+        while True:
+            while not self.pending_frames:
+                data = await self.reader.read(c.CLIENT_NAME_PACKET_SIZE)
+                if not data:
+                    return ''
+                self.pending_frames.extend(self.decoder.feed(data))
+            received_type, payload = self.pending_frames.popleft()
+            if received_type == frame_type:
+                return payload
+
+    async def receive_answer(self) -> str:
+        """
+        Receives a single answer from the client, in the protocol it speaks.
+
+        Returns:
+            str: The answer, or an empty string if the client disconnected.
+        """
+        return await self.answers.get()
+
+    def start_reading(self) -> None:
+        """
+        Starts reading the connection in the background, once the client sent its name or resumed its session.
+        """
+        self.read_task = asyncio.create_task(self.read_loop(self.reader, self.connection_id))
+
+    async def read_loop(self, reader: asyncio.StreamReader, connection_id: int) -> None:
+        """
+        Reads everything the client sends on a connection: answers are queued for receive_answer, and any data
+        (heartbeats included) postpones the liveness deadline of a client that sends heartbeats.
+        The end of the connection is noticed as soon as it happens, whatever the client is doing.
+
+        Args:
+            reader (asyncio.StreamReader): The stream of the connection.
+            connection_id (int): The connection of the session this loop reads.
+        """
+        try:
+            while True:
+                # frames received along with the first message come first
+                while self.pending_frames:
+                    frame_type, payload = self.pending_frames.popleft()
+                    if frame_type == c.ANSWER_FRAME:
+                        self.answers.put_nowait(payload)
+                    elif frame_type == c.HEARTBEAT_FRAME:
+                        self.sends_heartbeats = True
+                    elif frame_type == c.QUESTION_CACHE_FRAME:
+                        self.set_question_cache(payload)
+                    elif frame_type == c.QUESTION_REQUEST_FRAME:
+                        self.send_question_text(payload)
+                if self.sends_heartbeats:
+                    heartbeat_wheel.touch(self)
+                data = await reader.read(c.CLIENT_NAME_PACKET_SIZE)
+                if not data:
+                    break
+                if self.binary:
+                    self.pending_frames.extend(self.decoder.feed(data))
+                else:
+                    # every byte of the text protocol is an answer
+                    for answer in data:
+                        self.answers.put_nowait(chr(answer))
+        except (ConnectionError, OSError, protocol.ProtocolError):
+            pass
+        if self.connection_id != connection_id:
+            # the session moved to a new connection, which has its own loop
+            return
+        heartbeat_wheel.remove(self)
+        self.answers.put_nowait('')
+        self.disconnect()
+
+    def set_question_cache(self, payload: str) -> None:
+        """
+        Starts sending questions by id to a client that reported its question bank and cache, see question_known.
+        Ignored if SERVER_QUESTION_IDS is off, and for reports after the first one.
+
+        Args:
+            payload (str): The JSON report of the client.
+        """
+        if not c.SERVER_QUESTION_IDS or self.question_cache is not None:
+            return
+        try:
+            report = json.loads(payload)
+            capacity = min(int(report['capacity']), c.SERVER_MAX_QUESTION_CACHE_SIZE)
+            fingerprint = QUESTION_BANK.fingerprint()
+            cache = protocol.QuestionCache(max(capacity, 0), fingerprint)
+            if report.get('cache') == fingerprint:
+                for question_id in report.get('ids', []):
+                    if isinstance(question_id, int) and 0 <= question_id < len(QUESTION_BANK):
+                        cache.put(question_id, True)
+        except (ValueError, TypeError, KeyError, AttributeError):
+            print(f"{c.COLOR_RED}Invalid question cache report from {self.name}{c.COLOR_RESET}")
+            return
+        # clients whose bank has the same fingerprint get every question by id only
+        self.has_question_bank = report.get('bank') == fingerprint
+        self.question_cache = cache
+
+    def question_known(self, question_id: int):
+        """
+        Tells if the client has the text of a question, and updates the mirror of its cache as the client
+        will once the question is sent.
+
+        Returns:
+            bool: True if the client has the question, False if it must be sent with its text,
+                None if the client takes questions by text only.
+        """
+        if self.question_cache is None:
+            return None
+        if self.has_question_bank or self.question_cache.get(question_id) is not None:
+            return True
+        self.question_cache.put(question_id, True)
+        return False
+
+    def send_question_text(self, payload: str) -> None:
+        """
+        Sends a question with its text to a client that received it by id but does not have it,
+        e.g. because the message that added it to the client's cache was lost with a dropped connection.
+
+        Args:
+            payload (str): The id of the question.
+        """
+        try:
+            question_id = int(payload)
+            question, _ = QUESTION_BANK.get(question_id)
+        except (ValueError, IndexError):
+            return
+        if self.question_cache is not None and not self.has_question_bank:
+            self.question_cache.put(question_id, True)
+        self.send_data(protocol.encode_question_id(question_id, question))
+
+    def on_heartbeat_timeout(self) -> None:
+        """
+        Drops the connection of a client that stopped sending heartbeats, which ends its read loop.
+        """
+        print(f"{c.COLOR_RED}No heartbeat from {self.name} for {c.SERVER_HEARTBEAT_TIMEOUT_SEC} seconds.{c.COLOR_RESET}")
+        tracing.instant('heartbeat timeout', self.trace_lane)
+        server_metrics.heartbeat_timeouts += 1
+        self.writer.transport.abort()
 
     def reset_state(self):
-        self.thread: threading.Thread = threading.Thread(target=self.handle)
         self.answer: bool = None
         self.answered: bool = False
         self.correct: bool = None
         self.in_game: bool = True
-        self.exit_gracefully: bool = False
-        
-    def start(self):
-        self.reset_state()
-        self.thread.start()
+        # monotonic timestamps of the current round
+        self.question_sent_at: float = None
+        self.answer_received_at: float = None
 
-    
-    def join(self):
+    def is_closed(self) -> bool:
         """
-        Gracefully exits the server by first shutting down the socket for reading, 
-        then joining the thread with a timeout, and handling any remaining active connections.
+        Check if the client's connection is closed, without touching the socket.
+
+        Returns:
+            bool: True if the peer closed the connection or the transport is closing, False otherwise.
         """
-        self.exit_gracefully = True
-        try:
-            self.socket.shutdown(socket.SHUT_RD)  # Initially attempt to stop receiving data
-        except socket.error as e:
-            print(f"Error shutting down socket for receiving from {self.name}: {e}")
-
-        self.thread.join(timeout=c.SERVER_POST_GAME_OVER_DISCONNECT_TIMEOUT_SEC)
-        if self.thread.is_alive():
-            # If the thread is still alive after the timeout, send a final message and forcefully disconnect
-            print(f"Timeout reached for {self.name}, forcing disconnection.")
-            self.send_message(c.GAME_OVER_MESSAGE, "You are just too scary boi. Game was stopped due to opponent disconnection, you are the winner!")
-            try:
-                self.socket.shutdown(socket.SHUT_RDWR)  # Shutdown for both reading and writing
-            except socket.error as e:
-                print(f"Error shutting down socket for {self.name}: {e}")
+        return self.reader.at_eof() or self.writer.is_closing()
+
+    @property
+    def detached(self) -> bool:
+        """
+        Returns:
+            bool: True while the connection dropped and the seat of the player is kept for it to resume.
+        """
+        return self.expire_handle is not None
+
+    def session_message(self, resumed: bool = False) -> str:
+        """
+        Returns:
+            str: The session message of the player, with its resumption token (issued on the first call).
+                Only clients of the binary protocol can resume their session.
+        """
+        if self.resume_token is None and self.binary and c.SERVER_RESUME_GRACE_SEC > 0:
+            self.resume_token = secrets.token_urlsafe(16)
+            resumable_sessions[self.resume_token] = self
+        session = {'persistent': c.SERVER_PERSISTENT_SESSIONS, 'token': self.resume_token}
+        if c.SERVER_QUESTION_IDS:
+            session['questions'] = QUESTION_BANK.fingerprint()
+        if resumed:
+            session['resumed'] = True
+        return json.dumps(session)
+
+    def detach(self) -> None:
+        """
+        Keeps the seat of a player whose connection dropped for SERVER_RESUME_GRACE_SEC, in case it resumes its session.
+        Messages to the player are queued meanwhile, and sent once it is back.
+        """
+        if self.detached:
+            return
+        self.writer.close()
+        print(f"{c.COLOR_YELLOW}{self.name} dropped, keeping its seat for {c.SERVER_RESUME_GRACE_SEC} seconds.{c.COLOR_RESET}")
+        tracing.instant('dropped', self.trace_lane)
+        self.resumed.clear()
+        self.expire_handle = asyncio.get_running_loop().call_later(c.SERVER_RESUME_GRACE_SEC, self.expire)
+
+    def expire(self) -> None:
+        self.expire_handle = None
+        print(f"{c.COLOR_RED}{self.name} did not resume its session.{c.COLOR_RESET}")
+        self.disconnect(resumable=False)
+        # wake up a pending answer coroutine, the seat is lost
+        self.resumed.set()
+
+    def reattach(self, connection: 'ClientHandler') -> None:
+        """
+        Moves the session to the new connection of a client that resumed it, without a new name handshake.
+        The messages queued while the client was away are sent on the new connection,
+        and a pending answer is read from it.
+
+        Args:
+            connection (ClientHandler): The handler of the new connection, which is dropped.
+        """
+        if self.detached:
+            self.expire_handle.cancel()
+            self.expire_handle = None
+        else:
+            # the client noticed the drop before the server did
+            self.writer.transport.abort()
+        self.reader = connection.reader
+        self.writer = connection.writer
+        self.decoder = connection.decoder
+        self.pending_frames = connection.pending_frames
+        self.outbound.writer = connection.writer
+        self.connection_id += 1
+        self.start_reading()
+        print(f"{c.COLOR_GREEN}{self.name} resumed its session.{c.COLOR_RESET}")
+        tracing.instant('resumed', self.trace_lane)
+        server_metrics.resumed_sessions += 1
+        # the confirmation goes first, then the queued messages
+        self.writer.write(protocol.encode_message(c.SESSION_MESSAGE, self.session_message(resumed=True), self.binary))
+        self.flush_outbound()
+        self.resumed.set()
+
+    async def resume_after_drop(self, connection_id: int) -> bool:
+        """
+        Handles the connection of the player dropping while its answer was awaited.
+
+        Args:
+            connection_id (int): The connection the answer was read from.
+
+        Returns:
+            bool: True if the player is back on a new connection, to read its answer from.
+        """
+        if self.connection_id != connection_id:
+            # the session already moved to a new connection
+            return True
+        self.disconnect()
+        if not self.detached:
+            return False
+        await self.resumed.wait()
+        return self.resume_token is not None
 
 
     def disqualify(self):
         """
         Disqualifies the player from the game.
-        
+
         Sets the 'in_game' attribute to False and sends a message to the player indicating their disqualification.
         """
         self.in_game = False
+        tracing.instant('disqualified', self.trace_lane)
         self.send_message(c.GENERAL_MESSAGE, "We hope your brain is not your strongest muscle, try better in the next game!")
 
 
-    def disconnect(self):
+    def disconnect(self, resumable: bool = True):
         """
         Disconnects the client from the server.
 
-        This method closes the client's socket connection, removes the client from the list of active handlers,
-        sets the client's `in_game` flag to False, and notifies any waiting threads that are waiting for answers.
+        This method closes the client's connection, removes the client from the handlers of its room
+        and sets the client's `in_game` flag to False.
+        A pending answer coroutine of this client wakes up on the closed stream and finishes.
+        A player still in the game that may resume its session keeps its seat for a while instead, see detach.
 
+        Args:
+            resumable (bool): False to disconnect the client for good, even if it could resume its session.
         """
-        with CLIENTS_HANDLERS_LOCK:
-            if self in CLIENTS_HANDLERS:
-                self.socket.close()
-                print(f"{c.COLOR_RED}{self.name} disconnected.{c.COLOR_RESET}")
-                CLIENTS_HANDLERS.remove(self)
-                self.in_game = False
-                with WAIT_FOR_ANSWERS_CONDITION:
-                    WAIT_FOR_ANSWERS_CONDITION.notify()
- 
-    
+        in_room = self.room is not None and self in self.room.clients_handlers
+        if resumable and in_room and self.in_game and self.resume_token is not None:
+            self.detach()
+            return
+        if self.expire_handle is not None:
+            self.expire_handle.cancel()
+            self.expire_handle = None
+        if self.resume_token is not None:
+            del resumable_sessions[self.resume_token]
+            self.resume_token = None
+        if in_room:
+            # the messages of the current phase go out before the connection closes
+            self.flush_outbound()
+            self.writer.close()
+            print(f"{c.COLOR_RED}{self.name} disconnected.{c.COLOR_RESET}")
+            tracing.instant('disconnected', self.trace_lane)
+            self.room.clients_handlers.remove(self)
+            self.in_game = False
+
+
     def send_message(self, message_type: str, message: str) -> None:
-            """
-            Sends a message to the connected socket while ignoring broken ones
+        """
+        Sends a message to the connected socket while ignoring broken ones.
 
-            Args:
-                message_type (str): The type of the message.
-                message (str): The content of the message.
+        Args:
+            message_type (str): The type of the message.
+            message (str): The content of the message.
 
-            Returns:
-                None
-            """
-            message = message_type + message + c.SERVER_MSG_TERMINATION
-            try:
-                self.socket.sendall(message.encode())
-            except (BrokenPipeError, ConnectionResetError):
-                self.disconnect()
+        Returns:
+            None
+        """
+        self.send_data(protocol.encode_message(message_type, message, self.binary))
 
 
-    def handle(self):
+    def send_data(self, data: bytes) -> None:
         """
-        Handles the logic for a player's turn in the game.
+        Queues an encoded message for the client and writes it without blocking, along with the other
+        messages of the current round phase if SERVER_COALESCE_WRITES is set (see OutboundQueue).
+        A client that does not read its messages fast enough is handled by handle_slow_consumer.
 
-        This method is responsible for receiving and processing the player's answer,
-        notifying the main thread when the player has answered, and waiting for all
-        answers to be checked before proceeding.
+        Args:
+            data (bytes): The encoded message.
 
         Returns:
             None
         """
-        self.in_game = True
-
-        while GAME_RUNNING and self.in_game:
-            # get answer from client
-            answer = None
-            with SENT_QUESTION_CONDITION:
-                if not SENT_QUESTION:
-                    SENT_QUESTION_CONDITION.wait()
-
-            while answer not in c.TRUE_ANSWERS + c.FALSE_ANSWERS:
-                try:
-                    print(f'waiting for answer from {self.name}')
-                    response_ready, _, _ = select.select([self.socket], [], [], c.SERVER_NO_ANSWER_TIMEOUT_SEC)
-                    if response_ready:
-                        response = self.socket.recv(c.CLIENT_ANSWER_PACKET_SIZE)
-                    else:
-                        # did not get response from client
-                        print(f"{self.name} did not answer in time.")
-                        response = None
-                        break
-                except Exception:
-                    print(f"Error while reciving answer from client {self.name}")
-                    if not self.exit_gracefully:
-                        self.disconnect()
-                    return  # kill the thread
-                if response:
-                    print(f"Got response from {self.name}: {response}")
-                else:
-                    if not self.exit_gracefully:
-                        self.disconnect()
-                    return  # kill the thread
-                
-                answer = response.decode()
-                if answer not in c.TRUE_ANSWERS + c.FALSE_ANSWERS:
-                    error_message = f"Invalid answer: {answer}"
-                    self.send_message(c.ERROR_MESSAGE, error_message)
-
-            if answer in c.TRUE_ANSWERS:
-                self.answer = True
-            elif answer in c.FALSE_ANSWERS:
-                self.answer = False
-            else:
-                self.answer = None
-            self.answered = True
+        if self.detached:
+            # sent when the client resumes its session
+            if not self.outbound.put(data):
+                self.disconnect(resumable=False)
+            return
+        if self.writer.is_closing():
+            self.disconnect()
+            return
+        if not self.outbound.put(data):
+            self.handle_slow_consumer()
+            return
+        if c.SERVER_COALESCE_WRITES:
+            self.outbound.flush_soon(self.flush_outbound)
+        else:
+            self.flush_outbound()
 
-            # nofify the main thread that another player answered
-            with WAIT_FOR_ANSWERS_CONDITION:
-                WAIT_FOR_ANSWERS_CONDITION.notify()
 
-            # wait for all answers to be checked
-            with ANSWERS_CHECKED_CONDITION:
-                if not ANSWERS_CHECKED:
-                    ANSWERS_CHECKED_CONDITION.wait()
+    def flush_outbound(self) -> None:
+        """
+        Writes the queued messages of the client at once. They stay queued while the connection dropped
+        and the player may resume its session, and are dropped with a closing connection.
+        """
+        if self.detached or self.writer.is_closing():
+            return
+        try:
+            if self.outbound.flush():
+                server_metrics.socket_writes += 1
+        except (BrokenPipeError, ConnectionResetError):
+            self.disconnect()
 
-            if self.correct is False:
-                break
 
-            # reset answer and correct fields
-            self.answered = False
-            self.answer = None
-            self.correct = None
+    def handle_slow_consumer(self) -> None:
+        """
+        Handles a client whose outbound backlog exceeded SERVER_MAX_CLIENT_BACKLOG_BYTES, according to
+        SERVER_SLOW_CLIENT_POLICY: the client is either dropped, or taken out of the current game while
+        the messages it cannot take are dropped.
+        """
+        server_metrics.slow_clients += 1
+        tracing.instant('slow consumer', self.trace_lane, backlog=self.outbound.backlog())
+        if c.SERVER_SLOW_CLIENT_POLICY == 'disqualify':
+            if self.in_game:
+                print(f"{c.COLOR_RED}{self.name} is too slow to read its messages and was disqualified.{c.COLOR_RESET}")
+                self.in_game = False
+                # the round does not wait for the answer of a disqualified player
+                if self.answer_task is not None:
+                    self.answer_task.cancel()
+            return
+        print(f"{c.COLOR_RED}{self.name} is too slow to read its messages, dropping it.{c.COLOR_RESET}")
+        # abort instead of close, the pending backlog will never be read
+        self.writer.transport.abort()
+        self.disconnect(resumable=False)
 
 
-SEND_BROADCAST: bool = False
-CLIENTS_HANDLERS: list[ClientHandler] = []
-CLIENTS_HANDLERS_LOCK: threading.Lock = threading.Lock()
+    async def handle(self):
+        """
+        Handles the logic for a player's turn in the game.
 
+        This coroutine is responsible for receiving and processing the player's answer
+        to the question of the current round. It is started by the game loop once the
+        question was sent, and finishes when the player answered, did not answer in
+        time or disconnected.
 
-def get_ip_address() -> str:
-    """
-    Get the IP address of the current machine.
+        Returns:
+            None
+        """
+        with tracing.span('answer', self.trace_lane):
+            await self.receive_round_answer()
 
-    Returns:
-        str: The IP address of the current machine.
-    """
-    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    try:
-        # Connect to any IP (here we choose Google's public DNS server)
-        s.connect(c.GOOGLE_ADDRESS)
-        ip_address = s.getsockname()[0]
-    finally:
-        s.close()
-    return ip_address
+    async def receive_round_answer(self):
+        """
+        Receives the player's answer to the current question, asking again while the answer is invalid.
+        Sets the 'answer' and 'answered' attributes, unless the player disconnected.
+
+        Returns:
+            None
+        """
+        # get answer from client
+        answer = None
+        while answer not in c.TRUE_ANSWERS + c.FALSE_ANSWERS:
+            connection_id = self.connection_id
+            try:
+                print(f'waiting for answer from {self.name}')
+                response = await asyncio.wait_for(self.receive_answer(),
+                                                  timeout=c.SERVER_NO_ANSWER_TIMEOUT_SEC)
+            except asyncio.TimeoutError:
+                # did not get response from client
+                print(f"{self.name} did not answer in time.")
+                tracing.instant('no answer in time', self.trace_lane)
+                answer = None
+                break
+            if response:
+                print(f"Got response from {self.name}: {response}")
+            else:
+                if await self.resume_after_drop(connection_id):
+                    continue
+                return
+
+            answer = response
+            self.answer_received_at = time.monotonic()
+            tracing.instant('answer received', self.trace_lane, answer=answer)
+            if answer not in c.TRUE_ANSWERS + c.FALSE_ANSWERS:
+                error_message = f"Invalid answer: {answer}"
+                self.send_message(c.ERROR_MESSAGE, error_message)
+
+        if answer in c.TRUE_ANSWERS:
+            self.answer = True
+        elif answer in c.FALSE_ANSWERS:
+            self.answer = False
+        else:
+            self.answer = None
+        self.answered = True
 
 
-def is_socket_closed(sock: socket.socket) -> bool:
+class GameRoom:
+    """
+    A single game with its own players and round state.
+    Several rooms are played in parallel by the RoomManager.
     """
-    Check if a socket is closed or not.
+    def __init__(self, room_id: int):
+        self.room_id: int = room_id
+        self.clients_handlers: list[ClientHandler] = []
+        self.game_running: bool = False
+        self.player_joined: asyncio.Event = asyncio.Event()
+        self.trace_lane: int = tracing.new_lane(f'Room {room_id}')
+
+    def log(self, message: str) -> None:
+        """
+        Prints a message of this room, prefixed with the room id.
 
-    Args:
-        sock (socket.socket): The socket to check.
+        Args:
+            message (str): The message to print.
+        """
+        print(f"[Room {self.room_id}] {message}")
 
-    Returns:
-        bool: True if the socket is closed, False otherwise.
-    """
-    try:
-        # this will try to read bytes without blocking and also without removing them from buffer (peek only)
-        data = sock.recv(1, socket.MSG_DONTWAIT | socket.MSG_PEEK)
-        if len(data) == 0:
-            return True
-    except BlockingIOError:
-        return False  # socket is open and reading from it would block
-    except ConnectionResetError:
-        return True  # socket was closed for some other reason
-    except Exception:
-        return False
-    return False
+    def add_player(self, handler: ClientHandler) -> None:
+        """
+        Adds a player to the room's lobby and wakes up the lobby.
 
-def create_broadcast_packet(server_name: str, server_port: int) -> bytes:
-    """
-    Creates a broadcast packet for the TriviaKing server.
+        Args:
+            handler (ClientHandler): The player to add.
+        """
+        handler.room = self
+        self.clients_handlers.append(handler)
+        self.player_joined.set()
 
-    Args:
-        server_name (str): The name of the server.
-        server_port (int): The port number of the server.
+    def is_full(self) -> bool:
+        """
+        Returns:
+            bool: True if no more players can join the room.
+        """
+        return len(self.clients_handlers) >= c.MAX_TEAMS
 
-    Returns:
-        bytes: The constructed UDP packet.
-    """
-    
-    # Constructing the message with the specified format
-    magic_cookie = struct.pack('>I', c.BROADCAST_MAGIC_COOKIE)
-    message_type = struct.pack('B', c.BROADCAST_MESSAGE_TYPE)
-    # Encoding the server name to Unicode and padding it to 32 characters
-    encoded_server_name = server_name.encode(
-        'utf-16le').ljust(64, b'\x00')[:32]
-    # Converting the server port to bytes (big-endian)
-    server_port_bytes = struct.pack('>H', server_port)
-
-    # Constructing the UDP packet
-    udp_packet = b''.join(
-        [magic_cookie, message_type, encoded_server_name, server_port_bytes])
-    return udp_packet
-
-
-def broadcast_loop(ip_address: str, server_name: str, server_port: int) -> None:
-    """
-    Continuously sends broadcast packets to the network.
+    async def wait_for_players(self) -> None:
+        """
+        Waits until enough players joined the room.
+        Once the minimum number of players is reached, other players have CLIENT_NO_JOIN_TIMEOUT_SEC
+        seconds to join, and the room stops waiting as soon as it is full.
 
-    Args:
-        ip_address (str): The IP address to bind the socket to.
-        server_name (str): The name of the server.
-        server_port (int): The port number of the server.
+        Returns:
+            None
+        """
+        timeout = None
+        while not self.is_full():
+            if len(self.clients_handlers) < c.MIN_TEAMS:
+                self.log("Waiting for more players to join...")
+                timeout = None
+            elif timeout is None:
+                # several players may join between two wakeups of the lobby
+                self.log(f"Minimum number of players reached. Other players have {c.CLIENT_NO_JOIN_TIMEOUT_SEC} seconds.")
+                timeout = c.CLIENT_NO_JOIN_TIMEOUT_SEC
+            self.player_joined.clear()
+            try:
+                await asyncio.wait_for(self.player_joined.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                break
+        self.log("Stopped listening for new connections.")
 
-    Returns:
-        None
-    """
-    
-    # Creating the UDP packet
-    udp_packet = create_broadcast_packet(server_name=server_name,
-                                         server_port=server_port)
+    def send_session_message(self) -> None:
+        """
+        Sends the session settings to the players of the room, before the welcome message.
+        Clients of the text protocol get it only with SERVER_PERSISTENT_SESSIONS, the only setting that
+        concerns them, so a legacy game keeps its original messages.
 
-    broadcast_address = (c.BROADCAST_ADDRESS, c.BROADCAST_PORT)
+        Returns:
+            None
+        """
+        # the players of a persistent session stay connected after the game over message,
+        # and every player gets its own resumption token
+        for ch in list(self.clients_handlers):
+            if ch.binary or c.SERVER_PERSISTENT_SESSIONS:
+                ch.send_message(c.SESSION_MESSAGE, ch.session_message())
 
-    print("Server sending offers...")
+    def send_welcome_message(self) -> None:
+        """
+        Sends a welcome message to all players of the room.
 
-    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP) as sock:
-        sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
-        try:
-            sock.bind((ip_address, c.BROADCAST_PORT))
-        except OSError:
-            # on mac
-            pass
-        while SEND_BROADCAST:
-            sock.sendto(udp_packet, broadcast_address)
-            time.sleep(c.SERVER_BROADCAST_PERIOD_SEC)
+        The welcome message includes the server name and a list of connected players.
 
+        Returns:
+            None
+        """
+        welcome_message = f'Welcome to {c.SERVER_NAME} trivia king!\n'
+        for i, ch in enumerate(self.clients_handlers):
+            welcome_message += f'Player {i + 1}: {ch.name}\n'
+        welcome_message += '==\n'
+
+        # send welcome message to every player
+        for ch in list(self.clients_handlers):
+            msg = f"Hello, comrade {ch.name}!\n"
+            msg += welcome_message
+            ch.send_message(c.WELCOME_MESSAGE, msg)
+
+    def get_in_game_players(self) -> list[ClientHandler]:
+        """
+        Returns a list of ClientHandler objects representing players who are currently in the game.
 
-def handle_new_connection(client_socket: socket.socket, client_address: tuple) -> None:
-    """
-    Handles a new client connection.
+        Returns:
+            list[ClientHandler]: A list of ClientHandler objects representing players in the game.
+        """
+        return [ch for ch in self.clients_handlers if ch.in_game]
 
-    Args:
-        client_socket (socket.socket): The socket object representing the client connection.
-        client_address (tuple): The address of the client.
+    async def wait_for_answers(self, players: list[ClientHandler]) -> None:
+        """
+        Runs the answer coroutine of every player and waits until all of them answered,
+        or until at most one player is left in the game.
 
-    Returns:
-        None
-    """
-    print(f"{c.COLOR_YELLOW}New connection from {client_address}{c.COLOR_RESET}")
-    handler: ClientHandler = ClientHandler(client_socket=client_socket)
-    CLIENTS_HANDLERS.append(handler)
-    handler.receive_name()
+        Args:
+            players (list[ClientHandler]): The players the question was sent to.
 
+        Returns:
+            None
+        """
+        if not players:
+            return
+        all_answered = asyncio.Event()
+        remaining = len(players)
+
+        def on_answer(task: asyncio.Task) -> None:
+            nonlocal remaining
+            remaining -= 1
+            if remaining == 0 or len(self.get_in_game_players()) <= 1:
+                all_answered.set()
+
+        tasks = []
+        for ch in players:
+            task = asyncio.create_task(ch.handle())
+            task.add_done_callback(on_answer)
+            ch.answer_task = task
+            tasks.append(task)
+
+        await all_answered.wait()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for ch in players:
+            ch.answer_task = None
+
+    def record_answers(self, players: list[ClientHandler], question_id: int, answer: bool) -> None:
+        """
+        Records the answers of a round in the stats, with the time each player took to answer
+        and the time each answer waited for the verdict of the round.
 
-def filter_clients_handlers() -> None:
-    """
-    Filters the list of client handlers and disconnects any closed sockets.
-    """
-    for ch in CLIENTS_HANDLERS:
-        if is_socket_closed(ch.socket):
-            ch.disconnect()
+        Args:
+            players (list[ClientHandler]): The players the question was sent to.
+            question_id (int): The id of the question.
+            answer (bool): The correct answer.
 
+        Returns:
+            None
+        """
+        verdict_at = time.monotonic()
+        for ch in players:
+            if ch.answered and ch.answer is not None and ch.answer_received_at is not None:
+                server_stats.add_answer_frequency(ch.answer)
+                server_stats.add_answer(ch.name, question_id, ch.answer == answer,
+                                        answer_latency=ch.answer_received_at - ch.question_sent_at,
+                                        verdict_wait=verdict_at - ch.answer_received_at)
+            else:
+                server_stats.add_answer(ch.name, question_id, False)
 
-def handle_incoming_connections(server_socket: socket.socket) -> None:
-    """
-    Accepts incoming connections from clients and handles them.
+    async def game_loop(self) -> ClientHandler:
+        """
+        Main game loop that handles the flow of the trivia game.
 
-    Args:
-        server_socket (socket.socket): The server socket object.
+        Returns:
+            ClientHandler: The winner of the game.
+        """
+        self.game_running = True
+
+        for ch in self.clients_handlers:
+            ch.reset_state()
+
+        # the rules of the game, this loop sends their questions and verdicts to the clients
+        game = engine.GameEngine(self.clients_handlers, QUESTION_BANK)
+        while not game.is_over():
+            round_num = game.start_round()
+            server_metrics.rounds += 1
+            with tracing.span('round', self.trace_lane, round=round_num,
+                              players=len(self.get_in_game_players())):
+                # start the round
+                with tracing.span('round start messages', self.trace_lane):
+                    round_start_message = f"Round {round_num} is starting in {c.ROUND_PAUSE_SEC} seconds. Get ready..."
+                    fanout.broadcast(self.clients_handlers, c.GENERAL_MESSAGE, round_start_message)
+                    self.log(f"{c.COLOR_YELLOW}{round_start_message}{c.COLOR_RESET}")
+
+
+                    in_game_players_str = ', '.join([p.name for p in self.get_in_game_players()])
+                    before_question_message = f"Players still in the game: {in_game_players_str}"
+                    fanout.broadcast(self.clients_handlers, c.GENERAL_MESSAGE, before_question_message)
+                    self.log(f"{c.COLOR_YELLOW}{before_question_message}{c.COLOR_RESET}")
+
+                # optinal - sleep to give players time to prepare
+                with tracing.span('round pause', self.trace_lane):
+                    await asyncio.sleep(c.ROUND_PAUSE_SEC)
+
+                # choose a random question that was not asked in this game
+                with tracing.span('question selection', self.trace_lane):
+                    question_id, question, answer = game.next_question()
+
+                # send the question to all players
+                with tracing.span('question fan-out', self.trace_lane, question_id=question_id):
+                    fanout.broadcast_question(self.get_in_game_players(), question_id, question)
+                    question_sent_at = time.monotonic()
+                    for ch in self.get_in_game_players():
+                        ch.question_sent_at = question_sent_at
+
+                self.log(f"{c.COLOR_BLUE}Sent question: {question} (answer: {answer}){c.COLOR_RESET}")
+
+                # wait for answers
+                asked_players = self.get_in_game_players()
+                with tracing.span('wait for answers', self.trace_lane):
+                    await self.wait_for_answers(asked_players)
+                self.record_answers(asked_players, question_id, answer)
+
+                # check answers
+                with tracing.span('check answers', self.trace_lane):
+                    if len(self.get_in_game_players()) > 1:
+                        # the incorrect players are disqualified, unless nobody was correct
+                        verdict = game.judge(answer)
+
+                        self.log(f"{c.COLOR_GREEN}Correct players: {', '.join([ch.name for ch in verdict.correct])}{c.COLOR_RESET}")
+                        self.log(f"{c.COLOR_RED}Incorrect players: {', '.join([ch.name for ch in verdict.incorrect])}{c.COLOR_RESET}")
+
+                        if len(verdict.correct) == 0:
+                            msg = f"{c.COLOR_RED}No one got the answer right. Trying again with a new question.{c.COLOR_RESET}"
+                            self.log(msg)
+                            # let players know who is still in the game:
+                            fanout.broadcast(self.get_in_game_players(), c.GENERAL_MESSAGE, msg)
+                        else:
+                            # let players know who is still in the game:
+                            msg = f"{c.COLOR_GREEN}You are correct!{c.COLOR_RESET}"
+                            fanout.broadcast(self.get_in_game_players(), c.GENERAL_MESSAGE, msg)
+
+                if game.is_over():
+                    self.game_running = False
+
+                # reset answer and correct fields
+                with tracing.span('reset round', self.trace_lane):
+                    for ch in self.get_in_game_players():
+                        ch.answered = False
+                        ch.answer = None
+                        ch.correct = None
+                        ch.question_sent_at = None
+                        ch.answer_received_at = None
+
+        winner = game.winner()
+
+        if winner:
+            self.log(f"{c.COLOR_GREEN}The winner is {winner.name}{c.COLOR_RESET}")
+            return winner
+        else:
+            self.log(f"{c.COLOR_YELLOW}No winner, all players disconnected.{c.COLOR_RESET}")
+            return None
 
-    Returns:
-        None
-    """
-    # Accept incoming connections
-    while True:
-        if len(CLIENTS_HANDLERS) < c.MIN_TEAMS:
-            print("Waiting for more players to join...")
-            server_socket.settimeout(None)
-        if len(CLIENTS_HANDLERS) == c.MIN_TEAMS:
-            print(f"Minimum number of players reached. Other players have {c.CLIENT_NO_JOIN_TIMEOUT_SEC} seconds.")
-            server_socket.settimeout(c.CLIENT_NO_JOIN_TIMEOUT_SEC)
-        try:
-            (client_socket, client_address) = server_socket.accept()
-            handle_new_connection(client_socket, client_address)
-            filter_clients_handlers()
-        except socket.timeout:
-            print("Stopped listening for new connections.")
-            break
 
+    async def send_game_over_message(self, winner: ClientHandler):
+        """
+        Sends a game over message to all clients, indicating the winner of the game.
 
-def send_welcome_message() -> None:
-    """
-    Sends a welcome message to all players connected to the server.
+        Args:
+            winner (ClientHandler): The name of the winner.
 
-    The welcome message includes the server name and a list of connected players.
+        Returns:
+            None
+        """
+        if winner is None:
+            self.log(f"{c.COLOR_RED}All players disconnected. No winner today!{c.COLOR_RESET}")
+            return
+        clients_handlers = list(self.clients_handlers)
+        for ch in clients_handlers:
+            msg = None
+            if ch.in_game:
+                msg = f"{c.COLOR_GREEN}You are the winner!{c.COLOR_RESET}"
+                # add the winner to the stats
+                server_stats.add_player_win(winner.name)
+            else:
+                msg = f"The winner is: {winner.name}"
+            ch.send_message(c.GAME_OVER_MESSAGE, msg)
 
-    Returns:
-        None
-    """
-    welcome_message = f'Welcome to {c.SERVER_NAME} trivia king!\n'
-    for i, ch in enumerate(CLIENTS_HANDLERS):
-        welcome_message += f'Player {i + 1}: {ch.name}\n'
-    welcome_message += '==\n'
-
-    # send welcome message to every player
-    for ch in CLIENTS_HANDLERS:
-        msg = f"Hello, comrade {ch.name}!\n"
-        msg += welcome_message
-        ch.send_message(c.WELCOME_MESSAGE, msg)
-
-def get_in_game_players() -> list[ClientHandler]:
+        if c.SERVER_PERSISTENT_SESSIONS:
+            # the RoomManager moves the players to the next lobby
+            return
+
+        await asyncio.sleep(c.SERVER_POST_GAME_OVER_DISCONNECT_TIMEOUT_SEC)
+
+        for ch in clients_handlers:
+            ch.disconnect(resumable=False)
+
+    async def play(self) -> None:
+        """
+        Plays the room's game from the welcome message to the game over message.
+
+        Returns:
+            None
+        """
+        server_metrics.games_started += 1
+        with tracing.span('welcome', self.trace_lane, players=len(self.clients_handlers)):
+            self.send_session_message()
+            self.send_welcome_message()
+        with tracing.span('game', self.trace_lane):
+            winner = await self.game_loop()
+        with tracing.span('game over', self.trace_lane):
+            await self.send_game_over_message(winner=winner)
+        server_metrics.games_finished += 1
+        tracing.flush()
+        server_stats.print_player_wins()
+        server_stats.print_latency_summary()
+
+
+class RoomManager:
     """
-    Returns a list of ClientHandler objects representing players who are currently in a game.
-    
-    Returns:
-        list[ClientHandler]: A list of ClientHandler objects representing players in a game.
+    Keeps a lobby open at all times and plays the filled rooms in parallel.
+    A new lobby room is opened as soon as the previous one starts its game,
+    as long as less than SERVER_MAX_ROOMS games are running.
+    With SERVER_PERSISTENT_SESSIONS, the players of a finished game join the next lobby on the same connection.
     """
-    return [ch for ch in CLIENTS_HANDLERS if ch.in_game]
+    def __init__(self, max_rooms: int = c.SERVER_MAX_ROOMS):
+        self.max_rooms: int = max_rooms
+        self.lobby: GameRoom = None
+        self.lobby_open: asyncio.Event = asyncio.Event()
+        self.lobby_opened: asyncio.Event = asyncio.Event()  # set by every new lobby, for the burst of offers
+        self.running_rooms: set[asyncio.Task] = set()
+        self.room_finished: asyncio.Event = asyncio.Event()
+        self.returning_players: set[asyncio.Task] = set()  # players of finished games waiting for a lobby
+        self.room_ids = itertools.count(1)
+
+    async def join(self, handler: ClientHandler) -> None:
+        """
+        Adds a player to the current lobby, waiting for a lobby to open if needed.
+
+        Args:
+            handler (ClientHandler): The player to add.
+        """
+        while not self.lobby_open.is_set():
+            await self.lobby_open.wait()
+        self.lobby.add_player(handler)
+        if self.lobby.is_full():
+            # the lobby starts its game, later players wait for the next one
+            self.lobby_open.clear()
+
+    async def run(self) -> None:
+        """
+        Opens lobbies and starts their games forever.
 
+        Returns:
+            None
+        """
+        while True:
+            while len(self.running_rooms) >= self.max_rooms:
+                self.room_finished.clear()
+                await self.room_finished.wait()
+
+            self.lobby = GameRoom(room_id=next(self.room_ids))
+            self.lobby_open.set()
+            self.lobby_opened.set()
+            with tracing.span('lobby', self.lobby.trace_lane):
+                await self.lobby.wait_for_players()
+            self.lobby_open.clear()
+
+            task = asyncio.create_task(self.lobby.play())
+            self.running_rooms.add(task)
+            task.add_done_callback(lambda task, room=self.lobby: self.on_room_finished(task, room))
+
+    def offer_status(self) -> tuple:
+        """
+        Returns:
+            tuple: The status advertised in extended offers, see OFFER_EXTENSION_FORMAT.
+        """
+        state = c.OFFER_STATE_LOBBY_OPEN if self.lobby_open.is_set() else c.OFFER_STATE_FULL
+        lobby_players = len(self.lobby.clients_handlers) if self.lobby is not None else 0
+        return state, lobby_players, c.MAX_TEAMS, len(self.running_rooms), self.max_rooms
+
+    def on_room_finished(self, task: asyncio.Task, room: GameRoom) -> None:
+        self.running_rooms.discard(task)
+        self.room_finished.set()
+        if c.SERVER_PERSISTENT_SESSIONS and not task.cancelled():
+            self.rejoin(room.clients_handlers)
+
+    def rejoin(self, handlers: list[ClientHandler]) -> None:
+        """
+        Moves the players of a finished game that are still connected to the next lobby.
+        Their handlers are reused, so they skip the offers, the handshake and the name.
 
-def game_loop() -> ClientHandler:
+        Args:
+            handlers (list[ClientHandler]): The players of the finished game.
+        """
+        for handler in list(handlers):
+            if handler.is_closed():
+                handler.disconnect()
+                if not handler.detached:
+                    continue
+            handler.reset_state()
+            # answers the client sent after the last round belong to the finished game, but the end of
+            # a dropped connection must reach the next game, to resume or disconnect the player
+            connection_ended = False
+            while not handler.answers.empty():
+                connection_ended |= handler.answers.get_nowait() == ''
+            if connection_ended:
+                handler.answers.put_nowait('')
+            task = asyncio.create_task(self.join(handler))
+            self.returning_players.add(task)
+            task.add_done_callback(self.returning_players.discard)
+
+
+ROOM_MANAGER: RoomManager = None
+
+
+def resume_session(connection: ClientHandler, resume_token: str) -> None:
     """
-    Main game loop that handles the flow of the trivia game.
+    Re-attaches a client resuming its session to the handler that kept its seat.
 
-    Returns:
-        ClientHandler: The winner of the game.
+    Args:
+        connection (ClientHandler): The handler of the new connection.
+        resume_token (str): The resumption token sent by the client.
     """
-    global SENT_QUESTION
-    global ANSWERS_CHECKED
-    global GAME_RUNNING
-
-    SENT_QUESTION = False
-    ANSWERS_CHECKED = False
-    GAME_RUNNING = True
-
-    round_num = 1
-
-    def get_round_start_message() -> str:
-        return f"Round {round_num} is starting in {c.ROUND_PAUSE_SEC} seconds. Get ready..."
-
-    for ch in CLIENTS_HANDLERS:
-        ch.start()
-
-    selected_questions_indices = [-1]
-    while len(get_in_game_players()) > 1:
-        # start the round
-        round_start_message = get_round_start_message()
-        for ch in CLIENTS_HANDLERS:
-            ch.send_message(c.GENERAL_MESSAGE, round_start_message)
-        print(f"{c.COLOR_YELLOW}{round_start_message}{c.COLOR_RESET}")
-        
-
-        in_game_players_str = ', '.join([p.name for p in get_in_game_players()])
-        before_question_message = f"Players still in the game: {in_game_players_str}"
-        for ch in CLIENTS_HANDLERS:
-            ch.send_message(c.GENERAL_MESSAGE, before_question_message)
-        print(f"{c.COLOR_YELLOW}{before_question_message}{c.COLOR_RESET}")
-
-        # optinal - sleep to give players time to prepare
-        time.sleep(c.ROUND_PAUSE_SEC)
-
-        # choose a random question
-        question_index = -1
-        while question_index in selected_questions_indices:
-            question_index = random.randint(0, len(QUESTIONS) - 1)
-        selected_questions_indices.append(question_index)
-        question, answer = QUESTIONS[question_index]
-        
-        # send the question to all players
-        for ch in get_in_game_players():
-            ch.send_message(c.QUESTION_MESSAGE, question)
-
-        SENT_QUESTION = True
-        ANSWERS_CHECKED = False
-        with SENT_QUESTION_CONDITION:
-            SENT_QUESTION_CONDITION.notify_all()
-
-        print(f"{c.COLOR_BLUE}Sent question: {question} (answer: {answer}){c.COLOR_RESET}")
-
-        # wait for answers
-        with WAIT_FOR_ANSWERS_CONDITION:
-            pending_clients = get_in_game_players()
-            while len(get_in_game_players()) > 1 and len(pending_clients) > 0:
-                WAIT_FOR_ANSWERS_CONDITION.wait()
-                pending_clients = [ch for ch in get_in_game_players() if not ch.answered]
-        
-
-        # check answers
-        if len(get_in_game_players()) > 1:
-            correct_players: list[ClientHandler] = []
-            incorrect_players: list[ClientHandler] = []
-            for ch in get_in_game_players():
-                if ch.answer == answer:
-                    correct_players.append(ch)
-                else:
-                    incorrect_players.append(ch)
-            
-            print(f"{c.COLOR_GREEN}Correct players: {', '.join([ch.name for ch in correct_players])}{c.COLOR_RESET}")
-            print(f"{c.COLOR_RED}Incorrect players: {', '.join([ch.name for ch in incorrect_players])}{c.COLOR_RESET}")
-            
-            if len(correct_players) == 0:
-                msg = f"{c.COLOR_RED}No one got the answer right. Trying again with a new question.{c.COLOR_RESET}"
-                print(msg)
-                # let players know who is still in the game:
-                for ch in get_in_game_players():
-                    ch.send_message(c.GENERAL_MESSAGE, msg)
-            else:
-                for ch in correct_players:
-                    ch.correct = True
-
-                for ch in incorrect_players:
-                    ch.correct = False
-                    ch.disqualify()
-            
-                # let players know who is still in the game:
-                for ch in get_in_game_players():
-                    msg = f"{c.COLOR_GREEN}You are correct!{c.COLOR_RESET}"
-                    ch.send_message(c.GENERAL_MESSAGE, msg)
-        
-        if len(get_in_game_players()) <= 1:
-            GAME_RUNNING = False
-            
-        SENT_QUESTION = False
-        ANSWERS_CHECKED = True
-
-        with ANSWERS_CHECKED_CONDITION:
-            ANSWERS_CHECKED_CONDITION.notify_all()
-
-        round_num += 1
-
-    winner = get_in_game_players()[0] if get_in_game_players() else None
-    print("waiting for clients to exit gracefully...")
-    for ch in CLIENTS_HANDLERS:
-        ch.join()
-
-    if winner:
-        print(f"{c.COLOR_GREEN}The winner is {winner.name}{c.COLOR_RESET}")
-        return winner
-    else:
-        print(f"{c.COLOR_YELLOW}No winner, all players disconnected.{c.COLOR_RESET}")
-        return None
-    
+    handler = resumable_sessions.get(resume_token)
+    if handler is None:
+        print(f"{c.COLOR_RED}Unknown or expired session, closing the connection.{c.COLOR_RESET}")
+        connection.send_message(c.ERROR_MESSAGE, "Unknown or expired session")
+        connection.flush_outbound()
+        connection.writer.close()
+        return
+    handler.reattach(connection)
 
-def send_game_over_message(winner: ClientHandler):
+
+async def handle_new_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
     """
-    Sends a game over message to all clients, indicating the winner of the game.
+    Handles a new client connection.
+    Runs as its own coroutine for every accepted connection. The client's name is read right away,
+    and the client joins the current lobby room once one is open.
+    A client resuming its session is re-attached to the handler that kept its seat instead.
 
     Args:
-        winner (ClientHandler): The name of the winner.
+        reader (asyncio.StreamReader): The stream to read from the client.
+        writer (asyncio.StreamWriter): The stream to write to the client.
 
     Returns:
         None
     """
-    if winner is None:
-        print(f"{c.COLOR_RED}All players disconnected. No winner today!{c.COLOR_RESET}")
+    client_address = writer.get_extra_info('peername')
+    print(f"{c.COLOR_YELLOW}New connection from {client_address}{c.COLOR_RESET}")
+    server_metrics.connections += 1
+    liveness.configure_keepalive(writer.get_extra_info('socket'))
+    fanout.configure_nodelay(writer.get_extra_info('socket'))
+    handler: ClientHandler = ClientHandler(reader=reader, writer=writer)
+    resume_token = await handler.receive_hello()
+    if resume_token is not None:
+        resume_session(handler, resume_token)
         return
-    clients_handlers = list(CLIENTS_HANDLERS)
-    for ch in clients_handlers:
-        msg = None
-        if ch.in_game:
-            msg = f"{c.COLOR_GREEN}You are the winner!{c.COLOR_RESET}"
-            # add the winner to the stats
-            server_stats.add_player_win(winner.name)
-        else:
-            msg = f"The winner is: {winner.name}"
-        ch.send_message(c.GAME_OVER_MESSAGE, msg)
-
-    time.sleep(c.SERVER_POST_GAME_OVER_DISCONNECT_TIMEOUT_SEC)
-
-    for ch in clients_handlers:
-        ch.disconnect()
+    if handler.is_closed():
+        writer.close()
+        print(f"{c.COLOR_RED}{handler.name} disconnected.{c.COLOR_RESET}")
+        return
+    handler.start_reading()
+    await ROOM_MANAGER.join(handler)
 
 
-def listen(server_port: int = 0) -> None:
+async def listen(server_port: int = 0) -> None:
     """
     Listens for incoming connections on the specified server port.
+    Every connection, the offer broadcast and the games of all rooms run as coroutines of a single event loop.
 
     Args:
         server_port (int): The port number to listen on. Defaults to 0, which allows the operating system to assign an available port.
@@ -546,40 +1023,44 @@ def listen(server_port: int = 0) -> None:
     Returns:
         None
     """
-    
-    global SEND_BROADCAST
-    global CLIENTS_HANDLERS
 
-    ip_address = get_ip_address()
-
-    # Create a TCP socket
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server_socket:
-        # Bind the socket to the address and port
-        server_socket.bind((ip_address, server_port))
-        server_port = server_socket.getsockname()[1]
-        server_socket.listen()
+    global ROOM_MANAGER
+
+    ROOM_MANAGER = RoomManager()
+
+    ip_address = offers.get_ip_address()
+
+    # Create a TCP server on all the interfaces, every accepted connection is handled by its own coroutine.
+    # Workers of a supervisor share the port, and the kernel balances the connections between them.
+    server = await asyncio.start_server(handle_new_connection, host=c.SERVER_LISTEN_ADDRESS, port=server_port,
+                                        reuse_port=c.SERVER_REUSE_PORT or None)
+    server_port = server.sockets[0].getsockname()[1]
+
+    async with server:
+        # broadcast invitations whenever a lobby is open, unless a supervisor broadcasts for all its workers
+        broadcast_task = None
+        if c.SERVER_BROADCAST_OFFERS:
+            broadcast_task = asyncio.create_task(offers.broadcast_loop(
+                c.SERVER_NAME, server_port, ROOM_MANAGER.lobby_open, server_metrics, ROOM_MANAGER.offer_status,
+                ROOM_MANAGER.lobby_opened))
+        print(f"Server started, listening on IP address {ip_address} port {server_port}")
+        # a single task expires the clients that stopped sending heartbeats
+        heartbeat_task = asyncio.create_task(heartbeat_wheel.run())
+        # the metrics are rendered only when scraped, off the games' path
+        metrics_server, metrics_address = await metrics.start_metrics_server(
+            lambda: server_metrics.render(server_stats, ROOM_MANAGER))
+        if metrics_server is not None:
+            print(f"Serving metrics on {metrics_address}")
+        try:
+            await ROOM_MANAGER.run()
+        finally:
+            if broadcast_task is not None:
+                broadcast_task.cancel()
+            heartbeat_task.cancel()
+            if metrics_server is not None:
+                metrics_server.close()
 
-        
-        while True:
-            CLIENTS_HANDLERS = []
-            # broadcast invitation
-            broadcast_thread = threading.Thread(target=broadcast_loop,
-                                                args=(ip_address, c.SERVER_NAME, server_port))
-            SEND_BROADCAST = True
-            broadcast_thread.start()
-
-            # Start listening for incoming connections
-            print(f"Server started, listening on IP address {ip_address}")
-            handle_incoming_connections(server_socket=server_socket)
-            SEND_BROADCAST = False
-            broadcast_thread.join()
-
-            send_welcome_message()
-            winner = game_loop()
-            send_game_over_message(winner=winner)
-            server_stats.print_player_wins()
-        
 
 if __name__ == '__main__':
-    # listen on a random port
-    listen(server_port=0)
+    # listen on a random port, unless SERVER_PORT is set
+    asyncio.run(listen(server_port=c.SERVER_PORT))
@@ -0,0 +1,92 @@
+"""
+The rules of a trivia game, without any I/O.
+
+A game asks its players questions round after round. If anybody answered a question correctly, the players who
+did not are disqualified, and if nobody did, the players are asked a new question. The game ends when at most one
+player is left in the game, who is the winner.
+
+The engine does not know how questions reach the players. A player is any object with a `name`, an `in_game` flag,
+the `answer` of the current round and a `disqualify()` method: the ClientHandler of a connected client for the
+server, or an in-memory bot for the simulation (see simulation.py).
+"""
+import collections
+import random
+
+import question_bank
+
+# the players who answered correctly and the ones who did not, both empty if the round was not judged
+RoundVerdict = collections.namedtuple('RoundVerdict', ['correct', 'incorrect'])
+
+
+class GameEngine:
+    def __init__(self, players: list, bank: question_bank.QuestionBank, rng: random.Random = random):
+        """
+        Args:
+            players (list): The players of the game, who may leave it at any time by clearing their in_game flag.
+            bank (QuestionBank): The questions of the game.
+            rng (random.Random): Chooses the questions, seed it for a deterministic game.
+        """
+        self.players: list = players
+        self.bank: question_bank.QuestionBank = bank
+        self.sampler: question_bank.QuestionSampler = bank.sampler(rng)
+        self.round_num: int = 0
+
+    def in_game_players(self) -> list:
+        """
+        Returns:
+            list: The players who are still in the game.
+        """
+        return [player for player in self.players if player.in_game]
+
+    def is_over(self) -> bool:
+        return len(self.in_game_players()) <= 1
+
+    def start_round(self) -> int:
+        """
+        Returns:
+            int: The number of the new round, starting from 1.
+        """
+        self.round_num += 1
+        return self.round_num
+
+    def next_question(self) -> tuple[int, str, bool]:
+        """
+        Returns:
+            tuple[int, str, bool]: The id, text and answer of a question that was not asked in this game yet.
+        """
+        question_id = self.sampler.draw()
+        question, answer = self.bank.get(question_id)
+        return question_id, question, answer
+
+    def judge(self, answer: bool) -> RoundVerdict:
+        """
+        Judges the answers of the players still in the game. If at least one of them is correct,
+        the others are disqualified, otherwise nobody is and the next round asks a new question.
+        A round left with a single player (the others disconnected) is not judged.
+
+        Args:
+            answer (bool): The correct answer of the round's question.
+
+        Returns:
+            RoundVerdict: The correct and incorrect players, no correct player means the question is asked again.
+        """
+        players = self.in_game_players()
+        if len(players) <= 1:
+            return RoundVerdict([], [])
+        correct = [player for player in players if player.answer == answer]
+        incorrect = [player for player in players if player.answer != answer]
+        if correct:
+            for player in correct:
+                player.correct = True
+            for player in incorrect:
+                player.correct = False
+                player.disqualify()
+        return RoundVerdict(correct, incorrect)
+
+    def winner(self):
+        """
+        Returns:
+            The last player in the game, or None if nobody is left.
+        """
+        players = self.in_game_players()
+        return players[0] if players else None
@@ -0,0 +1,174 @@
+"""
+Estimates how long games last and how often every bot tier wins, by playing batches of games as NumPy arrays.
+
+It plays the same rules as engine.py, but instead of one game at a time it plays a whole batch: a row per game and a
+column per player. Every round draws the answers of all the players of all the games at once, correct with the
+accuracy of their BOT_LEVELS tier. In the games where somebody was correct, the incorrect players are masked out.
+In the other games nobody is, and they play another round. A game ends when one player is left.
+
+The duration of a game comes from the configured waits of the server: the lobby timeout (unless the lobby filled
+up), ROUND_PAUSE_SEC and the answer time of every round, and the wait before disconnecting the players at the end.
+Bots answer at once, so the answer time defaults to 0. Use --answer-sec to model slower players.
+
+Requires numpy (pip install numpy). For a per-game trace of the same rules, see simulation.py.
+
+Usage:
+    python estimator.py --games 1000000 --levels a b c d --seed 0
+"""
+import argparse
+import json
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    # the estimator is optional, the server does not need numpy
+    np = None
+
+import constants as c
+
+# the games still running after this many rounds (bots that are never correct) are counted as unfinished
+MAX_ROUNDS = 10000
+BATCH_SIZE = 200000  # games per batch, bounds the memory to a few arrays of BATCH_SIZE x players
+PERCENTILES = (50, 90, 95, 99)
+
+
+def play_batch(accuracies: "np.ndarray", rng: "np.random.Generator") -> tuple["np.ndarray", "np.ndarray", int]:
+    """
+    Plays a batch of games to the end.
+
+    Args:
+        accuracies (np.ndarray): games x players, the probability of every player to answer correctly.
+        rng (np.random.Generator): Draws the answers.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray, int]: The rounds of every game, the seat of its winner (-1 if the game did
+        not end within MAX_ROUNDS rounds) and the number of rounds in which nobody was correct.
+    """
+    num_games, num_players = accuracies.shape
+    in_game = np.ones((num_games, num_players), dtype=bool)
+    rounds = np.zeros(num_games, dtype=np.int64)
+    repeated_rounds = 0
+
+    # only the games still running are played, so the work shrinks with every round
+    running = np.arange(num_games)
+    for _ in range(MAX_ROUNDS):
+        if running.size == 0:
+            break
+        rounds[running] += 1
+        correct = (rng.random((running.size, num_players)) < accuracies[running]) & in_game[running]
+        anybody_correct = correct.any(axis=1)
+        repeated_rounds += int(running.size - np.count_nonzero(anybody_correct))
+        # nobody correct: nobody is disqualified and the game asks a new question
+        judged = running[anybody_correct]
+        in_game[judged] = correct[anybody_correct]
+        running = running[in_game[running].sum(axis=1) > 1]
+
+    winners = np.where(in_game.sum(axis=1) == 1, in_game.argmax(axis=1), -1)
+    return rounds, winners, repeated_rounds
+
+
+def game_durations(rounds: "np.ndarray", num_players: int, answer_sec: float) -> "np.ndarray":
+    """
+    Returns:
+        np.ndarray: The seconds from the minimum number of players joining to the players being disconnected.
+    """
+    lobby_sec = 0 if num_players >= c.MAX_TEAMS else c.CLIENT_NO_JOIN_TIMEOUT_SEC
+    game_over_sec = 0 if c.SERVER_PERSISTENT_SESSIONS else c.SERVER_POST_GAME_OVER_DISCONNECT_TIMEOUT_SEC
+    return lobby_sec + rounds * (c.ROUND_PAUSE_SEC + answer_sec) + game_over_sec
+
+
+def distribution(values: "np.ndarray") -> dict:
+    summary = {'mean': float(values.mean()), 'max': float(values.max())}
+    for percent, value in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+        summary[f'p{percent}'] = float(value)
+    return summary
+
+
+def estimate(levels: list[str], num_games: int, seed: int = None, answer_sec: float = 0) -> dict:
+    """
+    Plays num_games games of the given players.
+
+    Args:
+        levels (list[str]): The BOT_LEVELS tier of every player of a game, or 'mix' for a random tier per game.
+        num_games (int): The number of games to play.
+        seed (int): The seed of the games, None for a random one.
+        answer_sec (float): The time the players take to answer a question.
+
+    Returns:
+        dict: The distributions of the rounds and duration of a game, and the win rate of every tier.
+    """
+    rng = np.random.default_rng(seed)
+    tiers = list(c.BOT_LEVELS)
+    tier_accuracies = np.array([c.BOT_LEVELS[tier] for tier in tiers])
+    num_players = len(levels)
+
+    all_rounds = []
+    repeated_rounds = 0
+    unfinished_games = 0
+    players = np.zeros(len(tiers), dtype=np.int64)
+    wins = np.zeros(len(tiers), dtype=np.int64)
+    for start in range(0, num_games, BATCH_SIZE):
+        batch_size = min(BATCH_SIZE, num_games - start)
+        player_tiers = np.empty((batch_size, num_players), dtype=np.int64)
+        for seat, level in enumerate(levels):
+            player_tiers[:, seat] = rng.integers(len(tiers), size=batch_size) if level == 'mix' else tiers.index(level)
+
+        rounds, winners, batch_repeated_rounds = play_batch(tier_accuracies[player_tiers], rng)
+        all_rounds.append(rounds)
+        repeated_rounds += batch_repeated_rounds
+        finished = winners >= 0
+        unfinished_games += int(batch_size - np.count_nonzero(finished))
+        players += np.bincount(player_tiers.ravel(), minlength=len(tiers))
+        wins += np.bincount(player_tiers[finished, winners[finished]], minlength=len(tiers))
+
+    rounds = np.concatenate(all_rounds)
+    return {
+        'games': num_games,
+        'levels': levels,
+        'unfinished_games': unfinished_games,
+        'rounds': distribution(rounds),
+        'rounds_histogram': {int(num_rounds): int(games) for num_rounds, games in enumerate(np.bincount(rounds))
+                             if games},
+        'duration_sec': distribution(game_durations(rounds, num_players, answer_sec)),
+        'repeated_question_rate': repeated_rounds / int(rounds.sum()),
+        'win_rate': {tier: float(wins[index] / players[index]) for index, tier in enumerate(tiers) if players[index]},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Estimate the length of games and the win odds of the bot tiers.')
+    parser.add_argument('--games', type=int, default=1000000)
+    parser.add_argument('--levels', nargs='+', default=list(c.BOT_LEVELS), choices=list(c.BOT_LEVELS) + ['mix'],
+                        help='the tier of every player of a game, "mix" for a random tier')
+    parser.add_argument('--answer-sec', type=float, default=0, help='the time the players take to answer')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', type=str, default=None, help='write the estimate to this JSON file')
+    args = parser.parse_args()
+    if np is None:
+        parser.error('the estimator requires numpy (pip install numpy)')
+    if len(args.levels) < c.MIN_TEAMS:
+        parser.error(f'a game needs at least {c.MIN_TEAMS} players')
+
+    start = time.perf_counter()
+    summary = estimate(args.levels, args.games, args.seed, args.answer_sec)
+    summary['elapsed_sec'] = time.perf_counter() - start
+
+    rounds, duration = summary['rounds'], summary['duration_sec']
+    print(f"{c.COLOR_CYAN}{args.games} games of {' '.join(args.levels)} in {summary['elapsed_sec']:.1f}s{c.COLOR_RESET}")
+    print(f"rounds per game: mean={rounds['mean']:.2f} p50={rounds['p50']:.0f} p95={rounds['p95']:.0f} "
+          f"p99={rounds['p99']:.0f} max={rounds['max']:.0f}, nobody correct in "
+          f"{summary['repeated_question_rate'] * 100:.1f}% of the rounds")
+    print(f"game duration: mean={duration['mean']:.1f}s p50={duration['p50']:.1f}s p95={duration['p95']:.1f}s "
+          f"p99={duration['p99']:.1f}s")
+    for level, win_rate in summary['win_rate'].items():
+        print(f"tier {level} (accuracy {c.BOT_LEVELS[level]}): wins {win_rate * 100:.1f}% of its games")
+    if summary['unfinished_games']:
+        print(f"{c.COLOR_RED}{summary['unfinished_games']} games did not end within {MAX_ROUNDS} rounds{c.COLOR_RESET}")
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(summary, file, indent=4)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+import asyncio
+import collections
+import socket
+
+import constants as c
+import protocol
+
+
+class OutboundQueue:
+    """
+    Bounded queue of encoded messages waiting to be written to a single client.
+
+    Buffers are queued as is, so a broadcast message encoded once is shared by the queues of all players.
+    Flushing hands the queued buffers to the transport, which writes them with non-blocking sends and
+    keeps what the socket did not accept. The backlog of a client is what is still queued plus what the
+    transport could not send yet, and a client whose backlog exceeds the limit is reported as slow.
+
+    Messages are coalesced with flush_soon: everything queued before the current callback of the event loop
+    yields is written at once. A phase of a round (e.g. the verdict of a round with the start of the next one,
+    or the question) reaches a client with a single write instead of a write per message.
+    """
+    def __init__(self, writer: asyncio.StreamWriter, max_backlog_bytes: int = c.SERVER_MAX_CLIENT_BACKLOG_BYTES):
+        self.writer: asyncio.StreamWriter = writer
+        self.max_backlog_bytes: int = max_backlog_bytes
+        self.buffers: collections.deque = collections.deque()
+        self.queued_bytes: int = 0
+        self.flush_handle: asyncio.Handle = None  # the flush scheduled by flush_soon
+
+    def backlog(self) -> int:
+        """
+        Returns:
+            int: The number of bytes waiting to be sent to the client.
+        """
+        return self.queued_bytes + self.writer.transport.get_write_buffer_size()
+
+    def put(self, data: bytes) -> bool:
+        """
+        Queues an encoded message, unless the client's backlog is already too large.
+
+        Args:
+            data (bytes): The encoded message.
+
+        Returns:
+            bool: True if the message was queued, False if the client is too slow and the message was dropped.
+        """
+        if self.backlog() + len(data) > self.max_backlog_bytes:
+            return False
+        self.buffers.append(data)
+        self.queued_bytes += len(data)
+        return True
+
+    def flush_soon(self, flush) -> None:
+        """
+        Schedules a flush once the current callback of the event loop finished, unless one is already scheduled.
+
+        Args:
+            flush (Callable[[], None]): Flushes the queue, e.g. ClientHandler.flush_outbound.
+        """
+        if self.flush_handle is None:
+            self.flush_handle = asyncio.get_running_loop().call_soon(self.run_flush, flush)
+
+    def run_flush(self, flush) -> None:
+        self.flush_handle = None
+        flush()
+
+    def flush(self) -> bool:
+        """
+        Writes all queued messages to the transport at once, as a single gathered write. Never blocks.
+        A flush scheduled by flush_soon is no longer needed.
+
+        Returns:
+            bool: True if messages were written, False if the queue was empty.
+        """
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        if not self.buffers:
+            return False
+        buffers = self.buffers
+        self.buffers = collections.deque()
+        self.queued_bytes = 0
+        self.writer.writelines(buffers)
+        return True
+
+
+def configure_nodelay(sock: socket.socket) -> None:
+    """
+    Disables Nagle's algorithm on a client connection. asyncio already does it for TCP transports, but the
+    coalesced writes depend on it: a phase must leave at once, not wait for the client to acknowledge
+    the previous one (which it may delay).
+
+    Args:
+        sock (socket.socket): The socket of the connection.
+    """
+    if sock is None or sock.family not in (socket.AF_INET, socket.AF_INET6):
+        return
+    try:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    except OSError:
+        pass
+
+
+def broadcast(handlers: list, message_type: str, message: str) -> None:
+    """
+    Sends the same message to many clients, encoding it only once per protocol.
+
+    Args:
+        handlers (list[ClientHandler]): The clients to send the message to.
+        message_type (str): The type of the message.
+        message (str): The content of the message.
+
+    Returns:
+        None
+    """
+    encoded = {}
+    for ch in list(handlers):
+        data = encoded.get(ch.binary)
+        if data is None:
+            data = encoded[ch.binary] = protocol.encode_message(message_type, message, ch.binary)
+        ch.send_data(data)
+
+
+def broadcast_question(handlers: list, question_id: int, question: str) -> None:
+    """
+    Sends a question to many clients: by id only to the clients that have its text, by id with its text to the
+    other clients that take questions by id, and as a question message to the rest.
+    Every form is encoded only once.
+
+    Args:
+        handlers (list[ClientHandler]): The clients to send the question to.
+        question_id (int): The id of the question.
+        question (str): The text of the question.
+
+    Returns:
+        None
+    """
+    encoded = {}
+    for ch in list(handlers):
+        known = ch.question_known(question_id)
+        key = (ch.binary, known)
+        data = encoded.get(key)
+        if data is None:
+            if known is None:
+                data = protocol.encode_message(c.QUESTION_MESSAGE, question, ch.binary)
+            else:
+                data = protocol.encode_question_id(question_id, None if known else question)
+            encoded[key] = data
+        ch.send_data(data)
@@ -0,0 +1,84 @@
+import constants as c
+
+SUB_BUCKET_BITS = 4
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+
+
+def bucket_index(value: int) -> int:
+    """
+    Maps a value to its bucket: values below SUB_BUCKETS have a bucket each, and every power of two
+    above is split into SUB_BUCKETS equal buckets, so a bucket is at most 1/SUB_BUCKETS of its values wide.
+    """
+    if value < SUB_BUCKETS:
+        return value
+    shift = value.bit_length() - SUB_BUCKET_BITS - 1
+    return ((shift + 1) << SUB_BUCKET_BITS) + (value >> shift) - SUB_BUCKETS
+
+
+def bucket_upper_bound(index: int) -> int:
+    """
+    Returns:
+        int: The largest value of the bucket.
+    """
+    if index < SUB_BUCKETS:
+        return index
+    shift = (index >> SUB_BUCKET_BITS) - 1
+    top = (index & (SUB_BUCKETS - 1)) + SUB_BUCKETS
+    return ((top + 1) << shift) - 1
+
+
+class LatencyHistogram:
+    """
+    Fixed-memory histogram of durations with logarithmic buckets, in the style of HDR histograms.
+
+    Durations are recorded in microseconds, up to LATENCY_HISTOGRAM_MAX_SEC, with a relative error of
+    at most 1/16. Recording is O(1) and the memory of a histogram does not grow with the number of samples.
+    """
+    MAX_VALUE = int(c.LATENCY_HISTOGRAM_MAX_SEC * 1_000_000)
+    NUM_BUCKETS = bucket_index(MAX_VALUE) + 1
+
+    def __init__(self):
+        self.counts: list[int] = [0] * self.NUM_BUCKETS
+        self.count: int = 0
+        self.total: int = 0
+        self.max: int = 0
+
+    def record(self, seconds: float) -> None:
+        """
+        Args:
+            seconds (float): The duration to record.
+        """
+        value = min(max(int(seconds * 1_000_000), 0), self.MAX_VALUE)
+        self.counts[bucket_index(value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, percent: float) -> float:
+        """
+        Args:
+            percent (float): The percentile, between 0 and 100.
+
+        Returns:
+            float: The duration in seconds that percent of the samples did not exceed, or None if there are no samples.
+        """
+        if self.count == 0:
+            return None
+        target = max(1, round(self.count * percent / 100))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return min(bucket_upper_bound(index), self.max) / 1_000_000
+        return self.max / 1_000_000
+
+    def percentiles(self, percents=(50, 95, 99)) -> dict:
+        """
+        Returns:
+            dict[float, float]: The duration in seconds of each percentile.
+        """
+        return {percent: self.percentile(percent) for percent in percents}
+
+    def mean(self) -> float:
+        return self.total / self.count / 1_000_000 if self.count else None
@@ -0,0 +1,151 @@
+class FenwickTree:
+    """
+    Prefix sums over positions 1..size, with O(log size) updates and queries.
+    """
+    def __init__(self, size: int):
+        self.size: int = size
+        self.tree: list[int] = [0] * (size + 1)
+
+    def add(self, position: int, delta: int) -> None:
+        while position <= self.size:
+            self.tree[position] += delta
+            position += position & -position
+
+    def prefix_sum(self, position: int) -> int:
+        """
+        Returns:
+            int: The sum of positions 1..position.
+        """
+        total = 0
+        position = min(position, self.size)
+        while position > 0:
+            total += self.tree[position]
+            position -= position & -position
+        return total
+
+    def lower_bound(self, target: int) -> int:
+        """
+        Returns:
+            int: The smallest position whose prefix sum is at least target (target must be positive).
+        """
+        position = 0
+        step = 1 << self.size.bit_length()
+        while step:
+            if position + step <= self.size and self.tree[position + step] < target:
+                position += step
+                target -= self.tree[position]
+            step >>= 1
+        return position + 1
+
+
+class Leaderboard:
+    """
+    Ranking of players by their number of wins, updated incrementally.
+
+    Players are kept in one bucket per number of wins, and a Fenwick tree counts the players in each bucket.
+    A win moves a player to the next bucket in O(log max_wins), and the rank of a player, the top k players
+    or any page of the ranking are found without sorting all the players.
+    Players with the same number of wins share a rank; their order within the ranking is arbitrary.
+    """
+    def __init__(self):
+        self.player_wins: dict[str, int] = {}
+        self.buckets: dict[int, list[str]] = {}
+        self.positions: dict[str, int] = {}  # index of each player in its bucket
+        self.counts: FenwickTree = FenwickTree(16)
+
+    def __len__(self) -> int:
+        return len(self.player_wins)
+
+    def get_wins(self, player_name: str) -> int:
+        return self.player_wins.get(player_name, 0)
+
+    def add_wins(self, player_name: str, wins: int = 1) -> int:
+        """
+        Adds wins to a player, adding the player to the ranking if needed.
+
+        Args:
+            player_name (str): The name of the player.
+            wins (int): The number of wins to add.
+
+        Returns:
+            int: The new number of wins of the player.
+        """
+        old_wins = self.player_wins.get(player_name, 0)
+        if wins <= 0:
+            return old_wins
+        new_wins = old_wins + wins
+        if old_wins:
+            self.remove_from_bucket(player_name, old_wins)
+        if new_wins > self.counts.size:
+            self.grow(new_wins)
+        self.player_wins[player_name] = new_wins
+        bucket = self.buckets.setdefault(new_wins, [])
+        self.positions[player_name] = len(bucket)
+        bucket.append(player_name)
+        self.counts.add(new_wins, 1)
+        return new_wins
+
+    def remove_from_bucket(self, player_name: str, wins: int) -> None:
+        # swap the last player of the bucket into the removed player's slot
+        bucket = self.buckets[wins]
+        index = self.positions[player_name]
+        last = bucket.pop()
+        if last != player_name:
+            bucket[index] = last
+            self.positions[last] = index
+        if not bucket:
+            del self.buckets[wins]
+        self.counts.add(wins, -1)
+
+    def grow(self, min_size: int) -> None:
+        size = self.counts.size
+        while size < min_size:
+            size *= 2
+        self.counts = FenwickTree(size)
+        for wins, bucket in self.buckets.items():
+            self.counts.add(wins, len(bucket))
+
+    def rank(self, player_name: str):
+        """
+        Returns:
+            int: The 1-based rank of the player, or None if the player never won.
+        """
+        wins = self.player_wins.get(player_name)
+        if wins is None:
+            return None
+        return len(self.player_wins) - self.counts.prefix_sum(wins) + 1
+
+    def page(self, offset: int, limit: int) -> list[tuple[str, int]]:
+        """
+        Returns a page of the ranking, from the most wins to the least.
+
+        Args:
+            offset (int): The number of top players to skip.
+            limit (int): The maximum number of players to return.
+
+        Returns:
+            list[tuple[str, int]]: The players of the page and their wins.
+        """
+        total = len(self.player_wins)
+        result = []
+        while limit > 0 and offset < total:
+            # the player at descending position offset is at ascending position total - offset
+            wins = self.counts.lower_bound(total - offset)
+            bucket = self.buckets[wins]
+            start = offset - (total - self.counts.prefix_sum(wins))
+            taken = bucket[start:start + limit]
+            result.extend((player_name, wins) for player_name in taken)
+            offset += len(taken)
+            limit -= len(taken)
+        return result
+
+    def top(self, k: int) -> list[tuple[str, int]]:
+        return self.page(0, k)
+
+    def leader(self):
+        """
+        Returns:
+            str: The player with the most wins, or None if there are no players.
+        """
+        top = self.page(0, 1)
+        return top[0][0] if top else None
@@ -0,0 +1,100 @@
+import asyncio
+import math
+import socket
+
+import constants as c
+
+
+class TimerWheel:
+    """
+    Hashed timing wheel of liveness deadlines, one per connection.
+
+    Time is cut into ticks of tick_sec, with a slot of the wheel per tick up to the timeout. Touching an entry moves
+    it to the slot of its new deadline, and every tick expires the entries of a single slot, so the work per heartbeat
+    and per expired connection is O(1) whatever the number of connections. An entry expires between timeout_sec and
+    timeout_sec + tick_sec after it was last touched.
+    """
+    def __init__(self, timeout_sec: float, tick_sec: float, on_expired):
+        """
+        Args:
+            timeout_sec (float): The time an entry stays alive after it was touched.
+            tick_sec (float): The resolution of the deadlines.
+            on_expired (Callable[[object], None]): Called with every expired entry, which is no longer in the wheel.
+        """
+        self.tick_sec: float = tick_sec
+        self.num_slots: int = math.ceil(timeout_sec / tick_sec) + 2
+        self.slots: list[set] = [set() for _ in range(self.num_slots)]
+        self.entries: dict = {}  # entry -> index of its slot
+        self.ticks: int = 0
+        self.on_expired = on_expired
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def touch(self, entry) -> None:
+        """
+        Adds the entry, or postpones its deadline to timeout_sec from now.
+        """
+        slot = (self.ticks - 1) % self.num_slots
+        old_slot = self.entries.get(entry)
+        if old_slot == slot:
+            return
+        if old_slot is not None:
+            self.slots[old_slot].discard(entry)
+        self.slots[slot].add(entry)
+        self.entries[entry] = slot
+
+    def remove(self, entry) -> None:
+        slot = self.entries.pop(entry, None)
+        if slot is not None:
+            self.slots[slot].discard(entry)
+
+    def tick(self) -> None:
+        """
+        Advances the wheel by one tick and expires the entries whose deadline passed.
+        """
+        self.ticks += 1
+        index = self.ticks % self.num_slots
+        expired = self.slots[index]
+        self.slots[index] = set()
+        for entry in expired:
+            del self.entries[entry]
+        for entry in expired:
+            self.on_expired(entry)
+
+    async def run(self) -> None:
+        """
+        Ticks the wheel every tick_sec until cancelled, without drifting.
+        """
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
+        while True:
+            next_tick += self.tick_sec
+            await asyncio.sleep(max(next_tick - loop.time(), 0))
+            self.tick()
+
+
+def configure_keepalive(sock: socket.socket) -> None:
+    """
+    Enables TCP keepalive on a client connection, so the kernel drops a dead peer after about
+    SERVER_TCP_KEEPALIVE_IDLE_SEC + SERVER_TCP_KEEPALIVE_INTERVAL_SEC * SERVER_TCP_KEEPALIVE_COUNT seconds
+    of silence, even if the client does not send heartbeats. The tuning is skipped where the options are missing.
+
+    Args:
+        sock (socket.socket): The socket of the connection.
+    """
+    if sock is None:
+        return
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        if hasattr(socket, 'TCP_KEEPIDLE'):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, c.SERVER_TCP_KEEPALIVE_IDLE_SEC)
+        elif hasattr(socket, 'TCP_KEEPALIVE'):
+            # the name of TCP_KEEPIDLE on macOS
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPALIVE, c.SERVER_TCP_KEEPALIVE_IDLE_SEC)
+        if hasattr(socket, 'TCP_KEEPINTVL'):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, c.SERVER_TCP_KEEPALIVE_INTERVAL_SEC)
+        if hasattr(socket, 'TCP_KEEPCNT'):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, c.SERVER_TCP_KEEPALIVE_COUNT)
+    except OSError:
+        pass
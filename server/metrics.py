@@ -0,0 +1,148 @@
+import asyncio
+import threading
+import weakref
+
+import constants as c
+from latency import LatencyHistogram, bucket_upper_bound
+
+# upper bounds in seconds of the exported histogram buckets
+HISTOGRAM_BOUNDS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class Metrics:
+    """
+    Counters of a running server, exported in the Prometheus text format.
+
+    The counters are plain integers updated by the coroutines of the event loop, so updating them
+    takes no lock. Everything else (queue depths, threads, histograms) is read only when the metrics
+    are scraped, so the games pay nothing for the metrics endpoint.
+    """
+    def __init__(self):
+        self.handlers: weakref.WeakSet = weakref.WeakSet()  # every ClientHandler, live or not
+        self.connections: int = 0
+        self.games_started: int = 0
+        self.games_finished: int = 0
+        self.rounds: int = 0
+        self.broadcast_packets: int = 0
+        self.slow_clients: int = 0
+        self.resumed_sessions: int = 0
+        self.heartbeat_timeouts: int = 0
+        self.socket_writes: int = 0
+
+    def render(self, server_stats, room_manager) -> str:
+        """
+        Args:
+            server_stats (Statistic): The stats of the server, for the latency histograms.
+            room_manager (RoomManager): The rooms of the server.
+
+        Returns:
+            str: The metrics in the Prometheus text exposition format.
+        """
+        live_handlers = [handler for handler in list(self.handlers) if not handler.is_closed()]
+        backlogs = [handler.outbound.backlog() for handler in live_handlers]
+        lobby_players = len(room_manager.lobby.clients_handlers) if room_manager and room_manager.lobby else 0
+        lines = []
+        metric(lines, 'triviaking_connected_handlers', 'gauge', 'Open client connections.', len(live_handlers))
+        metric(lines, 'triviaking_connections_total', 'counter', 'Accepted client connections.', self.connections)
+        metric(lines, 'triviaking_lobby_players', 'gauge', 'Players waiting in the open lobby.', lobby_players)
+        metric(lines, 'triviaking_active_games', 'gauge', 'Games being played.',
+               len(room_manager.running_rooms) if room_manager else 0)
+        metric(lines, 'triviaking_games_started_total', 'counter', 'Games started.', self.games_started)
+        metric(lines, 'triviaking_games_finished_total', 'counter', 'Games finished.', self.games_finished)
+        metric(lines, 'triviaking_rounds_total', 'counter', 'Rounds played, rate() gives rounds per second.',
+               self.rounds)
+        metric(lines, 'triviaking_broadcast_packets_total', 'counter', 'UDP offer packets sent.',
+               self.broadcast_packets)
+        metric(lines, 'triviaking_slow_clients_total', 'counter', 'Clients dropped for a too large send backlog.',
+               self.slow_clients)
+        metric(lines, 'triviaking_resumed_sessions_total', 'counter', 'Sessions resumed on a new connection.',
+               self.resumed_sessions)
+        metric(lines, 'triviaking_heartbeat_timeouts_total', 'counter', 'Clients dropped for missing heartbeats.',
+               self.heartbeat_timeouts)
+        metric(lines, 'triviaking_socket_writes_total', 'counter',
+               'Writes to client sockets, the messages of a round phase are coalesced into one write per client.',
+               self.socket_writes)
+        metric(lines, 'triviaking_send_queue_bytes_total', 'gauge', 'Bytes waiting to be sent to all clients.',
+               sum(backlogs))
+        metric(lines, 'triviaking_send_queue_bytes_max', 'gauge', 'Largest send backlog of a single client.',
+               max(backlogs, default=0))
+        metric(lines, 'triviaking_threads', 'gauge', 'Threads of the server process.', threading.active_count())
+        histogram(lines, 'triviaking_answer_latency_seconds', 'Time from sending a question to receiving an answer.',
+                  server_stats.answer_latency)
+        histogram(lines, 'triviaking_verdict_wait_seconds', 'Time from receiving an answer to the verdict of its round.',
+                  server_stats.verdict_wait)
+        histogram(lines, 'triviaking_stats_journal_write_seconds', 'Time to append a win to the stats journal.',
+                  server_stats.journal_write_latency)
+        histogram(lines, 'triviaking_stats_snapshot_write_seconds', 'Time to write a stats snapshot.',
+                  server_stats.snapshot_write_latency)
+        return '\n'.join(lines) + '\n'
+
+
+def metric(lines: list, name: str, metric_type: str, help_text: str, value) -> None:
+    lines.append(f'# HELP {name} {help_text}')
+    lines.append(f'# TYPE {name} {metric_type}')
+    lines.append(f'{name} {value}')
+
+
+def histogram(lines: list, name: str, help_text: str, latency: LatencyHistogram) -> None:
+    lines.append(f'# HELP {name} {help_text}')
+    lines.append(f'# TYPE {name} histogram')
+    # the log buckets are summed into the fixed bounds they fit under
+    counts = list(latency.counts)
+    index = 0
+    cumulative = 0
+    for bound in HISTOGRAM_BOUNDS:
+        while index < len(counts) and bucket_upper_bound(index) <= bound * 1_000_000:
+            cumulative += counts[index]
+            index += 1
+        lines.append(f'{name}_bucket{{le="{bound}"}} {cumulative}')
+    lines.append(f'{name}_bucket{{le="+Inf"}} {latency.count}')
+    lines.append(f'{name}_sum {latency.total / 1_000_000}')
+    lines.append(f'{name}_count {latency.count}')
+
+
+async def serve_metrics(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, render) -> None:
+    """
+    Answers a single HTTP request with the rendered metrics, whatever the requested path.
+
+    Args:
+        reader (asyncio.StreamReader): The stream of the request.
+        writer (asyncio.StreamWriter): The stream of the response.
+        render (Callable[[], str]): Renders the metrics.
+    """
+    try:
+        # skip the request line and headers
+        while (await reader.readline()).strip():
+            pass
+        body = render().encode()
+        writer.write(b'HTTP/1.0 200 OK\r\n'
+                     b'Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n'
+                     + f'Content-Length: {len(body)}\r\n\r\n'.encode() + body)
+        await writer.drain()
+    except (ConnectionError, OSError):
+        pass
+    finally:
+        writer.close()
+
+
+async def start_metrics_server(render):
+    """
+    Starts the metrics endpoint on SERVER_METRICS_UNIX_SOCKET if set, otherwise on localhost SERVER_METRICS_PORT
+    (0 for any free port). A negative port disables the endpoint.
+
+    Args:
+        render (Callable[[], str]): Renders the metrics.
+
+    Returns:
+        tuple[asyncio.Server, str]: The server and its address, or (None, None) if disabled.
+    """
+    def handle(reader, writer):
+        return serve_metrics(reader, writer, render)
+
+    if c.SERVER_METRICS_UNIX_SOCKET:
+        server = await asyncio.start_unix_server(handle, path=c.SERVER_METRICS_UNIX_SOCKET)
+        return server, f'unix:{c.SERVER_METRICS_UNIX_SOCKET}'
+    if c.SERVER_METRICS_PORT < 0:
+        return None, None
+    server = await asyncio.start_server(handle, host='127.0.0.1', port=c.SERVER_METRICS_PORT)
+    return server, f'http://127.0.0.1:{server.sockets[0].getsockname()[1]}/metrics'
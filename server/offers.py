@@ -0,0 +1,235 @@
+import asyncio
+import collections
+import socket
+import struct
+import sys
+
+import constants as c
+
+try:
+    import fcntl
+except ImportError:
+    # on Windows
+    fcntl = None
+
+# ioctl requests of Linux, the other systems number them differently
+SIOCGIFFLAGS = 0x8913
+SIOCGIFADDR = 0x8915
+SIOCGIFNETMASK = 0x891b
+IFF_UP = 0x1
+IFF_BROADCAST = 0x2
+IFF_LOOPBACK = 0x8
+
+Interface = collections.namedtuple('Interface', ['name', 'address', 'broadcast_address', 'loopback'])
+
+
+def interface_ioctl(sock: socket.socket, request: int, name: str) -> bytes:
+    # struct ifreq: a 16 bytes name followed by a union, padded generously
+    return fcntl.ioctl(sock.fileno(), request, struct.pack('256s', name.encode()[:15]))
+
+
+def get_interfaces() -> list:
+    """
+    Lists the IPv4 interfaces of the current machine that are up, without sending anything to the network.
+    On Linux the interfaces are read with ioctls, with their subnet broadcast addresses. Elsewhere the addresses
+    the host name resolves to are used, and offers go to the limited broadcast address.
+
+    Returns:
+        list[Interface]: The interfaces, the ones that are not loopback first.
+    """
+    interfaces = []
+    if fcntl is not None and sys.platform.startswith('linux'):
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            for _, name in socket.if_nameindex():
+                try:
+                    flags = struct.unpack_from('H', interface_ioctl(sock, SIOCGIFFLAGS, name), 16)[0]
+                    address = interface_ioctl(sock, SIOCGIFADDR, name)[20:24]
+                    netmask = interface_ioctl(sock, SIOCGIFNETMASK, name)[20:24]
+                except OSError:
+                    # no IPv4 address
+                    continue
+                if not flags & IFF_UP:
+                    continue
+                broadcast_address = None
+                if flags & IFF_BROADCAST:
+                    broadcast_address = socket.inet_ntoa(bytes(a | (~m & 0xFF) for a, m in zip(address, netmask)))
+                interfaces.append(Interface(name, socket.inet_ntoa(address), broadcast_address,
+                                            bool(flags & IFF_LOOPBACK)))
+    else:
+        try:
+            addresses = {info[4][0] for info in socket.getaddrinfo(socket.gethostname(), None, socket.AF_INET)}
+        except socket.gaierror:
+            addresses = set()
+        for address in sorted(addresses):
+            loopback = address.startswith('127.')
+            interfaces.append(Interface(address, address, None if loopback else c.BROADCAST_ADDRESS, loopback))
+    if not interfaces:
+        interfaces.append(Interface('lo', '127.0.0.1', None, True))
+    return sorted(interfaces, key=lambda interface: interface.loopback)
+
+
+def get_ip_address() -> str:
+    """
+    Get the IP address of the current machine.
+
+    Returns:
+        str: The address of the first interface that is not loopback, or the loopback address if there is none.
+    """
+    return get_interfaces()[0].address
+
+
+def create_broadcast_packet(server_name: str, server_port: int, status: tuple = None) -> bytes:
+    """
+    Creates a broadcast packet for the TriviaKing server.
+
+    Args:
+        server_name (str): The name of the server.
+        server_port (int): The port number of the server.
+        status (tuple): If given, the offer extension is appended: (lobby state, lobby players, lobby capacity,
+            running games, max games), see OFFER_EXTENSION_FORMAT.
+
+    Returns:
+        bytes: The constructed UDP packet.
+    """
+
+    # Constructing the message with the specified format
+    magic_cookie = struct.pack('>I', c.BROADCAST_MAGIC_COOKIE)
+    message_type = struct.pack('B', c.BROADCAST_MESSAGE_TYPE)
+    # Encoding the server name to Unicode and padding it to 32 characters
+    encoded_server_name = server_name.encode(
+        'utf-16le').ljust(64, b'\x00')[:32]
+    # Converting the server port to bytes (big-endian)
+    server_port_bytes = struct.pack('>H', server_port)
+
+    # Constructing the UDP packet
+    udp_packet = b''.join(
+        [magic_cookie, message_type, encoded_server_name, server_port_bytes])
+    if status is not None:
+        udp_packet += struct.pack(c.OFFER_EXTENSION_FORMAT, c.OFFER_EXTENSION_VERSION,
+                                  *(min(value, 0xFFFF) for value in status))
+    return udp_packet
+
+
+def is_probe(data: bytes) -> bool:
+    """
+    Returns:
+        bool: True if the datagram is a client asking for a fresh offer.
+    """
+    return data[:5] == struct.pack('>IB', c.BROADCAST_MAGIC_COOKIE, c.BROADCAST_PROBE_TYPE)
+
+
+def answer_probes(sock: socket.socket, server_name: str, server_port: int, get_status) -> None:
+    """
+    Answers every pending probe with an extended offer, sent straight back to the client.
+    """
+    while True:
+        try:
+            data, address = sock.recvfrom(64)
+        except (BlockingIOError, OSError):
+            return
+        if is_probe(data):
+            status = get_status() if get_status is not None else None
+            try:
+                sock.sendto(create_broadcast_packet(server_name, server_port, status), address)
+            except (BlockingIOError, OSError):
+                pass
+
+
+def offer_periods():
+    """
+    Yields the delays between the offers of an open lobby: a burst of SERVER_OFFER_BURST_COUNT offers as soon as
+    it opens, then SERVER_BROADCAST_PERIOD_SEC doubling after every offer up to SERVER_OFFER_MAX_PERIOD_SEC.
+    The clients looking for a server hear of a new lobby at once, and a lobby nobody joins costs little traffic.
+    """
+    for _ in range(c.SERVER_OFFER_BURST_COUNT - 1):
+        yield c.SERVER_OFFER_BURST_INTERVAL_SEC
+    period = c.SERVER_BROADCAST_PERIOD_SEC
+    while True:
+        yield period
+        period = min(period * 2, max(c.SERVER_OFFER_MAX_PERIOD_SEC, c.SERVER_BROADCAST_PERIOD_SEC))
+
+
+def open_offer_socket(interface: Interface) -> socket.socket:
+    """
+    Opens a broadcast socket sending from the address of the interface, so its offers leave through that interface.
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+    sock.setblocking(False)
+    try:
+        sock.bind((interface.address, c.BROADCAST_PORT))
+    except OSError:
+        # the port is taken (by a client on the same host, on mac), any port answers the probes as well
+        sock.bind((interface.address, 0))
+    return sock
+
+
+async def broadcast_loop(server_name: str, server_port: int, lobby_open: asyncio.Event,
+                         server_metrics=None, get_status=None, lobby_opened: asyncio.Event = None) -> None:
+    """
+    Sends offers to the broadcast address of every interface while a lobby is open, until cancelled.
+    Nothing is sent while no room accepts players. Probes of clients are answered with an extended offer at any time.
+
+    Args:
+        server_name (str): The name of the server.
+        server_port (int): The port number of the server.
+        lobby_open (asyncio.Event): Set while a room accepts new players.
+        server_metrics (Metrics): Counts the sent packets, if given.
+        get_status (Callable[[], tuple]): Returns the status of the offer extension, if the server knows it.
+        lobby_opened (asyncio.Event): Set whenever a new lobby opens, to send a burst of offers for it.
+            Without it, offers are sent every SERVER_BROADCAST_PERIOD_SEC.
+
+    Returns:
+        None
+    """
+
+    # Creating the UDP packet
+    udp_packet = create_broadcast_packet(server_name=server_name,
+                                         server_port=server_port)
+
+    interfaces = [interface for interface in get_interfaces() if interface.broadcast_address is not None]
+    print(f"Server sending offers to {', '.join(interface.broadcast_address for interface in interfaces) or 'nobody'}...")
+
+    loop = asyncio.get_running_loop()
+    sockets = []
+    try:
+        for interface in interfaces:
+            sock = open_offer_socket(interface)
+            sockets.append(sock)
+            try:
+                loop.add_reader(sock, answer_probes, sock, server_name, server_port, get_status)
+            except NotImplementedError:
+                # the proactor event loop of Windows, probes stay unanswered
+                pass
+        while True:
+            await lobby_open.wait()
+            if lobby_opened is not None:
+                lobby_opened.clear()
+                periods = offer_periods()
+            while lobby_open.is_set():
+                if c.SERVER_EXTENDED_OFFERS and get_status is not None:
+                    udp_packet = create_broadcast_packet(server_name, server_port, get_status())
+                for sock, interface in zip(sockets, interfaces):
+                    try:
+                        sock.sendto(udp_packet, (interface.broadcast_address, c.BROADCAST_PORT))
+                        if server_metrics is not None:
+                            server_metrics.broadcast_packets += 1
+                    except (BlockingIOError, OSError):
+                        # the offer is sent again in the next period
+                        pass
+                if lobby_opened is None:
+                    await asyncio.sleep(c.SERVER_BROADCAST_PERIOD_SEC)
+                    continue
+                try:
+                    # a new lobby restarts the burst
+                    await asyncio.wait_for(lobby_opened.wait(), next(periods))
+                    break
+                except asyncio.TimeoutError:
+                    pass
+    finally:
+        for sock in sockets:
+            try:
+                loop.remove_reader(sock)
+            except NotImplementedError:
+                pass
+            sock.close()
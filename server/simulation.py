@@ -0,0 +1,169 @@
+"""
+Plays games with the rules of the server (engine.py) against in-memory bots, without sockets and sleeps.
+
+Every bot answers at once, correctly with the probability of its BOT_LEVELS tier. Games are deterministic for a
+given seed, so two runs with the same arguments give the same results. Use it to balance BOT_LEVELS and the number
+of rounds of a game.
+
+Usage:
+    python simulation.py --games 1000000 --levels a b c d --seed 0
+"""
+import argparse
+import collections
+import json
+import random
+import time
+
+import constants as c
+import engine
+import question_bank
+
+# a game of bots that are never correct would never end
+MAX_ROUNDS = 10000
+
+
+class SimulatedBot:
+    """
+    An in-memory player, a stand-in for the ClientHandler of a connected bot.
+    """
+    __slots__ = ('name', 'level', 'accuracy', 'in_game', 'answer', 'correct')
+
+    def __init__(self, name: str, level: str):
+        self.name: str = name
+        self.level: str = level
+        self.accuracy: float = c.BOT_LEVELS[level]
+        self.in_game: bool = True
+        self.answer: bool = None
+        self.correct: bool = None
+
+    def disqualify(self) -> None:
+        self.in_game = False
+
+
+class Simulation:
+    def __init__(self, levels: list[str], bank: question_bank.QuestionBank, seed: int = None):
+        """
+        Args:
+            levels (list[str]): The BOT_LEVELS tier of every player of a game, or 'mix' for a random tier per game.
+            bank (QuestionBank): The questions of the games.
+            seed (int): The seed of the games, None for a random one.
+        """
+        self.levels: list[str] = levels
+        self.bank: question_bank.QuestionBank = bank
+        self.rng: random.Random = random.Random(seed)
+        self.games: int = 0
+        self.unfinished_games: int = 0
+        self.rounds: collections.Counter = collections.Counter()  # rounds of a game -> games
+        self.repeated_questions: int = 0  # rounds in which nobody was correct
+        self.players: collections.Counter = collections.Counter()  # tier -> players
+        self.wins: collections.Counter = collections.Counter()  # tier -> wins
+
+    def play_game(self) -> SimulatedBot:
+        """
+        Plays a single game.
+
+        Returns:
+            SimulatedBot: The winner, or None if the game did not end within MAX_ROUNDS rounds.
+        """
+        rng = self.rng
+        tiers = list(c.BOT_LEVELS)
+        players = [SimulatedBot(f'BOT_#{seat}', rng.choice(tiers) if level == 'mix' else level)
+                   for seat, level in enumerate(self.levels)]
+        game = engine.GameEngine(players, self.bank, rng)
+        while not game.is_over() and game.round_num < MAX_ROUNDS:
+            game.start_round()
+            _, _, answer = game.next_question()
+            for player in game.in_game_players():
+                player.answer = answer if rng.random() < player.accuracy else not answer
+            if not game.judge(answer).correct:
+                self.repeated_questions += 1
+
+        winner = game.winner() if game.is_over() else None
+        self.games += 1
+        self.rounds[game.round_num] += 1
+        for player in players:
+            self.players[player.level] += 1
+        if winner is None:
+            self.unfinished_games += 1
+        else:
+            self.wins[winner.level] += 1
+        return winner
+
+    def run(self, games: int) -> None:
+        for _ in range(games):
+            self.play_game()
+
+    def summary(self) -> dict:
+        """
+        Returns:
+            dict: The distribution of the rounds per game and the win rate of every tier.
+        """
+        total_rounds = sum(rounds * games for rounds, games in self.rounds.items())
+        return {
+            'games': self.games,
+            'unfinished_games': self.unfinished_games,
+            'rounds': {
+                'mean': total_rounds / self.games if self.games else None,
+                'p50': rounds_percentile(self.rounds, 50),
+                'p95': rounds_percentile(self.rounds, 95),
+                'p99': rounds_percentile(self.rounds, 99),
+                'max': max(self.rounds, default=None),
+                'histogram': dict(sorted(self.rounds.items())),
+            },
+            'repeated_question_rate': self.repeated_questions / total_rounds if total_rounds else None,
+            'win_rate': {level: self.wins[level] / self.players[level] for level in sorted(self.players)},
+        }
+
+
+def rounds_percentile(rounds: collections.Counter, percent: float) -> int:
+    """
+    Returns:
+        int: The number of rounds that percent of the games did not exceed.
+    """
+    games = sum(rounds.values())
+    if games == 0:
+        return None
+    target = max(1, round(games * percent / 100))
+    seen = 0
+    for num_rounds in sorted(rounds):
+        seen += rounds[num_rounds]
+        if seen >= target:
+            return num_rounds
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulate games of bots with the rules of the server.')
+    parser.add_argument('--games', type=int, default=100000)
+    parser.add_argument('--levels', nargs='+', default=list(c.BOT_LEVELS), choices=list(c.BOT_LEVELS) + ['mix'],
+                        help='the tier of every player of a game, "mix" for a random tier')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', type=str, default=None, help='write the summary to this JSON file')
+    args = parser.parse_args()
+    if len(args.levels) < c.MIN_TEAMS:
+        parser.error(f'a game needs at least {c.MIN_TEAMS} players')
+
+    simulation = Simulation(args.levels, question_bank.load_question_bank(c.QUESTION_BANK_PATH), args.seed)
+    start = time.perf_counter()
+    simulation.run(args.games)
+    elapsed = time.perf_counter() - start
+    summary = simulation.summary()
+    summary['elapsed_sec'] = elapsed
+    summary['games_per_min'] = args.games / elapsed * 60
+
+    rounds = summary['rounds']
+    print(f"{c.COLOR_CYAN}{args.games} games of {' '.join(args.levels)} in {elapsed:.1f}s "
+          f"({summary['games_per_min']:.0f} games/min){c.COLOR_RESET}")
+    print(f"rounds per game: mean={rounds['mean']:.2f} p50={rounds['p50']} p95={rounds['p95']} "
+          f"p99={rounds['p99']} max={rounds['max']}, nobody correct in "
+          f"{summary['repeated_question_rate'] * 100:.1f}% of the rounds")
+    for level, win_rate in summary['win_rate'].items():
+        print(f"tier {level} (accuracy {c.BOT_LEVELS[level]}): wins {win_rate * 100:.1f}% of its games")
+    if summary['unfinished_games']:
+        print(f"{c.COLOR_RED}{summary['unfinished_games']} games did not end within {MAX_ROUNDS} rounds{c.COLOR_RESET}")
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(summary, file, indent=4)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,28 +1,92 @@
 import json
+import os
+import threading
+import time
+
 import constants as c
+import stats_shards
+from latency import LatencyHistogram
+from leaderboard import Leaderboard
+from win_journal import WinJournal
 
 class Statistic:
-    def __init__(self):
-        self.player_wins = {}
+    def __init__(self, writable=True):
+        # merged view of the wins of all the server processes sharing the stats files
+        self.leaderboard = Leaderboard()
+        self.player_wins = self.leaderboard.player_wins
         self.total_games = 0
-        try:
-            with open(c.FILE_PATH_WINS, 'r') as file:
-                self.player_wins = json.load(file)
-                self.total_games = sum(self.player_wins.values())
-        except FileNotFoundError:
-            self.player_wins = {}
-            self.total_games = 0
-
         self.frequency_of_answers = {}
 
+        # answer latencies (question sent -> answer received), server-wide, per player and per question id,
+        # and the wait from an answer to the verdict of its round
+        self.answer_latency = LatencyHistogram()
+        self.player_answer_latency = {}
+        self.question_answer_latency = {}
+        self.verdict_wait = LatencyHistogram()
+        # time spent writing the stats files
+        self.journal_write_latency = LatencyHistogram()
+        self.snapshot_write_latency = LatencyHistogram()
+        # question id -> [times asked to a player, correct answers]
+        self.question_results = {}
+
+        self.shard_readers = {}
+        self.last_merge = 0
+        if not writable:
+            # a read-only view of all the shards, like the one of a supervisor
+            self.shard_id = None
+            self.merge_shards()
+            return
+
+        # every server process writes its own shard, and reads the shards of the others
+        self.shard_id, self.shard_lock = stats_shards.claim_shard()
+        self.snapshot_path, journal_path = stats_shards.shard_paths(self.shard_id)
+
+        # recovery: this shard's snapshot plus the wins journaled after it, including a journal
+        # left by an interrupted compaction
+        own_shard = stats_shards.ShardReader(self.shard_id)
+        self.merge_updates(own_shard.read_updates())
+        self.shard_wins = own_shard.player_wins
+        self.last_seq = own_shard.last_seq
+        self.journal = WinJournal(journal_path, next_seq=self.last_seq + 1)
+        self.wins_since_snapshot = self.last_seq - own_shard.snapshot_seq
+        self.compaction_thread = None
+        if self.wins_since_snapshot:
+            self.update_file()
+
+        self.merge_shards()
+
+    def merge_updates(self, updates):
+        for player_name, wins in updates.items():
+            self.total_games += wins
+            self.leaderboard.add_wins(player_name, wins)
+
+    def merge_shards(self, force=True):
+        """
+        Adds the wins recorded by the other server processes since the last merge.
+        Unless forced, merges at most every STATS_MERGE_INTERVAL_SEC.
+        """
+        now = time.monotonic()
+        if not force and now - self.last_merge < c.STATS_MERGE_INTERVAL_SEC:
+            return
+        self.last_merge = now
+        shard_id = 0
+        while shard_id == self.shard_id or stats_shards.shard_exists(shard_id):
+            if shard_id != self.shard_id and shard_id not in self.shard_readers:
+                self.shard_readers[shard_id] = stats_shards.ShardReader(shard_id)
+            shard_id += 1
+        for reader in self.shard_readers.values():
+            self.merge_updates(reader.read_updates())
+
     def add_player_win(self, player_name):
         self.increment_total_games()
-        if player_name in self.player_wins:
-            self.player_wins[player_name] += 1
-        else:
-            self.player_wins[player_name] = 1
-        
-        self.update_file()
+        self.leaderboard.add_wins(player_name)
+        self.shard_wins[player_name] = self.shard_wins.get(player_name, 0) + 1
+        start = time.perf_counter()
+        self.last_seq = self.journal.append(player_name)
+        self.journal_write_latency.record(time.perf_counter() - start)
+        self.wins_since_snapshot += 1
+        if self.wins_since_snapshot >= c.STATS_COMPACT_EVERY_WINS:
+            self.compact_in_background()
 
     def add_answer_frequency(self, answer):
         if answer in self.frequency_of_answers:
@@ -30,36 +94,115 @@ class Statistic:
         else:
             self.frequency_of_answers[answer] = 1
 
+    def add_answer(self, player_name, question_id, correct, answer_latency=None, verdict_wait=None):
+        results = self.question_results.setdefault(question_id, [0, 0])
+        results[0] += 1
+        if correct:
+            results[1] += 1
+        if answer_latency is None:
+            # the player did not answer
+            return
+        self.answer_latency.record(answer_latency)
+        if player_name not in self.player_answer_latency:
+            self.player_answer_latency[player_name] = LatencyHistogram()
+        self.player_answer_latency[player_name].record(answer_latency)
+        if question_id not in self.question_answer_latency:
+            self.question_answer_latency[question_id] = LatencyHistogram()
+        self.question_answer_latency[question_id].record(answer_latency)
+        if verdict_wait is not None:
+            self.verdict_wait.record(verdict_wait)
+
+    def get_answer_latency(self, player_name=None, question_id=None):
+        if player_name is not None:
+            histogram = self.player_answer_latency.get(player_name)
+        elif question_id is not None:
+            histogram = self.question_answer_latency.get(question_id)
+        else:
+            histogram = self.answer_latency
+        return histogram.percentiles() if histogram else None
+
+    def get_question_correct_rate(self, question_id):
+        asked, correct = self.question_results.get(question_id, (0, 0))
+        return correct / asked if asked else None
+
+    def print_latency_summary(self):
+        if not self.answer_latency.count:
+            return
+        answer = self.answer_latency.percentiles()
+        verdict = self.verdict_wait.percentiles()
+        print(f"{c.COLOR_CYAN}Answer latency p50/p95/p99: "
+              f"{answer[50] * 1000:.1f}/{answer[95] * 1000:.1f}/{answer[99] * 1000:.1f} ms, "
+              f"wait for verdict p50/p95/p99: "
+              f"{verdict[50] * 1000:.1f}/{verdict[95] * 1000:.1f}/{verdict[99] * 1000:.1f} ms "
+              f"({self.answer_latency.count} answers){c.COLOR_RESET}")
+
     def increment_total_games(self):
         self.total_games += 1
 
     def get_player_wins(self, player_name : str):
-        return self.player_wins.get(player_name, 0)
+        self.merge_shards(force=False)
+        return self.leaderboard.get_wins(player_name)
+
+    def get_player_rank(self, player_name : str):
+        self.merge_shards(force=False)
+        return self.leaderboard.rank(player_name)
+
+    def get_leaderboard_page(self, page : int, page_size : int = c.STATS_PODIUM_PAGE_SIZE):
+        self.merge_shards(force=False)
+        return self.leaderboard.page(page * page_size, page_size)
 
     def get_answer_frequency(self, answer):
         return self.frequency_of_answers.get(answer, 0)
 
     def get_total_games(self):
+        self.merge_shards(force=False)
         return self.total_games
 
     def get_leader(self):
-        if not self.player_wins:
-            return None
-        return max(self.player_wins, key=self.player_wins.get)
+        self.merge_shards(force=False)
+        return self.leaderboard.leader()
     
     def print_player_wins(self):
-        sorted_players = sorted(self.player_wins.items(), key=lambda x: x[1], reverse=True)
+        self.merge_shards(force=False)
+        top_players = self.leaderboard.top(c.STATS_PODIUM_PAGE_SIZE)
         # Ensure there are three players (fill with "Empty" if fewer than three)
-        while len(sorted_players) < 3:
-            sorted_players.append(("-", 0))
+        podium = top_players[:3]
+        while len(podium) < 3:
+            podium.append(("-", 0))
             
-        top_3 = [f"{player}" for player, _ in sorted_players[:3]]
+        top_3 = [f"{player}" for player, _ in podium]
         
-        full_res = '\n'.join([f"{player}: {wins}" for player, wins in sorted_players])
+        full_res = '\n'.join([f"{player}: {wins}" for player, wins in top_players])
+        if len(self.leaderboard) > len(top_players):
+            full_res += f"\n... and {len(self.leaderboard) - len(top_players)} more players"
         print(c.PODIUM_STR.format(top_3[0], top_3[1], top_3[2], full_res))
 
 
+    def compact_in_background(self):
+        if self.compaction_thread is not None and self.compaction_thread.is_alive():
+            return
+        self.journal.rotate()
+        snapshot = {'last_seq': self.last_seq, 'player_wins': dict(self.shard_wins)}
+        self.wins_since_snapshot = 0
+        self.compaction_thread = threading.Thread(target=self.write_snapshot, args=(snapshot,), daemon=True)
+        self.compaction_thread.start()
+
+    def write_snapshot(self, snapshot):
+        start = time.perf_counter()
+        temp_path = self.snapshot_path + '.tmp'
+        with open(temp_path, 'w') as file:
+            json.dump(snapshot, file, indent=4)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, self.snapshot_path)
+        self.journal.finish_compaction()
+        self.snapshot_write_latency.record(time.perf_counter() - start)
+
     def update_file(self):
-        with open(c.FILE_PATH_WINS, 'w') as file:
-            json.dump(self.player_wins, file, indent=4)
-            
\ No newline at end of file
+        if self.compaction_thread is not None:
+            self.compaction_thread.join()
+        self.write_snapshot({'last_seq': self.last_seq, 'player_wins': dict(self.shard_wins)})
+        # every journaled win is in the snapshot now, so the journal can start over
+        self.journal.rotate()
+        self.journal.finish_compaction()
+        self.wins_since_snapshot = 0
@@ -0,0 +1,140 @@
+import json
+import os
+try:
+    import fcntl
+except ImportError:
+    # on Windows: a single server process writes shard 0
+    fcntl = None
+
+import constants as c
+
+
+def shard_paths(shard_id: int) -> tuple[str, str]:
+    """
+    Shard 0 uses FILE_PATH_WINS and FILE_PATH_WINS_JOURNAL themselves, so a single server keeps its old files.
+    Shard n uses the same names with '.n' before the extension.
+
+    Returns:
+        tuple[str, str]: The snapshot and journal paths of the shard.
+    """
+    if shard_id == 0:
+        return c.FILE_PATH_WINS, c.FILE_PATH_WINS_JOURNAL
+    paths = []
+    for path in (c.FILE_PATH_WINS, c.FILE_PATH_WINS_JOURNAL):
+        base, extension = os.path.splitext(path)
+        paths.append(f'{base}.{shard_id}{extension}')
+    return paths[0], paths[1]
+
+
+def shard_exists(shard_id: int) -> bool:
+    snapshot_path, journal_path = shard_paths(shard_id)
+    return any(os.path.exists(path) for path in (snapshot_path, journal_path, journal_path + '.lock'))
+
+
+def claim_shard():
+    """
+    Takes ownership of the lowest shard no running server process owns, by locking its lock file.
+    The lock is held as long as the returned file is open, and is released by the OS if the process dies.
+
+    Returns:
+        tuple[int, file]: The id of the shard and its open lock file.
+    """
+    if fcntl is None:
+        return 0, None
+    shard_id = 0
+    while True:
+        lock_file = open(shard_paths(shard_id)[1] + '.lock', 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return shard_id, lock_file
+        except OSError:
+            lock_file.close()
+            shard_id += 1
+
+
+class ShardReader:
+    """
+    Follows the wins of one shard, written by another server process (or by this one, before it started).
+
+    The wins of a shard only grow, so the state of a shard is a grow-only counter per player:
+    merging a snapshot takes the maximum of each counter, and journal lines are applied once by their
+    sequence number. Reading a shard again only reads what was appended since the last read, and a
+    journal rotated by a compaction is detected by its inode.
+    """
+    def __init__(self, shard_id: int):
+        self.shard_id: int = shard_id
+        self.snapshot_path, self.journal_path = shard_paths(shard_id)
+        self.player_wins: dict[str, int] = {}
+        self.snapshot_seq: int = 0
+        self.last_seq: int = 0
+        self.snapshot_mtime = None
+        self.journal_inode = None
+        self.journal_offset: int = 0
+
+    def read_updates(self) -> dict[str, int]:
+        """
+        Reads the wins recorded in the shard since the last call.
+
+        Returns:
+            dict[str, int]: The number of new wins of each player.
+        """
+        updates = {}
+        self.read_snapshot(updates)
+        try:
+            inode = os.stat(self.journal_path).st_ino
+        except FileNotFoundError:
+            inode = None
+        if inode is None or inode != self.journal_inode:
+            # the journal was rotated (or a compaction was interrupted before a new journal was created),
+            # wins appended before the rotation may still be in the compacting file, and come first
+            self.read_journal(self.journal_path + '.compacting', 0, updates)
+            self.journal_inode = inode
+            self.journal_offset = 0
+        if inode is None:
+            return updates
+        self.journal_offset = self.read_journal(self.journal_path, self.journal_offset, updates)
+        return updates
+
+    def read_snapshot(self, updates: dict) -> None:
+        try:
+            mtime = os.stat(self.snapshot_path).st_mtime_ns
+            if mtime == self.snapshot_mtime:
+                return
+            with open(self.snapshot_path, 'r') as file:
+                snapshot = json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+        self.snapshot_mtime = mtime
+        seq = 0
+        if 'player_wins' in snapshot:
+            seq = snapshot['last_seq']
+            snapshot = snapshot['player_wins']
+        # otherwise the snapshot was written before the journal existed: a plain {player: wins} dict
+        for player_name, wins in snapshot.items():
+            old_wins = self.player_wins.get(player_name, 0)
+            if wins > old_wins:
+                self.player_wins[player_name] = wins
+                updates[player_name] = updates.get(player_name, 0) + wins - old_wins
+        self.snapshot_seq = max(self.snapshot_seq, seq)
+        self.last_seq = max(self.last_seq, seq)
+
+    def read_journal(self, path: str, offset: int, updates: dict) -> int:
+        try:
+            with open(path, 'rb') as file:
+                file.seek(offset)
+                data = file.read()
+        except FileNotFoundError:
+            return offset
+        # a line without its newline is still being appended, read it next time
+        end = data.rfind(b'\n') + 1
+        for line in data[:end].splitlines():
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record['seq'] > self.last_seq:
+                self.last_seq = record['seq']
+                player_name = record['player']
+                self.player_wins[player_name] = self.player_wins.get(player_name, 0) + 1
+                updates[player_name] = updates.get(player_name, 0) + 1
+        return offset + end
@@ -0,0 +1,135 @@
+"""
+Runs several game server processes on one port, to use more than one core.
+
+The supervisor reserves a TCP port, then starts N workers (server/app.py) that all listen on it with
+SO_REUSEPORT, so the kernel spreads the incoming connections between them. Every worker runs its own
+lobbies and games and writes its own stats shard. The supervisor itself:
+    - sends the UDP offers for all the workers
+    - restarts workers that exit
+    - periodically prints the podium merged from the stats of all the workers
+
+Usage:
+    python supervisor.py --workers 4
+"""
+import argparse
+import asyncio
+import os
+import signal
+import socket
+import sys
+
+import constants as c
+import offers
+import statistic as stats
+
+WORKER_APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py')
+
+
+def reserve_port(port: int = 0) -> socket.socket:
+    """
+    Binds a socket that shares its port with the workers, so the port stays reserved between worker restarts.
+    The socket never listens, so the kernel does not hand it any connection.
+
+    Returns:
+        socket.socket: The bound socket.
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((c.SERVER_LISTEN_ADDRESS, port))
+    return sock
+
+
+class Supervisor:
+    def __init__(self, num_workers: int, server_port: int):
+        self.num_workers: int = num_workers
+        self.server_port: int = server_port
+        self.workers: dict[int, asyncio.subprocess.Process] = {}
+        self.restarts: int = 0
+
+    def worker_env(self) -> dict:
+        env = dict(os.environ)
+        env['TRIVIAKING_SERVER_PORT'] = str(self.server_port)
+        env['TRIVIAKING_SERVER_REUSE_PORT'] = '1'
+        env['TRIVIAKING_SERVER_BROADCAST_OFFERS'] = '0'
+        return env
+
+    async def run_worker(self, index: int) -> None:
+        """
+        Runs a worker, and starts it again whenever it exits.
+
+        Args:
+            index (int): The number of the worker.
+        """
+        while True:
+            process = await asyncio.create_subprocess_exec(sys.executable, WORKER_APP, env=self.worker_env())
+            self.workers[index] = process
+            print(f"{c.COLOR_GREEN}Worker {index} started (pid {process.pid}){c.COLOR_RESET}")
+            try:
+                return_code = await process.wait()
+            except asyncio.CancelledError:
+                if process.returncode is None:
+                    process.terminate()
+                raise
+            self.restarts += 1
+            print(f"{c.COLOR_RED}Worker {index} exited with code {return_code}, "
+                  f"restarting in {c.SUPERVISOR_RESTART_DELAY_SEC} seconds{c.COLOR_RESET}")
+            await asyncio.sleep(c.SUPERVISOR_RESTART_DELAY_SEC)
+
+    async def stats_loop(self) -> None:
+        """
+        Prints the podium of all the workers whenever games were played since the last print.
+        """
+        merged_stats = stats.Statistic(writable=False)
+        printed_games = merged_stats.get_total_games()
+        while True:
+            await asyncio.sleep(c.SUPERVISOR_STATS_PERIOD_SEC)
+            merged_stats.merge_shards()
+            if merged_stats.get_total_games() != printed_games:
+                printed_games = merged_stats.get_total_games()
+                print(f"{c.COLOR_CYAN}{printed_games} games played by {self.num_workers} workers "
+                      f"({self.restarts} restarts){c.COLOR_RESET}")
+                merged_stats.print_player_wins()
+
+    async def run(self) -> None:
+        lobby_open = asyncio.Event()
+        # every worker keeps a lobby open, except while it runs SERVER_MAX_ROOMS games
+        lobby_open.set()
+        tasks = [asyncio.create_task(self.run_worker(index)) for index in range(self.num_workers)]
+        tasks.append(asyncio.create_task(offers.broadcast_loop(c.SERVER_NAME, self.server_port, lobby_open)))
+        tasks.append(asyncio.create_task(self.stats_loop()))
+        all_tasks = asyncio.gather(*tasks)
+        # stop the workers along with the supervisor
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, all_tasks.cancel)
+        try:
+            await all_tasks
+        except asyncio.CancelledError:
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+            for process in self.workers.values():
+                if process.returncode is None:
+                    process.terminate()
+            await asyncio.gather(*(process.wait() for process in self.workers.values()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run several TriviaKing server processes on one port.')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='number of server processes')
+    parser.add_argument('--port', type=int, default=c.SERVER_PORT, help='TCP port, 0 for any free port')
+    args = parser.parse_args()
+
+    ip_address = offers.get_ip_address()
+    port_reservation = reserve_port(args.port)
+    server_port = port_reservation.getsockname()[1]
+    print(f"Supervisor started with {args.workers} workers, listening on IP address {ip_address} port {server_port}")
+    try:
+        asyncio.run(Supervisor(args.workers, server_port).run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        port_reservation.close()
+
+
+if __name__ == '__main__':
+    main()
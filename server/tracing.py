@@ -0,0 +1,120 @@
+"""
+Opt-in tracing of the game phases and client events, in the Chrome trace-event format.
+
+Set SERVER_TRACE_PATH (or TRIVIAKING_SERVER_TRACE_PATH) to a file and open it in chrome://tracing or
+https://ui.perfetto.dev. Every room and every player gets its own lane. Events are streamed to the file
+as a JSON array, which the viewers accept even if the server was killed before closing it.
+When tracing is off, span() returns a shared no-op context manager and the other functions return at once.
+"""
+import atexit
+import itertools
+import json
+import os
+import time
+
+import constants as c
+
+
+class Tracer:
+    def __init__(self, path: str):
+        self.file = open(path, 'w', encoding='utf-8')
+        self.file.write('[')
+        self.first_event: bool = True
+        self.pid: int = os.getpid()
+        self.lane_ids = itertools.count(1)
+        atexit.register(self.close)
+
+    def event(self, event: dict) -> None:
+        event['pid'] = self.pid
+        self.file.write(('\n' if self.first_event else ',\n') + json.dumps(event))
+        self.first_event = False
+
+    def new_lane(self, name: str) -> int:
+        lane = next(self.lane_ids)
+        self.event({'name': 'thread_name', 'ph': 'M', 'tid': lane, 'args': {'name': name}})
+        return lane
+
+    def flush(self) -> None:
+        self.file.flush()
+
+    def close(self) -> None:
+        if not self.file.closed:
+            self.file.write('\n]\n')
+            self.file.close()
+
+
+def now() -> float:
+    """
+    Returns:
+        float: The trace timestamp in microseconds.
+    """
+    return time.perf_counter() * 1_000_000
+
+
+class Span:
+    __slots__ = ('name', 'lane', 'args', 'start')
+
+    def __init__(self, name: str, lane: int, args: dict):
+        self.name: str = name
+        self.lane: int = lane
+        self.args: dict = args
+
+    def __enter__(self):
+        self.start = now()
+        return self
+
+    def __exit__(self, *exc_info):
+        TRACER.event({'name': self.name, 'ph': 'X', 'ts': self.start, 'dur': now() - self.start,
+                      'tid': self.lane, 'args': self.args})
+
+
+class NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+NULL_SPAN = NullSpan()
+TRACER: Tracer = Tracer(c.SERVER_TRACE_PATH) if c.SERVER_TRACE_PATH else None
+
+
+def span(name: str, lane: int, **args):
+    """
+    Records the duration of a with block as a complete event.
+
+    Args:
+        name (str): The name of the phase.
+        lane (int): The lane of the room or player, from new_lane.
+        args: Details shown with the event.
+    """
+    if TRACER is None:
+        return NULL_SPAN
+    return Span(name, lane, args)
+
+
+def instant(name: str, lane: int, **args) -> None:
+    """
+    Records a single point in time, like an answer or a disconnection.
+    """
+    if TRACER is None:
+        return
+    TRACER.event({'name': name, 'ph': 'i', 's': 't', 'ts': now(), 'tid': lane, 'args': args})
+
+
+def new_lane(name: str) -> int:
+    """
+    Returns:
+        int: A new lane named name, or 0 if tracing is off.
+    """
+    if TRACER is None:
+        return 0
+    return TRACER.new_lane(name)
+
+
+def flush() -> None:
+    if TRACER is not None:
+        TRACER.flush()
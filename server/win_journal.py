@@ -0,0 +1,99 @@
+import json
+import os
+import threading
+import time
+
+import constants as c
+
+
+class WinJournal:
+    """
+    Append-only journal of player wins.
+
+    Every win is appended as one JSON line with an increasing sequence number, so the cost of
+    recording a win does not depend on the number of players. Appends only write to the page cache;
+    a background thread fsyncs the journal at most every fsync_interval_sec seconds, batching all the
+    wins recorded in between.
+
+    The journal is compacted by rotating it to a '.compacting' file, writing a snapshot of all the wins
+    and deleting the rotated file. A snapshot records the last sequence number it includes, so replaying
+    a journal after a crash never counts a win twice.
+    """
+    def __init__(self, path: str, next_seq: int = 1, fsync_interval_sec: float = c.STATS_JOURNAL_FSYNC_INTERVAL_SEC):
+        self.path: str = path
+        self.compacting_path: str = path + '.compacting'
+        self.next_seq: int = next_seq
+        self.fsync_interval_sec: float = fsync_interval_sec
+        self.lock: threading.Lock = threading.Lock()
+        self.file = open(self.path, 'a', encoding='utf-8')
+        if self.file.tell() > 0:
+            # terminate a line torn by a crash, so the next win starts on its own line
+            with open(self.path, 'rb') as journal:
+                journal.seek(-1, os.SEEK_END)
+                if journal.read(1) != b'\n':
+                    self.file.write('\n')
+        self.dirty: bool = False
+        self.flusher: threading.Thread = threading.Thread(target=self.flush_loop, daemon=True)
+        self.flusher.start()
+
+    def append(self, player_name: str) -> int:
+        """
+        Appends a win to the journal, without waiting for it to reach the disk.
+
+        Args:
+            player_name (str): The name of the winner.
+
+        Returns:
+            int: The sequence number of the win.
+        """
+        with self.lock:
+            seq = self.next_seq
+            self.next_seq += 1
+            self.file.write(json.dumps({'seq': seq, 'player': player_name}) + '\n')
+            self.file.flush()
+            self.dirty = True
+        return seq
+
+    def sync(self) -> None:
+        """
+        Forces the appended wins to the disk.
+        """
+        with self.lock:
+            if self.dirty:
+                os.fsync(self.file.fileno())
+                self.dirty = False
+
+    def flush_loop(self) -> None:
+        while True:
+            time.sleep(self.fsync_interval_sec)
+            self.sync()
+
+    def rotate(self) -> None:
+        """
+        Moves the current journal aside for compaction and starts a new, empty one.
+        """
+        with self.lock:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.dirty = False
+            self.file.close()
+            if os.path.exists(self.compacting_path):
+                # a previous compaction did not finish, keep its wins until a snapshot includes them
+                with open(self.path, encoding='utf-8') as journal, \
+                        open(self.compacting_path, 'a', encoding='utf-8') as compacting:
+                    compacting.write(journal.read())
+                    compacting.flush()
+                    os.fsync(compacting.fileno())
+                os.remove(self.path)
+            else:
+                os.replace(self.path, self.compacting_path)
+            self.file = open(self.path, 'a', encoding='utf-8')
+
+    def finish_compaction(self) -> None:
+        """
+        Deletes the rotated journal once a snapshot including all of its wins was written.
+        """
+        try:
+            os.remove(self.compacting_path)
+        except FileNotFoundError:
+            pass